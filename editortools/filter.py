@@ -902,7 +902,9 @@ class FilterOperation(Operation):
         from pymclevel import MCEDIT_DEFS, MCEDIT_IDS
         self.filter.MCEDIT_DEFS = MCEDIT_DEFS
         self.filter.MCEDIT_IDS = MCEDIT_IDS
-        self.filter.perform(self.level, BoundingBox(self.box), self.options)
+        # the sky light is filled in once after the filter, and the level is relit when saved
+        with self.level.deferredLighting(relight=False):
+            self.filter.perform(self.level, BoundingBox(self.box), self.options)
 
         self.canUndo = True
 
@@ -924,8 +926,9 @@ class MacroOperation(Operation):
         if recordUndo:
             self.undoLevel = self.extractUndo(self.level, self._box)
 
-        for o, f in zip(self.options, self.filters):
-            f.perform(self.level, BoundingBox(self._box), o)
+        with self.level.deferredLighting(relight=False):
+            for o, f in zip(self.options, self.filters):
+                f.perform(self.level, BoundingBox(self._box), o)
         self.canUndo = True
 
     def dirtyBox(self):
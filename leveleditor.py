@@ -1424,25 +1424,13 @@ class LevelEditor(GLViewport):
                             return
 
                         if self.level == level:
-                            if isinstance(level, pymclevel.MCInfdevOldLevel):
-                                needsRefresh = [c.chunkPosition for c in level._loadedChunkData.itervalues() if c.dirty]
-                                needsRefresh.extend(level.unsavedWorkFolder.listChunks())
-                            else:
-                                needsRefresh = [c for c in level.allChunks if level.getChunk(*c).dirty]
-                            #xxx change MCInfdevOldLevel to monitor changes since last call
-                            self.invalidateChunks(needsRefresh)
+                            self.invalidateRelitChunks(level)
                 else:
                     if "Canceled" == showProgress("Lighting chunks", level.generateLightsIter(), cancel=True):
                         return
 
                     if self.level == level:
-                        if isinstance(level, pymclevel.MCInfdevOldLevel):
-                            needsRefresh = [c.chunkPosition for c in level._loadedChunkData.itervalues() if c.dirty]
-                            needsRefresh.extend(level.unsavedWorkFolder.listChunks())
-                        else:
-                            needsRefresh = [c for c in level.allChunks if level.getChunk(*c).dirty]
-                        #xxx change MCInfdevOldLevel to monitor changes since last call
-                        self.invalidateChunks(needsRefresh)
+                        self.invalidateRelitChunks(level)
 
             self.freezeStatus("Saving...")
             chunks = self.level.chunkCount
@@ -2339,7 +2327,9 @@ class LevelEditor(GLViewport):
         if hasattr(self.level, 'worldFolder'):
             if hasattr(self.level.worldFolder, 'regionFiles'):
                 worldFolder = self.level.worldFolder
-                regionCount = len(worldFolder.regionFiles)
+                # regionFiles only holds the region files opened so far
+                regionCount = sum(1 for filename in worldFolder.findRegionFiles()
+                                  if worldFolder.regionCoordsFromFilename(filename) is not None)
                 regionCountLabel = Label(_("Number of regions: {0}").format(regionCount))
                 items.append(regionCountLabel)
 
@@ -2790,6 +2780,7 @@ class LevelEditor(GLViewport):
             if newlevel.parentWorld:
                 newlevel = newlevel.parentWorld
             newlevel.acquireSessionLock()
+            newlevel.generateLights()
             newlevel.saveInPlace()
 
             self.loadFile(filename)
@@ -2929,6 +2920,17 @@ class LevelEditor(GLViewport):
     def invalidateChunks(self, c):
         self.renderer.invalidateChunks(c)
 
+    def invalidateRelitChunks(self, level):
+        """ Redraw what changed in the dirty chunks of the level after lighting it. Loaded Anvil chunks know which of
+        their sections changed, so only the affected layers are redrawn. """
+        if isinstance(level, pymclevel.MCInfdevOldLevel):
+            self.renderer.invalidateChunkSections((c.chunkPosition, c.dirtySections)
+                                                  for c in level._loadedChunkData.itervalues() if c.dirty)
+            needsRefresh = list(level.unsavedWorkFolder.listChunks())
+        else:
+            needsRefresh = [c for c in level.allChunks if level.getChunk(*c).dirty]
+        self.invalidateChunks(needsRefresh)
+
     def invalidateAllChunks(self):
         self.renderer.invalidateAllChunks()
 
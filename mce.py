@@ -460,8 +460,7 @@ class mce(object):
         # for input to bincount, create an array of uint16s by
         # shifting the data left and adding the blocks
 
-        for i, cPos in enumerate(self.level.allChunks, 1):
-            ch = self.level.getChunk(*cPos)
+        for i, ch in enumerate(self.level.getChunks(readahead=True), 1):
             btypes = numpy.array(ch.Data.ravel(), dtype='uint16')
             btypes <<= 12
             btypes += ch.Blocks.ravel()
@@ -637,34 +636,20 @@ class mce(object):
     def _region(self, command):
         """
     region [rx rz]
+    region free
+    region compact
 
     List region files in this world.
+
+    With region coordinates, prints the offset table and the free sectors of
+    that region file. "free" prints the free sectors of every region file.
+    "compact" rewrites every region file without free space between chunks and
+    reports the space reclaimed.
     """
         level = self.level
         assert (isinstance(level, mclevel.MCInfdevOldLevel))
         assert level.version
 
-        def getFreeSectors(rf):
-            runs = []
-            start = None
-            count = 0
-            for i, free in enumerate(rf.freeSectors):
-                if free:
-                    if start is None:
-                        start = i
-                        count = 1
-                    else:
-                        count += 1
-                else:
-                    if start is None:
-                        pass
-                    else:
-                        runs.append((start, count))
-                        start = None
-                        count = 0
-
-            return runs
-
         def printFreeSectors(runs):
 
             for i, (start, count) in enumerate(runs):
@@ -674,16 +659,18 @@ class mce(object):
 
             print ""
 
+        print "Scanning region files: %d chunks" % len(level.worldFolder.listChunks())
+        regionFiles = self._openRegionFiles()
+
         if len(command):
             if len(command) > 1:
                 rx, rz = map(int, command[:2])
-                print "Calling allChunks to preload region files: %d chunks" % len(level.allChunks)
-                rf = level.regionFiles.get((rx, rz))
+                rf = regionFiles.get((rx, rz))
                 if rf is None:
                     print "Region {rx},{rz} not found.".format(**locals())
                     return
 
-                print "Region {rx:6}, {rz:6}: {used}/{sectors} sectors".format(used=rf.usedSectors,
+                print "Region {rx:6}, {rz:6}: {used}/{sectors} sectors".format(rx=rx, rz=rz, used=rf.usedSectors,
                                                                                sectors=rf.sectorCount)
                 print "Offset Table:"
                 for cx in range(32):
@@ -696,7 +683,7 @@ class mce(object):
                         print "{sector:>6}+{length:<2} ".format(**locals()),
                     print ""
 
-                runs = getFreeSectors(rf)
+                runs = rf.freeRuns()
                 if len(runs):
                     print "Free sectors:",
 
@@ -704,22 +691,44 @@ class mce(object):
 
             else:
                 if command[0] == "free":
-                    print "Calling allChunks to preload region files: %d chunks" % len(level.allChunks)
-                    for (rx, rz), rf in level.regionFiles.iteritems():
+                    for (rx, rz), rf in regionFiles.iteritems():
 
-                        runs = getFreeSectors(rf)
+                        runs = rf.freeRuns()
                         if len(runs):
                             print "R {0:3}, {1:3}:".format(rx, rz),
                             printFreeSectors(runs)
 
+                elif command[0] == "compact":
+                    self._compactRegions()
+
         else:
-            print "Calling allChunks to preload region files: %d chunks" % len(level.allChunks)
-            coords = (r for r in level.regionFiles)
-            for i, (rx, rz) in enumerate(coords):
-                print "({rx:6}, {rz:6}): {count}, ".format(count=level.regionFiles[rx, rz].chunkCount),
+            for i, (rx, rz) in enumerate(regionFiles):
+                print "({rx:6}, {rz:6}): {count}, ".format(rx=rx, rz=rz, count=regionFiles[rx, rz].chunkCount),
                 if i % 5 == 4:
                     print ""
 
+    def _openRegionFiles(self):
+        """ Open every region file of the world, which listChunks does not do, and return them by region
+        coordinates. """
+        worldFolder = self.level.worldFolder
+        regionFiles = {}
+        for path in worldFolder.findRegionFiles():
+            regionCoords = worldFolder.regionCoordsFromFilename(path)
+            if regionCoords is not None:
+                regionFiles[regionCoords] = worldFolder.getRegionFile(*regionCoords)
+
+        return regionFiles
+
+    def _compactRegions(self):
+        reclaimed = 0
+        for (rx, rz), rf in sorted(self._openRegionFiles().iteritems()):
+            regionReclaimed = rf.compact()
+            if regionReclaimed:
+                print "R {0:3}, {1:3}: reclaimed {2} KiB".format(rx, rz, regionReclaimed / 1024)
+            reclaimed += regionReclaimed
+
+        print "Reclaimed {0} KiB in total.".format(reclaimed / 1024)
+
     def _repair(self, command):
         """
     repair
@@ -731,13 +740,15 @@ class mce(object):
         Deletes chunks whose sectors overlap with another chunk
         Rearranges chunks that are in the wrong slot in the offset table
         Deletes completely unreadable chunks
+    Then compacts the region files to reclaim the space left behind.
 
     Only usable with region-format saves.
     """
         if self.level.version:
-            self.level.preloadRegions()
-            for rf in self.level.regionFiles.itervalues():
+            self.level.worldFolder.listChunks()
+            for rf in self._openRegionFiles().itervalues():
                 rf.repair()
+            self._compactRegions()
 
     def _dumpchests(self, command):
         """
@@ -954,7 +965,7 @@ class mce(object):
         else:
             chunks = self.level.allChunks
 
-        self.level.generateLights(chunks)
+        self.level.generateLights(chunks, engine="parallel")
 
         print "Relit 0 chunks."
         self.needsSave = True
@@ -1262,7 +1273,7 @@ class mce(object):
 
     def _save(self, command):
         if self.needsSave:
-            self.level.generateLights()
+            self.level.generateLights(engine="parallel")
             self.level.saveInPlace()
             self.needsSave = False
 
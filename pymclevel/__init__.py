@@ -3,10 +3,13 @@ MCEDIT_DEFS = {}
 MCEDIT_IDS = {} # Maps the numeric and name ids to entries in MCEDIT_DEFS
 
 
+from block_cursor import BlockCursor
+from block_view import BlockView
 from box import BoundingBox, FloatBox
 from entity import Entity, TileEntity
 from faces import faceDirections, FaceXDecreasing, FaceXIncreasing, FaceYDecreasing, FaceYIncreasing, FaceZDecreasing, \
     FaceZIncreasing, MaxDirections
+from fork import LevelFork
 from indev import MCIndevLevel
 from infiniteworld import ChunkedLevelMixin, AnvilChunk, MCAlphaDimension, MCInfdevOldLevel, ZeroChunk
 import items
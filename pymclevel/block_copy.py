@@ -8,7 +8,7 @@ from box import BoundingBox, Vector
 from mclevelbase import exhaust
 import materials
 from entity import Entity, TileEntity
-from copy import deepcopy
+import readahead
 
 
 def convertBlocks(destLevel, sourceLevel, blocks, blockData):
@@ -31,6 +31,19 @@ def sourceMaskFunc(blocksToCopy):
     return unmaskedSourceMask
 
 
+def copiedPositions(chunk, copied):
+    """ Returns a function telling whether a position, as given by Entity.pos, TileEntity.pos or TileTick.pos, lies
+    in the chunk at a block set in copied, a boolean array indexed like the chunk's Blocks. """
+    ox, oz = chunk.chunkPosition[0] << 4, chunk.chunkPosition[1] << 4
+    width, length, height = copied.shape
+
+    def inCopy(p):
+        x, y, z = p[0] - ox, p[1], p[2] - oz
+        return 0 <= x < width and 0 <= z < length and 0 <= y < height and copied[int(x), int(z), int(y)]
+
+    return inCopy
+
+
 def adjustCopyParameters(destLevel, sourceLevel, sourceBox, destinationPoint):
     log.debug(u"Asked to copy {} blocks \n\tfrom {} in {}\n\tto {} in {}".format(
         sourceBox.volume, sourceBox, sourceLevel, destinationPoint, destLevel))
@@ -60,6 +73,7 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
     startTime = datetime.now()
 
     destBox = BoundingBox(destinationPoint, sourceBox.size)
+    destSectionYs = xrange(max(destBox.miny, 0) >> 4, (min(destBox.maxy, destLevel.Height) + 15) >> 4)
     chunkCount = destBox.chunkCount
     i = 0
     e = 0
@@ -76,12 +90,29 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
     #     Get the slices of the source chunk
     #     Copy blocks and data
 
-    for destCpos in destBox.chunkPositions:
+    def sourceBoxForChunk(cx, cz):
+        destChunkBox = BoundingBox((cx << 4, 0, cz << 4), (16, destLevel.Height, 16)).intersect(destBox)
+        return BoundingBox([d - o for o, d in zip(copyOffset, destChunkBox.origin)], destChunkBox.size)
+
+    # The copies are added to the destination in bulk, so that each chunk's lists are merged once. Chunks of finite
+    # levels are views of the level's lists, so those get everything at the end.
+    newEntities, newTileEntities, newTileTicks = [], [], []
+
+    def addCopies():
+        destLevel.addEntities(newEntities)
+        destLevel.addTileEntities(newTileEntities)
+        destLevel.addTileTicks(newTileTicks)
+        del newEntities[:], newTileEntities[:], newTileTicks[:]
+
+    def prefetch(destCpos):
+        destLevel.prefetchChunk(*destCpos)
+        for srcCpos in sourceBoxForChunk(*destCpos).chunkPositions:
+            sourceLevel.prefetchChunk(*srcCpos)
+
+    for destCpos in readahead.lookahead(destBox.chunkPositions, prefetch, destLevel.readaheadDepth):
         cx, cz = destCpos
 
-        destChunkBox = BoundingBox((cx << 4, 0, cz << 4), (16, destLevel.Height, 16)).intersect(destBox)
-        destChunkBoxInSourceLevel = BoundingBox([d - o for o, d in zip(copyOffset, destChunkBox.origin)],
-                                                destChunkBox.size)
+        destChunkBoxInSourceLevel = sourceBoxForChunk(cx, cz)
 
         if not destLevel.containsChunk(*destCpos):
             if create and any(sourceLevel.containsChunk(*c) for c in destChunkBoxInSourceLevel.chunkPositions):
@@ -91,6 +122,7 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
                 continue
 
         destChunk = destLevel.getChunk(*destCpos)
+        copied = numpy.zeros(destChunk.Blocks.shape, bool)
 
         i += 1
         yield (i, chunkCount)
@@ -101,7 +133,7 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
             if not sourceLevel.containsChunk(*srcCpos):
                 continue
 
-            sourceChunk = sourceLevel.getChunk(*srcCpos)
+            sourceChunk = sourceLevel._getChunkForReading(*srcCpos)
 
             sourceChunkBox, sourceSlices = sourceChunk.getChunkSlicesForBox(destChunkBoxInSourceLevel)
             if sourceChunkBox.volume == 0:
@@ -122,45 +154,49 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
             if convertedSourceData is not None:
                 destChunk.Data[destSlices][mask] = convertedSourceData[mask]
 
-            def copy(p):
-                return p in sourceChunkBoxInDestLevel and (blocksToCopy is None or mask[
-                    p[0] - sourceChunkBoxInDestLevel.minx,
-                    p[2] - sourceChunkBoxInDestLevel.minz,
-                    p[1] - sourceChunkBoxInDestLevel.miny,
-                ])
+            if blocksToCopy is None:
+                copied[destSlices] = True
+            else:
+                copied[destSlices] |= mask
 
             if entities:
-                destChunk.removeEntities(copy)
-
                 ents = sourceChunk.getEntitiesInBox(destChunkBoxInSourceLevel)
                 e += len(ents)
                 for entityTag in ents:
-                    eTag = Entity.copyWithOffset(entityTag, copyOffset, regenerateUUID)
-                    destLevel.addEntity(eTag)
-
-            destChunk.removeTileEntities(copy)
+                    newEntities.append(Entity.copyWithOffset(entityTag, copyOffset, regenerateUUID))
 
             tileEntities = sourceChunk.getTileEntitiesInBox(destChunkBoxInSourceLevel)
             t += len(tileEntities)
             for tileEntityTag in tileEntities:
                 eTag = TileEntity.copyWithOffset(tileEntityTag, copyOffset, staticCommands, moveSpawnerPos, first, cancelCommandBlockOffset)
-                destLevel.addTileEntity(eTag)
-
-            destChunk.removeTileTicks(copy)
+                newTileEntities.append(eTag)
 
             tileTicksList = sourceChunk.getTileTicksInBox(destChunkBoxInSourceLevel)
             tt += len(tileTicksList)
             for tileTick in tileTicksList:
-                eTag = deepcopy(tileTick)
+                eTag = tileTick.copy()
                 eTag['x'].value = tileTick['x'].value + copyOffset[0]
                 eTag['y'].value = tileTick['y'].value + copyOffset[1]
                 eTag['z'].value = tileTick['z'].value + copyOffset[2]
-                destLevel.addTileTick(eTag)
+                newTileTicks.append(eTag)
 
             if biomes and hasattr(destChunk, 'Biomes') and hasattr(sourceChunk, 'Biomes'):
                 destChunk.Biomes[destSlices[:2]] = sourceChunk.Biomes[sourceSlices[:2]]
 
-        destChunk.chunkChanged()
+        # one pass over each of the chunk's lists removes everything under the copied blocks
+        if copied.any():
+            inCopy = copiedPositions(destChunk, copied)
+            if entities:
+                destChunk.removeEntities(inCopy)
+            destChunk.removeTileEntities(inCopy)
+            destChunk.removeTileTicks(inCopy)
+
+        if destLevel.isInfinite:
+            addCopies()
+
+        destChunk.chunkChanged(sectionYs=destSectionYs)
+
+    addCopies()
 
     log.info("Duration: {0}".format(datetime.now() - startTime))
     log.info("Copied {0} entities and {1} tile entities and {2} tile ticks".format(e, t, tt))
@@ -0,0 +1,132 @@
+'''
+Single block access for code that visits blocks one at a time, mostly near each other.
+'''
+import numpy
+
+from mclevelbase import ChunkNotPresent
+
+__all__ = ["BlockCursor", "cursor"]
+
+
+class BlockCursor(object):
+    """ Reads and writes single blocks of a level, remembering the last chunk used so that consecutive blocks in the
+    same chunk do not look it up again.
+
+    Writes go straight into the chunk arrays, but the chunks are only marked dirty in the changed sections and
+    needing lighting, and their surface maps dropped, when flush() is called, once per chunk. Until then the cursor
+    keeps every changed chunk loaded. Use the cursor as a context manager to flush it on exit.
+
+    It has the blockAt, setBlockAt, blockDataAt, setBlockDataAt, blockAndDataAt and setBlockAndDataAt methods of the
+    level, and passes any other attribute through to the level, so it can be given to code that expects a level.
+    """
+
+    def __init__(self, level):
+        self.level = level
+        self._cPos = None
+        self._chunk = None
+        self._changed = {}  # (cx, cz) -> (chunk, change mask)
+        self._finite = not level.isInfinite
+
+    def __getattr__(self, attr):
+        return getattr(self.level, attr)
+
+    def __repr__(self):
+        return "BlockCursor({0!r})".format(self.level)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def _chunkAt(self, x, y, z):
+        """ Returns the chunk holding the block, or None if the block is outside the level or its chunk is missing. """
+        if y < 0 or y >= self.level.Height:
+            return None
+        if self._finite and (x, y, z) not in self.level.bounds:
+            return None
+
+        cPos = (x >> 4, z >> 4)
+        if cPos != self._cPos:
+            try:
+                self._chunk = self.level.getChunk(*cPos)
+            except ChunkNotPresent:
+                self._chunk = None
+            self._cPos = cPos
+        return self._chunk
+
+    def _changeMask(self, chunk):
+        entry = self._changed.get(chunk.chunkPosition)
+        if entry is None or entry[0] is not chunk:
+            entry = self._changed[chunk.chunkPosition] = chunk, numpy.zeros(chunk.Blocks.shape, bool)
+        return entry[1]
+
+    # --- Block accessors ---
+
+    def blockAt(self, x, y, z):
+        chunk = self._chunkAt(x, y, z)
+        if chunk is None:
+            return 0
+        return chunk.Blocks[x & 0xf, z & 0xf, y]
+
+    def blockDataAt(self, x, y, z):
+        chunk = self._chunkAt(x, y, z)
+        if chunk is None:
+            return 0
+        return chunk.Data[x & 0xf, z & 0xf, y]
+
+    def setBlockAt(self, x, y, z, blockID):
+        chunk = self._chunkAt(x, y, z)
+        if chunk is None:
+            return 0
+        chunk.Blocks[x & 0xf, z & 0xf, y] = blockID
+        self._changeMask(chunk)[x & 0xf, z & 0xf, y] = True
+
+    def setBlockDataAt(self, x, y, z, newdata):
+        chunk = self._chunkAt(x, y, z)
+        if chunk is None:
+            return 0
+        chunk.Data[x & 0xf, z & 0xf, y] = newdata
+        self._changeMask(chunk)[x & 0xf, z & 0xf, y] = True
+
+    def blockAndDataAt(self, x, y, z):
+        chunk = self._chunkAt(x, y, z)
+        if chunk is None:
+            return 0, 0
+        return chunk.Blocks[x & 0xf, z & 0xf, y], chunk.Data[x & 0xf, z & 0xf, y]
+
+    def setBlockAndDataAt(self, x, y, z, blockID, blockData):
+        chunk = self._chunkAt(x, y, z)
+        if chunk is None:
+            return 0
+        chunk.Blocks[x & 0xf, z & 0xf, y] = blockID
+        chunk.Data[x & 0xf, z & 0xf, y] = blockData
+        self._changeMask(chunk)[x & 0xf, z & 0xf, y] = True
+
+    # --- Flushing ---
+
+    @property
+    def changedChunks(self):
+        """ Positions of the chunks changed since the last flush. """
+        return self._changed.keys()
+
+    def flush(self):
+        """ Mark each changed chunk dirty and needing lighting, and release the cursor's chunks. Returns a dict
+        mapping the position of each changed chunk to a boolean array, indexed like its Blocks, of the blocks set
+        since the last flush. """
+        masks = {}
+        for cPos, (chunk, mask) in self._changed.iteritems():
+            changedYs = numpy.flatnonzero(mask.any(0).any(0))
+            chunk.markSectionsDirty("blocks", set((changedYs >> 4).tolist()))
+            chunk.needsLighting = True
+            chunk.surfaceMaps.clear()
+            masks[cPos] = mask
+
+        self._changed = {}
+        self._cPos = self._chunk = None
+        return masks
+
+
+def cursor(level):
+    """ Returns a BlockCursor for reading and writing single blocks of this level. Call flush() on it when done. """
+    return BlockCursor(level)
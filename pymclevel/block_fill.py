@@ -7,7 +7,7 @@ import numpy
 
 from mclevelbase import exhaust
 import blockrotation
-from box import BoundingBox
+import nbt
 from entity import TileEntity
 
 
@@ -18,16 +18,25 @@ def blockReplaceTable(blocksToReplace):
     return blocktable
 
 
+def tileEntitiesAt(template, positions):
+    """ Returns a copy of the tile entity template at each of positions, much quicker than calling TileEntity.Create
+    for each. """
+    tags = [t for t in template.value if t.name not in ('x', 'y', 'z')]
+    return [nbt.TAG_Compound([nbt.TAG_Int(x, 'x'), nbt.TAG_Int(y, 'y'), nbt.TAG_Int(z, 'z')] +
+                             [t.copy() for t in tags])
+            for x, y, z in positions]
+
+
 def fillBlocks(level, box, blockInfo, blocksToReplace=(), noData=False):
     return exhaust(level.fillBlocksIter(box, blockInfo, blocksToReplace, noData=noData))
 
 
 def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
     if box is None:
-        chunkIterator = level.getAllChunkSlices()
+        chunkIterator = level.getAllChunkSlices(readahead=True)
         box = level.bounds
     else:
-        chunkIterator = level.getChunkSlices(box)
+        chunkIterator = level.getChunkSlices(box, readahead=True)
 
     log.info("Replacing {0} with {1}".format(blocksToReplace, blockInfo))
 
@@ -52,20 +61,12 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
     tileEntity = None
     if blockInfo.stringID in TileEntity.stringNames.keys():
         tileEntity = TileEntity.stringNames[blockInfo.stringID]
-
-    blocksIdToReplace = [block.ID for block in blocksToReplace]
-
-    blocksList = []
-    if tileEntity and box is not None:
-        for (boxX, boxY, boxZ) in box.positions:
-            if blocktable is None or level.blockAt(boxX, boxY, boxZ) in blocksIdToReplace:
-                tileEntityObject = TileEntity.Create(tileEntity)
-                TileEntity.setpos(tileEntityObject, (boxX, boxY, boxZ))
-                blocksList.append(tileEntityObject)
+        tileEntityTemplate = TileEntity.Create(tileEntity)
 
     i = 0
     skipped = 0
     replaced = 0
+    sectionYs = xrange(max(box.miny, 0) >> 4, (min(box.maxy, level.Height) + 15) >> 4)
 
     for (chunk, slices, point) in chunkIterator:
         i += 1
@@ -107,15 +108,17 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
                 data[:] = blockInfo.blockData
             chunk.removeTileEntitiesInBox(box)
 
-        chunkBounds = chunk.bounds
-        smallBoxSize = (1, 1, 1)
-        tileEntitiesToEdit = [t for t in blocksList if chunkBounds.intersect(BoundingBox(TileEntity.pos(t), smallBoxSize)).volume > 0]
+        if tileEntity:
+            # the blocks just filled, from the same mask, give the tile entity positions
+            if blocktable is None:
+                xs, zs, ys = numpy.indices(blocks.shape).reshape(3, -1)
+            else:
+                xs, zs, ys = numpy.nonzero(mask)
+            origin = numpy.add(box.origin, point)
+            positions = zip(*[(a + o).tolist() for a, o in zip((xs, ys, zs), origin)])
+            chunk.addTileEntities(tileEntitiesAt(tileEntityTemplate, positions))
 
-        for tileEntityObject in tileEntitiesToEdit:
-            chunk.addTileEntity(tileEntityObject)
-            blocksList.remove(tileEntityObject)
-        
-        chunk.chunkChanged(needsLighting)
+        chunk.chunkChanged(needsLighting, sectionYs)
 
     if len(blocksToReplace):
         log.info(u"Replace: Skipped {0} chunks, replaced {1} blocks".format(skipped, replaced))
@@ -0,0 +1,141 @@
+'''
+Numpy working copies of the blocks in a box, for filters that edit a selection block by block.
+'''
+import logging
+
+import numpy
+
+from box import BoundingBox
+from mclevelbase import exhaust
+
+log = logging.getLogger(__name__)
+
+__all__ = ["BlockView", "view"]
+
+
+class BlockView(object):
+    """ A copy of the Blocks and Data of a box in a level, held in two contiguous arrays indexed [x,z,y] relative to
+    the box origin. Edit the arrays, or use the blockAt-style accessors which take level coordinates, then call
+    commit() to write the changed blocks back to the level.
+
+    Only the blocks that differ from the copy taken when the view was made (or last committed) are written, and only
+    the chunks holding them are marked as changed. Parts of the box outside the level's existing chunks read as air
+    and are not written back.
+    """
+
+    def __init__(self, level, box):
+        self.level = level
+        self.box = box = BoundingBox(box.origin, box.size)
+        shape = (box.width, box.length, box.height)
+        self.Blocks = numpy.zeros(shape, 'uint16')
+        self.Data = numpy.zeros(shape, 'uint8')
+
+        for chunk, slices, point in level.getChunkSlices(box, readahead=True):
+            blocks = chunk.Blocks[slices]
+            dest = self._viewSlices(blocks.shape, point)
+            self.Blocks[dest] = blocks
+            self.Data[dest] = chunk.Data[slices]
+
+        self._savedBlocks = self.Blocks.copy()
+        self._savedData = self.Data.copy()
+
+    def __repr__(self):
+        return "BlockView({0!r}, {1!r})".format(self.level, self.box)
+
+    @staticmethod
+    def _viewSlices(shape, point):
+        """ Returns the slices of the view's arrays matching a chunk subslice of the given shape, at the box offset
+        yielded by getChunkSlices. The shape is taken from the sliced chunk array, since chunks at the edge of a
+        finite level are smaller than the slices. """
+        (x, y, z), (w, l, h) = point, shape
+        return slice(x, x + w), slice(z, z + l), slice(y, y + h)
+
+    @property
+    def changedMask(self):
+        """ A boolean array, indexed like Blocks, of the blocks changed since the view was made or last committed. """
+        return (self.Blocks != self._savedBlocks) | (self.Data != self._savedData)
+
+    # --- Block accessors, in level coordinates ---
+
+    def _index(self, x, y, z):
+        box = self.box
+        return x - box.minx, z - box.minz, y - box.miny
+
+    def blockAt(self, x, y, z):
+        if (x, y, z) not in self.box:
+            return 0
+        return self.Blocks[self._index(x, y, z)]
+
+    def setBlockAt(self, x, y, z, blockID):
+        if (x, y, z) not in self.box:
+            return 0
+        self.Blocks[self._index(x, y, z)] = blockID
+
+    def blockDataAt(self, x, y, z):
+        if (x, y, z) not in self.box:
+            return 0
+        return self.Data[self._index(x, y, z)]
+
+    def setBlockDataAt(self, x, y, z, newdata):
+        if (x, y, z) not in self.box:
+            return 0
+        self.Data[self._index(x, y, z)] = newdata
+
+    def blockAndDataAt(self, x, y, z):
+        if (x, y, z) not in self.box:
+            return 0, 0
+        index = self._index(x, y, z)
+        return self.Blocks[index], self.Data[index]
+
+    def setBlockAndDataAt(self, x, y, z, blockID, blockData):
+        if (x, y, z) not in self.box:
+            return 0
+        index = self._index(x, y, z)
+        self.Blocks[index] = blockID
+        self.Data[index] = blockData
+
+    # --- Writing back ---
+
+    def commit(self):
+        """ Write the changed blocks back to the level. Returns the number of blocks written. """
+        return exhaust(self.commitIter())
+
+    def commitIter(self):
+        level = self.level
+        box = self.box
+        changed = self.changedMask
+        written = 0
+
+        # only load the chunks whose part of the box has changes
+        xs, zs = numpy.nonzero(changed.any(axis=2))
+        chunkPositions = set(zip((xs + box.minx >> 4).tolist(), (zs + box.minz >> 4).tolist()))
+
+        chunkSlices = [(cPos, slices, point) for cPos, slices, point in level._getSlices(box)
+                       if cPos in chunkPositions and level.containsChunk(*cPos)]
+        chunkSlices = level.readaheadChunkPositions(chunkSlices, key=lambda item: item[0])
+
+        i = 0
+        for cPos, slices, point in chunkSlices:
+            i += 1
+            yield i, len(chunkPositions)
+
+            chunk = level.getChunk(*cPos)
+            blocks = chunk.Blocks[slices]
+            dest = self._viewSlices(blocks.shape, point)
+            mask = changed[dest]
+            blocks[mask] = self.Blocks[dest][mask]
+            chunk.Data[slices][mask] = self.Data[dest][mask]
+            ys = box.miny + point[1] + numpy.flatnonzero(mask.any(axis=(0, 1)))
+            chunk.chunkChanged(sectionYs=set((ys >> 4).tolist()))
+            written += mask.sum()
+
+        log.info(u"Committed {0} changed blocks in {1} chunks".format(written, i))
+
+        self._savedBlocks[:] = self.Blocks
+        self._savedData[:] = self.Data
+        yield written
+
+
+def view(level, box):
+    """ Returns a BlockView holding a copy of the blocks and data in box. """
+    return BlockView(level, box)
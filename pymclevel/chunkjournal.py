@@ -0,0 +1,203 @@
+'''
+Temporary storage for chunks that were modified and unloaded before the world was saved.
+
+Chunks are appended to a single file as compressed payloads, each behind a small header, and an in-memory index
+points at the latest copy of every chunk. Storing a chunk never allocates sectors or rewrites a table, and the payloads
+are already in the format region files use, so saving the world copies them into the region files without
+recompressing them.
+'''
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from mclevelbase import ChunkNotPresent
+import nbt
+from regionfile import MCRegionFile
+
+log = logging.getLogger(__name__)
+
+__all__ = ["ChunkJournal"]
+
+
+class ChunkJournal(object):
+    """
+    Stands in for an AnvilWorldFolder as a level's unsavedWorkFolder. It supports the folder methods the level uses:
+    listChunks, containsChunk, readChunk, saveChunk, copyChunkFrom, deleteChunk and closeRegions.
+
+    Each record is a header of chunk x, chunk z, compression format and payload length, followed by the payload. Older
+    copies of a chunk stay in the file until the journal is compacted or cleared.
+    """
+    JOURNAL_NAME = "chunks.journal"
+    RECORD_HEADER = struct.Struct(">iiBI")
+
+    compressLevel = 1  # fast deflate; the payloads are written to the region files as they are
+    compactThreshold = 64 << 20  # compact once this many bytes are taken by replaced copies
+
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            os.makedirs(filename)
+
+        elif not os.path.isdir(filename):
+            raise IOError("ChunkJournal: Not a folder: %s" % filename)
+
+        self.filename = filename
+        self.path = os.path.join(filename, self.JOURNAL_NAME)
+        self.lock = threading.RLock()
+        self._index = {}  # (cx, cz) -> (payload offset, payload length, format)
+        self._file = None
+        self._end = 0
+        self._liveBytes = 0
+
+        if os.path.exists(self.path):
+            self._scan()
+
+    def __repr__(self):
+        return "%s(\"%s\")" % (self.__class__.__name__, self.filename)
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = file(self.path, "r+b" if os.path.exists(self.path) else "w+b")
+        return self._file
+
+    def _scan(self):
+        """ Rebuild the index from the records in the file, dropping a record cut short at the end. """
+        f = self.file
+        size = os.path.getsize(self.path)
+        headerSize = self.RECORD_HEADER.size
+        offset = 0
+        while offset + headerSize <= size:
+            f.seek(offset)
+            cx, cz, format, length = self.RECORD_HEADER.unpack(f.read(headerSize))
+            if offset + headerSize + length > size:
+                break
+            self._setIndex((cx, cz), (offset + headerSize, length, format))
+            offset += headerSize + length
+
+        self._end = offset
+        f.truncate(offset)
+
+    def _setIndex(self, cPos, entry):
+        old = self._index.get(cPos)
+        if old is not None:
+            self._liveBytes -= old[1]
+        self._index[cPos] = entry
+        self._liveBytes += entry[1]
+
+    # --- Folder interface ---
+
+    def listChunks(self):
+        with self.lock:
+            return set(self._index)
+
+    def containsChunk(self, cx, cz):
+        return (cx, cz) in self._index
+
+    def getRegionForChunk(self, cx, cz):
+        """ The journal has no region files. It serves reads of all its chunks itself, from any thread. """
+        return self
+
+    def readCompressedChunk(self, cx, cz):
+        """ Returns the compressed payload and its MCRegionFile compression format. """
+        with self.lock:
+            entry = self._index.get((cx, cz))
+            if entry is None:
+                raise ChunkNotPresent((cx, cz))
+
+            offset, length, format = entry
+            f = self.file
+            f.seek(offset)
+            return f.read(length), format
+
+    def readChunk(self, cx, cz):
+        data, format = self.readCompressedChunk(cx, cz)
+        if format == MCRegionFile.VERSION_DEFLATE:
+            return zlib.decompress(data)
+        if format == MCRegionFile.VERSION_GZIP:
+            return nbt.gunzip(data)
+
+        raise IOError("Unknown compress format: {0}".format(format))
+
+    def saveChunk(self, cx, cz, data):
+        self.saveCompressedChunk(cx, cz, zlib.compress(data, self.compressLevel), MCRegionFile.VERSION_DEFLATE)
+
+    def saveCompressedChunk(self, cx, cz, data, format):
+        with self.lock:
+            f = self.file
+            f.seek(self._end)
+            f.write(self.RECORD_HEADER.pack(cx, cz, format, len(data)))
+            f.write(data)
+
+            self._setIndex((cx, cz), (self._end + self.RECORD_HEADER.size, len(data), format))
+            self._end += self.RECORD_HEADER.size + len(data)
+
+            if self._end - self._liveBytes > self.compactThreshold:
+                self.compact()
+
+    def copyChunkFrom(self, worldFolder, cx, cz):
+        """
+        Copy the compressed chunk from worldFolder, which may be another journal. Silently fails if worldFolder does
+        not contain the chunk.
+        """
+        try:
+            if isinstance(worldFolder, ChunkJournal):
+                data, format = worldFolder.readCompressedChunk(cx, cz)
+            else:
+                data, format = worldFolder.getRegionForChunk(cx, cz)._readChunk(cx, cz)
+        except ChunkNotPresent:
+            return
+
+        self.saveCompressedChunk(cx, cz, data, format)
+
+    def deleteChunk(self, cx, cz):
+        with self.lock:
+            entry = self._index.pop((cx, cz), None)
+            if entry is not None:
+                self._liveBytes -= entry[1]
+
+    def closeRegions(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # --- Maintenance ---
+
+    def clear(self):
+        """ Forget every chunk and empty the file. """
+        with self.lock:
+            self._index.clear()
+            self._end = self._liveBytes = 0
+            if os.path.exists(self.path):
+                self.file.truncate(0)
+
+    def compact(self):
+        """ Rewrite the file with only the latest copy of each chunk. """
+        with self.lock:
+            oldSize = self._end
+            tempPath = self.path + ".compact"
+            index = {}
+            end = 0
+            f = self.file
+            with file(tempPath, "wb") as out:
+                for cPos, (offset, length, format) in sorted(self._index.iteritems(), key=lambda item: item[1][0]):
+                    f.seek(offset)
+                    out.write(self.RECORD_HEADER.pack(cPos[0], cPos[1], format, length))
+                    out.write(f.read(length))
+                    index[cPos] = (end + self.RECORD_HEADER.size, length, format)
+                    end += self.RECORD_HEADER.size + length
+
+            self.closeRegions()
+            try:
+                os.rename(tempPath, self.path)
+            except OSError:
+                # Windows will not rename over an existing file
+                os.remove(self.path)
+                os.rename(tempPath, self.path)
+
+            self._index = index
+            self._end = self._liveBytes = end
+
+        log.info(u"Compacted chunk journal {0}, {1} bytes reclaimed".format(self.path, oldSize - end))
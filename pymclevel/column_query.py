@@ -0,0 +1,98 @@
+'''
+Questions about the block columns of a box, answered a chunk at a time with numpy.
+
+Each function visits the chunks of the box once and returns 2D arrays indexed [x,z] relative to the box origin. Only
+the part of each column inside the box is looked at. Columns in missing chunks hold no blocks.
+
+Where a function takes blocks, it may be a single block ID, a materials Block, a sequence of either, or a boolean
+array indexed by block ID. None means every block but air.
+'''
+import numpy
+
+import materials
+
+__all__ = ["blockTable", "topBlocks", "columnContains", "columnCounts", "columnHistogram"]
+
+
+def blockTable(blocks=None):
+    """ Returns a boolean array indexed by block ID that is True for the given blocks. """
+    if isinstance(blocks, numpy.ndarray) and blocks.dtype == bool:
+        return blocks
+
+    table = numpy.zeros(materials.id_limit, bool)
+    if blocks is None:
+        table[1:] = True
+        return table
+
+    if not hasattr(blocks, "__iter__"):
+        blocks = [blocks]
+    table[[getattr(b, "ID", b) for b in blocks]] = True
+    return table
+
+
+def _chunkColumns(level, box):
+    """ Yields the x and z slices of the result arrays, the part of a chunk's Blocks inside box, and the level Y of
+    its first layer. """
+    for chunk, slices, (x, y, z) in level.getChunkSlices(box, readahead=True):
+        blocks = chunk.Blocks[slices]
+        w, l, h = blocks.shape
+        if h == 0:
+            continue
+        yield (slice(x, x + w), slice(z, z + l)), blocks, slices[2].start
+
+
+def topBlocks(level, box, blocks=None):
+    """ Finds the highest of the given blocks in each column. Returns two arrays: the level Y of the block found in
+    each column, or -1 where there is none, and its ID, or 0 where there is none. """
+    table = blockTable(blocks)
+    heights = numpy.empty((box.width, box.length), 'int32')
+    heights[:] = -1
+    ids = numpy.zeros((box.width, box.length), 'uint16')
+
+    for dest, chunkBlocks, miny in _chunkColumns(level, box):
+        matches = table[chunkBlocks]
+        found = matches.any(2)
+        top = matches.shape[2] - 1 - numpy.argmax(matches[..., ::-1], 2)
+
+        x, z = numpy.nonzero(found)
+        y = top[x, z]
+        heights[dest][x, z] = y + miny
+        ids[dest][x, z] = chunkBlocks[x, z, y]
+
+    return heights, ids
+
+
+def columnContains(level, box, blocks):
+    """ Returns a boolean array that is True for the columns holding any of the given blocks. """
+    table = blockTable(blocks)
+    result = numpy.zeros((box.width, box.length), bool)
+    for dest, chunkBlocks, miny in _chunkColumns(level, box):
+        result[dest] = table[chunkBlocks].any(2)
+    return result
+
+
+def columnCounts(level, box, blocks):
+    """ Returns the number of the given blocks in each column. """
+    table = blockTable(blocks)
+    result = numpy.zeros((box.width, box.length), 'uint16')
+    for dest, chunkBlocks, miny in _chunkColumns(level, box):
+        result[dest] = table[chunkBlocks].sum(2)
+    return result
+
+
+def columnHistogram(level, box, blockIDs):
+    """ Counts each of the block IDs in each column. Returns an array indexed [x,z,i] holding the count of
+    blockIDs[i]. """
+    blockIDs = [getattr(b, "ID", b) for b in blockIDs]
+    index = numpy.zeros(materials.id_limit, 'int32')
+    index[:] = len(blockIDs)  # the uncounted blocks go in an extra bin, dropped at the end
+    index[blockIDs] = numpy.arange(len(blockIDs))
+
+    result = numpy.zeros((box.width, box.length, len(blockIDs) + 1), 'uint16')
+    for dest, chunkBlocks, miny in _chunkColumns(level, box):
+        w, l, h = chunkBlocks.shape
+        bins = index[chunkBlocks] + (numpy.arange(w * l) * (len(blockIDs) + 1)).reshape(w, l, 1)
+        counts = numpy.bincount(bins.ravel(), minlength=w * l * (len(blockIDs) + 1))
+        result[dest] = counts.reshape(w, l, len(blockIDs) + 1)
+
+    return result[..., :-1]
@@ -191,7 +191,7 @@ class TileEntity(object):
         # You'll need to use this function twice
         # The first time with first equals to True
         # The second time with first equals to False
-        eTag = deepcopy(tileEntity)
+        eTag = tileEntity.copy()
         eTag['x'] = nbt.TAG_Int(tileEntity['x'].value + copyOffset[0])
         eTag['y'] = nbt.TAG_Int(tileEntity['y'].value + copyOffset[1])
         eTag['z'] = nbt.TAG_Int(tileEntity['z'].value + copyOffset[2])
@@ -631,7 +631,7 @@ class Entity(object):
 
     @classmethod
     def copyWithOffset(cls, entity, copyOffset, regenerateUUID=False):
-        eTag = deepcopy(entity)
+        eTag = entity.copy()
 
         # Need to check the content of the copy to regenerate the possible sub entities UUIDs.
         # A simple fix for the 1.9+ minecarts is proposed.
@@ -0,0 +1,242 @@
+'''
+Copy-on-write overlays of Anvil levels, for trying out changes and keeping or dropping them.
+'''
+from contextlib import contextmanager
+from logging import getLogger
+import weakref
+
+from infiniteworld import AnvilChunk, AnvilChunkData, ChunkedLevelMixin, MCInfdevOldLevel
+from level import EntityLevel
+from mclevelbase import ChunkNotPresent
+
+log = getLogger(__name__)
+
+__all__ = ["LevelFork", "fork"]
+
+
+def _borrow(name):
+    """ Returns a MCInfdevOldLevel method that only needs getChunk and friends, for use by LevelFork too. """
+    return MCInfdevOldLevel.__dict__[name]
+
+
+class LevelFork(ChunkedLevelMixin, EntityLevel):
+    """ A level that starts out identical to its parent and keeps its own changes apart from it.
+
+    The fork holds no chunks of its own until one is asked for with getChunk, which copies the parent's chunk the
+    first time. Everything that changes blocks goes through getChunk, while blockAt, getBlocks, getEntitiesInBox,
+    copying blocks out of the fork and the other read-only accessors read the parent's chunk as long as the fork has
+    no copy. Tags returned by those accessors may belong to the parent, so call getChunk before editing them. Copying
+    a chunk copies its tags and unpacked arrays; sections that were never unpacked are shared with the parent. Copies
+    that were never changed are dropped again once more than loadedChunkLimit chunks are copied.
+
+    commit() writes the fork's changed chunks into the parent and empties the fork. discard() drops them. Changes made
+    to the parent after forking show through in the chunks the fork has not copied. A fork may itself be forked.
+    """
+
+    isInfinite = True
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._chunkData = {}  # (cx, cz) -> AnvilChunkData copied from the parent or created here
+        self._loadedChunks = weakref.WeakValueDictionary()
+        self._createdChunks = set()
+        self._deletedChunks = set()
+        self._bounds = None
+        self.chunksNeedingLighting = set()
+
+    def __str__(self):
+        return u"LevelFork of {0}".format(self.parent)
+
+    # --- Attributes of the parent ---
+
+    @property
+    def Height(self):
+        return self.parent.Height
+
+    @property
+    def materials(self):
+        return self.parent.materials
+
+    @property
+    def dimNo(self):
+        return self.parent.dimNo
+
+    @property
+    def displayName(self):
+        return u"Fork of {0}".format(self.parent.displayName)
+
+    @property
+    def sectionOrderArrays(self):
+        return self.parent.sectionOrderArrays
+
+    @property
+    def loadedChunkLimit(self):
+        return self.parent.loadedChunkLimit
+
+    # --- Chunks ---
+
+    @property
+    def allChunks(self):
+        for cPos in self.parent.allChunks:
+            if cPos not in self._deletedChunks:
+                yield cPos
+        for cPos in self._createdChunks:
+            yield cPos
+
+    @property
+    def chunkCount(self):
+        return sum(1 for _ in self.allChunks)
+
+    def containsChunk(self, cx, cz):
+        cPos = (cx, cz)
+        if cPos in self._chunkData:
+            return True
+        return cPos not in self._deletedChunks and self.parent.containsChunk(cx, cz)
+
+    def getChunk(self, cx, cz):
+        """ Returns the fork's copy of the chunk, copying it from the parent first if needed. """
+        cPos = (cx, cz)
+        chunk = self._loadedChunks.get(cPos)
+        if chunk is not None:
+            return chunk
+
+        chunkData = self._chunkData.get(cPos)
+        if chunkData is None:
+            if cPos in self._deletedChunks:
+                raise ChunkNotPresent(cPos)
+            if len(self._chunkData) >= self.loadedChunkLimit:
+                self._dropCleanChunks()
+            parentChunk = self.parent.getChunk(cx, cz)
+            chunkData = self._chunkData[cPos] = parentChunk.chunkData.copy(self)
+            chunkData.dirty = False  # only chunks changed in the fork are committed
+            if parentChunk.needsLighting:
+                self.chunksNeedingLighting.add(cPos)
+
+        chunk = self._loadedChunks[cPos] = AnvilChunk(chunkData)
+        return chunk
+
+    def _dropCleanChunks(self):
+        """ Drop the copies of parent chunks that were never changed and are no longer in use, so that a fork that
+        visits many chunks does not keep a copy of each. """
+        for cPos, chunkData in self._chunkData.items():
+            if not (chunkData.dirty or cPos in self._createdChunks or cPos in self._loadedChunks):
+                del self._chunkData[cPos]
+                self.chunksNeedingLighting.discard(cPos)
+
+    def _getChunkForReading(self, cx, cz):
+        cPos = (cx, cz)
+        if cPos in self._chunkData:
+            return self.getChunk(cx, cz)
+        if cPos in self._deletedChunks:
+            raise ChunkNotPresent(cPos)
+        return self.parent._getChunkForReading(cx, cz)
+
+    def prefetchChunk(self, cx, cz):
+        if (cx, cz) not in self._chunkData:
+            self.parent.prefetchChunk(cx, cz)
+
+    @contextmanager
+    def pinned(self, box):
+        """ Pin the chunks of box in the parent. The fork's own copies are always kept. """
+        with self.parent.pinned(box):
+            yield self
+
+    def createChunk(self, cx, cz):
+        if self.containsChunk(cx, cz):
+            raise ValueError("{0}:Chunk {1} already present!".format(self, (cx, cz)))
+        cPos = (cx, cz)
+        self._chunkData[cPos] = AnvilChunkData(self, cPos, create=True)
+        self._createdChunks.add(cPos)
+        self._bounds = None
+
+    createChunks = _borrow("createChunks")
+    createChunksInBox = _borrow("createChunksInBox")
+
+    def deleteChunk(self, cx, cz):
+        cPos = (cx, cz)
+        self._chunkData.pop(cPos, None)
+        self._loadedChunks.pop(cPos, None)
+        self.chunksNeedingLighting.discard(cPos)
+        if cPos in self._createdChunks:
+            self._createdChunks.discard(cPos)
+        else:
+            self._deletedChunks.add(cPos)
+        self._bounds = None
+
+    deleteChunksInBox = _borrow("deleteChunksInBox")
+
+    def listDirtyChunks(self):
+        for cPos, chunkData in self._chunkData.iteritems():
+            if chunkData.dirty:
+                yield cPos
+
+    bounds = _borrow("bounds")
+    getWorldBounds = _borrow("getWorldBounds")
+    markDirtyChunk = _borrow("markDirtyChunk")
+    markDirtyBox = _borrow("markDirtyBox")
+    heightMapAt = _borrow("heightMapAt")
+
+    biomeAt = _borrow("biomeAt")
+    setBiomeAt = _borrow("setBiomeAt")
+    _biomeSlices = _borrow("_biomeSlices")
+    biomes = _borrow("biomes")
+    setBiomes = _borrow("setBiomes")
+
+    addEntity = _borrow("addEntity")
+    tileEntityAt = _borrow("tileEntityAt")
+    addTileEntity = _borrow("addTileEntity")
+    addTileEntities = _borrow("addTileEntities")
+    addTileTick = _borrow("addTileTick")
+    addTileTicks = _borrow("addTileTicks")
+    _addToChunks = _borrow("_addToChunks")
+    getEntitiesInBox = _borrow("getEntitiesInBox")
+    getTileEntitiesInBox = _borrow("getTileEntitiesInBox")
+    getTileTicksInBox = _borrow("getTileTicksInBox")
+    removeEntitiesInBox = _borrow("removeEntitiesInBox")
+    removeTileEntitiesInBox = _borrow("removeTileEntitiesInBox")
+    removeTileTicksInBox = _borrow("removeTileTicksInBox")
+
+    # --- Committing ---
+
+    def commit(self):
+        """ Write the chunks changed, created or deleted in the fork into the parent, then empty the fork. Returns the
+        number of chunks written. """
+        parent = self.parent
+        for cx, cz in self._deletedChunks:
+            if parent.containsChunk(cx, cz):
+                parent.deleteChunk(cx, cz)
+
+        written = 0
+        for (cx, cz), chunkData in self._chunkData.iteritems():
+            if not chunkData.dirty:
+                continue
+            if not parent.containsChunk(cx, cz):
+                parent.createChunk(cx, cz)
+
+            parentChunk = parent.getChunk(cx, cz)
+            parentChunk.chunkData.replaceWith(chunkData)
+            if (cx, cz) in self.chunksNeedingLighting:
+                parentChunk.needsLighting = True
+            written += 1
+
+        log.info(u"Committed {0} chunks and {1} deletions from {2}".format(written, len(self._deletedChunks), self))
+        self.discard()
+        return written
+
+    def fork(self):
+        """ Returns a LevelFork of this fork, whose commits go into this fork. """
+        return LevelFork(self)
+
+    def discard(self):
+        """ Drop every change made in the fork. """
+        self._chunkData.clear()
+        self._loadedChunks = weakref.WeakValueDictionary()
+        self._createdChunks.clear()
+        self._deletedChunks.clear()
+        self.chunksNeedingLighting.clear()
+        self._bounds = None
+
+
+def fork(level):
+    """ Returns a LevelFork of this level. See LevelFork. """
+    return LevelFork(level)
@@ -133,6 +133,21 @@ class MCIndevLevel(EntityLevel):
             return 0
         return self.Data[x, z, y]
 
+    def blockAndDataAt(self, x, y, z):
+        if x < 0 or y < 0 or z < 0:
+            return 0, 0
+        if x >= self.Width or y >= self.Height or z >= self.Length:
+            return 0, 0
+        return self.Blocks[x, z, y], self.Data[x, z, y]
+
+    def setBlockAndDataAt(self, x, y, z, blockID, blockData):
+        if x < 0 or y < 0 or z < 0:
+            return 0
+        if x >= self.Width or y >= self.Height or z >= self.Length:
+            return 0
+        self.Blocks[x, z, y] = blockID
+        self.Data[x, z, y] = (blockData & 0xf)
+
     def blockLightAt(self, x, y, z):
         if x < 0 or y < 0 or z < 0:
             return 0
@@ -4,11 +4,12 @@ Created on Jul 22, 2011
 @author: Rio
 '''
 import collections
-
+from contextlib import contextmanager
 from datetime import datetime
 import itertools
 from logging import getLogger
 from math import floor
+import multiprocessing
 import os
 import random
 import shutil
@@ -20,13 +21,18 @@ import zlib
 import sys
 
 from box import BoundingBox
+from chunkjournal import ChunkJournal
 from entity import Entity, TileEntity, TileTick
 from faces import FaceXDecreasing, FaceXIncreasing, FaceZDecreasing, FaceZIncreasing
-from level import LightedChunk, EntityLevel, computeChunkHeightMap, MCLevel, ChunkBase
+import light_queue
+import parallel_light
+from level import LightedChunk, EntityLevel, computeChunkHeightMap, MCLevel, ChunkBase, SECTION_CATEGORIES
 from materials import alphaMaterials
 from mclevelbase import ChunkMalformed, ChunkNotPresent, ChunkAccessDenied,ChunkConcurrentException,exhaust, PlayerNotFound
 import nbt
-from numpy import array, clip, maximum, zeros
+from numpy import array, clip, flatnonzero, fromstring, lexsort, maximum, packbits, unpackbits, zeros
+import readahead
+import regionfile
 from regionfile import MCRegionFile
 import logging
 from uuid import UUID
@@ -45,6 +51,9 @@ class SessionLockLost(IOError):
     pass
 
 
+MIN_LIGHTING_BATCH = 16  # parallel lighting does not split batches smaller than this
+
+
 def ZeroChunk(height=512):
     z = _zeros.get(height)
     if z is None:
@@ -82,21 +91,139 @@ def packNibbleArray(unpackedData):
     return array(packedData[:, :, :, 1])
 
 
-def sanitizeBlocks(chunk):
+def sanitizeBlocks(chunk, miny=0, maxy=None):
+    """ Fix up the blocks of the chunk between levels miny and maxy. """
+    blocks = chunk.Blocks[:, :, miny:maxy]
+
     # change grass to dirt where needed so Minecraft doesn't flip out and die
-    grass = chunk.Blocks == chunk.materials.Grass.ID
-    grass |= chunk.Blocks == chunk.materials.Dirt.ID
+    grass = blocks == chunk.materials.Grass.ID
+    grass |= blocks == chunk.materials.Dirt.ID
     badgrass = grass[:, :, 1:] & grass[:, :, :-1]
 
-    chunk.Blocks[:, :, :-1][badgrass] = chunk.materials.Dirt.ID
+    blocks[:, :, :-1][badgrass] = chunk.materials.Dirt.ID
 
     # remove any thin snow layers immediately above other thin snow layers.
     # minecraft doesn't flip out, but it's almost never intended
     if hasattr(chunk.materials, "SnowLayer"):
-        snowlayer = chunk.Blocks == chunk.materials.SnowLayer.ID
+        snowlayer = blocks == chunk.materials.SnowLayer.ID
         badsnow = snowlayer[:, :, 1:] & snowlayer[:, :, :-1]
 
-        chunk.Blocks[:, :, 1:][badsnow] = chunk.materials.Air.ID
+        blocks[:, :, 1:][badsnow] = chunk.materials.Air.ID
+
+
+SECTION_ARRAYS = ("Blocks", "Data", "BlockLight", "SkyLight")
+ARRAY_CATEGORIES = {"Blocks": "blocks", "Data": "blocks", "BlockLight": "light", "SkyLight": "light"}
+
+
+def _unpackedSection(name, arrays, staleSections, y):
+    """ Returns the y,z,x view of section y of an unpacked array, or None if the array is still packed or the section
+    has not changed since it was packed. """
+    arr = arrays.get(name)
+    if arr is None:
+        return None
+    if staleSections is not None and y / 16 not in staleSections[ARRAY_CATEGORIES[name]]:
+        return None
+    return arr[..., y:y + 16].swapaxes(0, 2)
+
+
+def _sectionIsEmpty(unpacked, packed):
+    Blocks, BlockLight, SkyLight = (unpacked[name] for name in ("Blocks", "BlockLight", "SkyLight"))
+    if Blocks is None:
+        blocksEmpty = not (packed.get("Blocks") is not None and packed["Blocks"].any() or
+                           packed.get("Add") is not None and packed["Add"].any())
+    else:
+        blocksEmpty = not Blocks.any()
+
+    if BlockLight is None:
+        blockLightEmpty = packed.get("BlockLight") is None or not packed["BlockLight"].any()
+    else:
+        blockLightEmpty = not BlockLight.any()
+
+    if SkyLight is None:
+        skyLightFull = packed.get("SkyLight") is None or (packed["SkyLight"] == 0xff).all()
+    else:
+        skyLightFull = (SkyLight == 15).all()
+
+    return blocksEmpty and blockLightEmpty and skyLightFull
+
+
+def packSections(arrays, packedSections, height, staleSections=None):
+    """ Build the Sections list of a chunk, leaving out empty sections.
+
+    arrays maps the names in SECTION_ARRAYS to unpacked x,z,y arrays. Arrays missing from it are taken from
+    packedSections, which maps each section's Y to a dict of its arrays as they are stored in the file (Blocks, Add,
+    Data, BlockLight and SkyLight), and are copied without unpacking them.
+
+    staleSections maps the categories of ARRAY_CATEGORIES to the Ys of the sections where the unpacked arrays have
+    changed since they were packed. The other sections are copied from packedSections too, where a missing section
+    is an empty one. If staleSections is None, every unpacked section is packed again.
+    """
+    sections = nbt.TAG_List()
+    for y in range(0, height, 16):
+        section = nbt.TAG_Compound()
+        packed = packedSections.get(y / 16, {})
+        unpacked = dict((name, _unpackedSection(name, arrays, staleSections, y)) for name in SECTION_ARRAYS)
+
+        if _sectionIsEmpty(unpacked, packed):
+            continue
+
+        Blocks = unpacked["Blocks"]
+        if Blocks is None:
+            section["Blocks"] = nbt.TAG_Byte_Array(packed.get("Blocks", zeros(4096, 'uint8')))
+            if packed.get("Add") is not None:
+                section["Add"] = nbt.TAG_Byte_Array(packed["Add"])
+        else:
+            add = Blocks >> 8
+            if add.any():
+                section["Add"] = nbt.TAG_Byte_Array(packNibbleArray(add).astype('uint8'))
+            section["Blocks"] = nbt.TAG_Byte_Array(array(Blocks, 'uint8'))
+
+        for name in "Data", "BlockLight", "SkyLight":
+            if unpacked[name] is not None:
+                value = packNibbleArray(unpacked[name])
+            elif packed.get(name) is not None:
+                value = packed[name]
+            else:
+                value = zeros(2048, 'uint8')
+                if name == "SkyLight":
+                    value[:] = 0xff
+            section[name] = nbt.TAG_Byte_Array(array(value))
+
+        section["Y"] = nbt.TAG_Byte(y / 16)
+        sections.append(section)
+
+    return sections
+
+
+def packChunk(job):
+    """ Serialize and compress one chunk for MCRegionFile.saveChunks. job is the tuple returned by
+    AnvilChunkData.packJob: the uncompressed chunk tag without its sections, followed by the arguments for
+    packSections. Returns the compressed chunk and its packed sections, for AnvilChunkData.packedSectionsSaved.
+
+    This runs in the save processes, so it must only use its arguments.
+    """
+    tagData, arrays, packedSections, height, staleSections = job
+    root_tag = nbt.load(buf=tagData, lazy=True)
+    sections = packSections(arrays, packedSections, height, staleSections)
+    root_tag["Level"]["Sections"] = sections
+    return regionfile.deflate(root_tag.save(compressed=False)), AnvilChunkData._sectionArrays(sections)
+
+
+def _sectionArray(name):
+    def getter(self):
+        arr = self._arrays.get(name)
+        if arr is None:
+            arr = self._unpackArray(name)
+        return arr
+
+    def setter(self, value):
+        self._arrays[name] = value
+        self._dropPackedArray(name)
+        self._staleSections[ARRAY_CATEGORIES[name]].update(self._allSections())
+        if name == "Blocks":
+            self.surfaceMaps.clear()
+
+    return property(getter, setter, doc="The unpacked {0} array, indexed [x,z,y]".format(name))
 
 
 class AnvilChunkData(object):
@@ -107,19 +234,32 @@ class AnvilChunkData(object):
     AnvilChunks are stored in a WeakValueDictionary so we can find out when they are no longer used by clients. The
     AnvilChunkData for an unused chunk may safely be discarded or written out to disk. The client should probably
      not keep references to a whole lot of chunks or else it will run out of memory.
+
+    The Blocks, Data, BlockLight and SkyLight arrays are unpacked from the chunk's sections the first time each one is
+    used. Until then, only the non-empty sections are held, packed as they were stored, and they are written back
+    as-is when the chunk is saved. A chunk that is only read for its blocks never unpacks its light arrays.
+
+    The packed sections are kept after unpacking, and saving only packs again the sections marked with
+    markSectionsDirty, copying the others. Setting dirty marks every section, so code that writes to the arrays
+    directly must set dirty or call markSectionsDirty for its changes to be saved.
+
+    When the level's sectionOrderArrays is set, each unpacked array is allocated in the y,z,x order of the sections
+    and the [x,z,y] array is a swapaxes view of it, so unpacking and packing a section is a contiguous copy instead of
+    a transpose. The views are not C-contiguous: reshaping or ravelling them makes a copy.
     """
 
     def __init__(self, world, chunkPosition, root_tag=None, create=False):
         self.chunkPosition = chunkPosition
         self.world = world
         self.root_tag = root_tag
-        self.dirty = False
 
-        self.Blocks = zeros((16, 16, world.Height), 'uint16')
-        self.Data = zeros((16, 16, world.Height), 'uint8')
-        self.BlockLight = zeros((16, 16, world.Height), 'uint8')
-        self.SkyLight = zeros((16, 16, world.Height), 'uint8')
-        self.SkyLight[:] = 15
+        self._arrays = {}
+        self._packedSections = {}
+        self.surfaceMaps = {}
+        self.dirtySections = dict((category, set()) for category in SECTION_CATEGORIES)
+        self._staleSections = dict((category, set()) for category in SECTION_CATEGORIES)  # sections to pack again
+        self.unlitSections = set()
+        self.dirty = False
 
         if create:
             self._create()
@@ -131,6 +271,11 @@ class AnvilChunkData(object):
             levelTag["Biomes"] = nbt.TAG_Byte_Array(zeros((16, 16), 'uint8'))
             levelTag["Biomes"].value[:] = -1
 
+    Blocks = _sectionArray("Blocks")
+    Data = _sectionArray("Data")
+    BlockLight = _sectionArray("BlockLight")
+    SkyLight = _sectionArray("SkyLight")
+
     def _create(self):
         (cx, cz) = self.chunkPosition
         chunkTag = nbt.TAG_Compound()
@@ -156,74 +301,248 @@ class AnvilChunkData(object):
 
     def _load(self, root_tag):
         self.root_tag = root_tag
+        self._packedSections = self._sectionArrays(self.root_tag["Level"].pop("Sections", []))
 
-        for sec in self.root_tag["Level"].pop("Sections", []):
-            y = sec["Y"].value * 16
+    @staticmethod
+    def _sectionArrays(sections):
+        return dict((sec["Y"].value, dict((name, tag.value) for name, tag in sec.iteritems() if name != "Y"))
+                    for sec in sections)
+
+    def _unpackArray(self, name):
+        height = self.world.Height
+        dtype = 'uint16' if name == "Blocks" else 'uint8'
+        sectionOrder = self.world.sectionOrderArrays
+        if sectionOrder:
+            # stored y,z,x like the sections; arr is an x,z,y view of it
+            store = zeros((height, 16, 16), dtype)
+            arr = store.swapaxes(0, 2)
+        else:
+            arr = zeros((16, 16, height), dtype)
+        if name == "SkyLight":
+            arr[:] = 15
+
+        for sy, packed in self._packedSections.iteritems():
+            y = sy * 16
+            secarray = packed.get(name)
+            if secarray is None:
+                continue
 
-            for name in "Blocks", "Data", "SkyLight", "BlockLight":
-                arr = getattr(self, name)
-                secarray = sec[name].value
-                if name == "Blocks":
-                    secarray.shape = (16, 16, 16)
-                else:
-                    secarray.shape = (16, 16, 8)
-                    secarray = unpackNibbleArray(secarray)
+            if name == "Blocks":
+                secarray = secarray.reshape(16, 16, 16)
+            else:
+                secarray = unpackNibbleArray(secarray.reshape(16, 16, 8))
 
+            if name == "Blocks" and packed.get("Add") is not None:
+                add = unpackNibbleArray(packed["Add"].reshape(16, 16, 8))
+                secarray = secarray | (array(add, 'uint16') << 8)
+
+            if sectionOrder:
+                store[y:y + 16] = secarray
+            else:
                 arr[..., y:y + 16] = secarray.swapaxes(0, 2)
 
-            tag = sec.get("Add")
-            if tag is not None:
-                tag.value.shape = (16, 16, 8)
-                add = unpackNibbleArray(tag.value)
-                self.Blocks[..., y:y + 16] |= (array(add, 'uint16') << 8).swapaxes(0, 2)
+        self._arrays[name] = arr
+        self._resized()
+        return arr
 
-    def savedTagData(self):
-        """ does not recalculate any data or light """
+    def _resized(self):
+        cache = getattr(self.world, "_loadedChunkData", None)
+        if cache is not None and cache.get(self.chunkPosition) is self:
+            cache.resize(self.chunkPosition)
 
-        log.debug(u"Saving chunk: {0}".format(self))
-        sanitizeBlocks(self)
+    def _dropPackedArray(self, name):
+        for packed in self._packedSections.itervalues():
+            packed.pop(name, None)
+            if name == "Blocks":
+                packed.pop("Add", None)
 
-        sections = nbt.TAG_List()
-        for y in range(0, self.world.Height, 16):
-            section = nbt.TAG_Compound()
+    # --- Dirty sections ---
 
-            Blocks = self.Blocks[..., y:y + 16].swapaxes(0, 2)
-            Data = self.Data[..., y:y + 16].swapaxes(0, 2)
-            BlockLight = self.BlockLight[..., y:y + 16].swapaxes(0, 2)
-            SkyLight = self.SkyLight[..., y:y + 16].swapaxes(0, 2)
+    def _allSections(self):
+        return xrange(self.world.Height >> 4)
 
-            if (not Blocks.any() and
-                    not BlockLight.any() and
-                    (SkyLight == 15).all()):
-                continue
+    @property
+    def dirty(self):
+        return self._dirty
 
-            Data = packNibbleArray(Data)
-            BlockLight = packNibbleArray(BlockLight)
-            SkyLight = packNibbleArray(SkyLight)
+    @dirty.setter
+    def dirty(self, value):
+        if value:
+            for category in SECTION_CATEGORIES:
+                self.markSectionsDirty(category)
+        else:
+            self._dirty = False
+            for sectionYs in self.dirtySections.itervalues():
+                sectionYs.clear()
+
+    def markSectionsDirty(self, category, sectionYs=None):
+        """ See ChunkBase.markSectionsDirty. """
+        if sectionYs is None:
+            sectionYs = self._allSections()
+        self._dirty = True
+        self.dirtySections[category].update(sectionYs)
+        self._staleSections[category].update(sectionYs)
+        if category == "blocks":
+            self.unlitSections.update(sectionYs)
+
+    # --- Saving ---
+
+    def _sanitize(self):
+        """ Sanitize the blocks of the changed sections and the layers next to them. """
+        stale = self._staleSections["blocks"]
+        if "Blocks" not in self._arrays or not stale:
+            return
 
-            add = Blocks >> 8
-            if add.any():
-                section["Add"] = nbt.TAG_Byte_Array(packNibbleArray(add).astype('uint8'))
+        miny = max(0, min(stale) * 16 - 1)
+        maxy = min(self.world.Height, max(stale) * 16 + 17)
+        sanitizeBlocks(self, miny, maxy)
+        stale.update(xrange(miny >> 4, ((maxy - 1) >> 4) + 1))
 
-            section['Blocks'] = nbt.TAG_Byte_Array(array(Blocks, 'uint8'))
-            section['Data'] = nbt.TAG_Byte_Array(array(Data))
-            section['BlockLight'] = nbt.TAG_Byte_Array(array(BlockLight))
-            section['SkyLight'] = nbt.TAG_Byte_Array(array(SkyLight))
+    def savedTagData(self):
+        """ does not recalculate any data or light """
 
-            section["Y"] = nbt.TAG_Byte(y / 16)
-            sections.append(section)
+        log.debug(u"Saving chunk: {0}".format(self))
+        self._sanitize()
 
+        sections = packSections(self._arrays, self._packedSections, self.world.Height, self._staleSections)
         self.root_tag["Level"]["Sections"] = sections
         data = self.root_tag.save(compressed=False)
         del self.root_tag["Level"]["Sections"]
+        self.packedSectionsSaved(self._sectionArrays(sections))
 
         log.debug(u"Saved chunk {0}".format(self))
         return data
 
+    def packJob(self):
+        """ Returns the arguments for packChunk. Sanitizes the blocks first, since that may change them. """
+        self._sanitize()
+        return (self.root_tag.save(compressed=False), self._arrays, self._packedSections, self.world.Height,
+                self._staleSections)
+
+    def packedSectionsSaved(self, packedSections):
+        """ Keep the sections just packed for the next save, which only packs the sections changed after this. """
+        self._packedSections = packedSections
+        for sectionYs in self._staleSections.itervalues():
+            sectionYs.clear()
+        self._resized()
+
+    def copy(self, world):
+        """ Returns a copy of this chunk data belonging to world. The tags and unpacked arrays are copied. The packed
+        sections are shared, since they are only ever replaced, never changed. """
+        chunkData = AnvilChunkData.__new__(AnvilChunkData)
+        chunkData.chunkPosition = self.chunkPosition
+        chunkData.world = world
+        chunkData.root_tag = nbt.load(buf=self.root_tag.save(compressed=False), lazy=True)
+        chunkData._dirty = self._dirty
+        chunkData.dirtySections = dict((category, set(ys)) for category, ys in self.dirtySections.iteritems())
+        chunkData._staleSections = dict((category, set(ys)) for category, ys in self._staleSections.iteritems())
+        chunkData.unlitSections = set(self.unlitSections)
+        chunkData._arrays = dict((name, arr.copy(order='K')) for name, arr in self._arrays.iteritems())
+        chunkData._packedSections = dict((sy, dict(packed)) for sy, packed in self._packedSections.iteritems())
+        chunkData.surfaceMaps = dict((kind, heights.copy()) for kind, heights in self.surfaceMaps.iteritems())
+        return chunkData
+
+    def replaceWith(self, chunkData):
+        """ Take the tags and arrays of chunkData, which must not be used afterward, and mark this chunk dirty where
+        either chunk has changed. """
+        self.root_tag = chunkData.root_tag
+        self._arrays = chunkData._arrays
+        self._packedSections = chunkData._packedSections
+        self._staleSections = chunkData._staleSections
+        self.unlitSections.update(chunkData.unlitSections)
+        self.surfaceMaps = chunkData.surfaceMaps
+        self._dirty = True
+        for category, sectionYs in chunkData.dirtySections.iteritems():
+            self.dirtySections[category].update(sectionYs)
+
+        self._resized()
+
     @property
     def materials(self):
         return self.world.materials
 
+    @property
+    def memoryUsage(self):
+        """ Approximate number of bytes held by this chunk's arrays, packed or not. The tags are not counted. """
+        return (sum(arr.nbytes for arr in self._arrays.itervalues()) +
+                sum(arr.nbytes for packed in self._packedSections.itervalues() for arr in packed.itervalues()))
+
+
+class ChunkDataCache(collections.OrderedDict):
+    """ Maps (cx, cz) to AnvilChunkData, ordered from least to most recently used.
+
+    The cache only keeps the bookkeeping: the hit, miss and eviction counters, the memory used by its chunks and the
+    set of pinned chunks. MCInfdevOldLevel decides when to evict and where evicted chunks go.
+    """
+
+    def __init__(self):
+        super(ChunkDataCache, self).__init__()
+        self.hits = self.misses = self.evictions = 0
+        self.memoryUsage = 0
+        self._sizes = {}
+        self._pins = collections.Counter()
+
+    def __setitem__(self, key, chunkData):
+        if key in self:
+            del self[key]
+        super(ChunkDataCache, self).__setitem__(key, chunkData)
+        size = chunkData.memoryUsage
+        self._sizes[key] = size
+        self.memoryUsage += size
+
+    def __delitem__(self, key):
+        super(ChunkDataCache, self).__delitem__(key)
+        self.memoryUsage -= self._sizes.pop(key)
+
+    def clear(self):
+        super(ChunkDataCache, self).clear()
+        self._sizes.clear()
+        self.memoryUsage = 0
+
+    def lookup(self, key):
+        """ Return the chunk data for key and mark it as the most recently used, or return None and count a miss. """
+        chunkData = self.get(key)
+        if chunkData is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.touch(key)
+        return chunkData
+
+    def touch(self, key):
+        """ Move key to the most recently used end and update its size. """
+        self[key] = self.get(key)
+
+    def resize(self, key):
+        """ Update the size of key without changing its position. """
+        size = self[key].memoryUsage
+        self.memoryUsage += size - self._sizes[key]
+        self._sizes[key] = size
+
+    # --- Pinning ---
+
+    def pin(self, key):
+        self._pins[key] += 1
+
+    def unpin(self, key):
+        if self._pins[key] > 1:
+            self._pins[key] -= 1
+        else:
+            self._pins.pop(key, None)
+
+    def isPinned(self, key):
+        return key in self._pins
+
+    @property
+    def pinnedCount(self):
+        return len(self._pins)
+
+    def evictionCandidates(self):
+        """ Yield unpinned chunk positions, least recently used first. """
+        for key in self.keys():
+            if key not in self._pins:
+                yield key
+
 
 class AnvilChunk(LightedChunk):
     """ This is a 16x16xH chunk in an (infinite) world.
@@ -271,25 +590,62 @@ class AnvilChunk(LightedChunk):
         doubleize("Motion")
         doubleize("Position")
 
-        self.dirty = True
+        self.markSectionsDirty("entities", self._sectionsAt(Entity.pos(entityTag)[1]))
         return super(AnvilChunk, self).addEntity(entityTag)
 
     def removeEntitiesInBox(self, box):
-        self.dirty = True
+        self.markSectionsDirty("entities", self._sectionsAt(box.miny, box.maxy))
         return super(AnvilChunk, self).removeEntitiesInBox(box)
 
+    def addTileEntity(self, tileEntityTag):
+        self.markSectionsDirty("entities", self._sectionsAt(TileEntity.pos(tileEntityTag)[1]))
+        return super(AnvilChunk, self).addTileEntity(tileEntityTag)
+
+    def addTileEntities(self, tileEntities):
+        tileEntities = list(tileEntities)
+        for y in set(t["y"].value for t in tileEntities):
+            self.markSectionsDirty("entities", self._sectionsAt(y))
+        return super(AnvilChunk, self).addTileEntities(tileEntities)
+
     def removeTileEntitiesInBox(self, box):
-        self.dirty = True
+        self.markSectionsDirty("entities", self._sectionsAt(box.miny, box.maxy))
         return super(AnvilChunk, self).removeTileEntitiesInBox(box)
 
     def addTileTick(self, tickTag):
-        self.dirty = True
+        self.markSectionsDirty("entities", self._sectionsAt(TileTick.pos(tickTag)[1]))
         return super(AnvilChunk, self).addTileTick(tickTag)
 
+    def addTileTicks(self, tileTicks):
+        tileTicks = list(tileTicks)
+        for y in set(t["y"].value for t in tileTicks):
+            self.markSectionsDirty("entities", self._sectionsAt(y))
+        return super(AnvilChunk, self).addTileTicks(tileTicks)
+
     def removeTileTicksInBox(self, box):
-        self.dirty = True
+        self.markSectionsDirty("entities", self._sectionsAt(box.miny, box.maxy))
         return super(AnvilChunk, self).removeTileTicksInBox(box)
 
+    def _sectionsAt(self, miny, maxy=None):
+        """ The Ys of the sections from level Y miny up to maxy, or holding miny alone, clipped to the chunk. """
+        if maxy is None:
+            maxy = miny + 1
+        miny = max(0, int(floor(miny)))
+        maxy = min(self.Height, int(floor(maxy)))
+        return xrange(miny >> 4, ((maxy - 1) >> 4) + 1) if maxy > miny else ()
+
+    # --- Dirty sections ---
+
+    @property
+    def dirtySections(self):
+        return self.chunkData.dirtySections
+
+    @property
+    def unlitSections(self):
+        return self.chunkData.unlitSections
+
+    def markSectionsDirty(self, category, sectionYs=None):
+        self.chunkData.markSectionsDirty(category, sectionYs)
+
     # --- AnvilChunkData accessors ---
 
     @property
@@ -304,6 +660,10 @@ class AnvilChunk(LightedChunk):
     def dirty(self, val):
         self.chunkData.dirty = val
 
+    @property
+    def surfaceMaps(self):
+        return self.chunkData.surfaceMaps
+
     # --- Chunk attributes ---
 
     @property
@@ -414,7 +774,7 @@ class ChunkedLevelMixin(MCLevel):
 
         xInChunk = x & 0xf
         zInChunk = z & 0xf
-        ch = self.getChunk(xc, zc)
+        ch = self._getChunkForReading(xc, zc)
 
         return ch.BlockLight[xInChunk, zInChunk, y]
 
@@ -441,7 +801,7 @@ class ChunkedLevelMixin(MCLevel):
         zInChunk = z & 0xf
 
         try:
-            ch = self.getChunk(xc, zc)
+            ch = self._getChunkForReading(xc, zc)
         except ChunkNotPresent:
             return 0
 
@@ -462,7 +822,7 @@ class ChunkedLevelMixin(MCLevel):
             return 0
 
         ch.Data[xInChunk, zInChunk, y] = newdata
-        ch.dirty = True
+        ch.markSectionsDirty("blocks", (y >> 4,))
         ch.needsLighting = True
 
     def blockAt(self, x, y, z):
@@ -476,7 +836,7 @@ class ChunkedLevelMixin(MCLevel):
         zInChunk = z & 0xf
 
         try:
-            ch = self.getChunk(xc, zc)
+            ch = self._getChunkForReading(xc, zc)
         except ChunkNotPresent:
             return 0
 
@@ -498,8 +858,108 @@ class ChunkedLevelMixin(MCLevel):
             return 0
 
         ch.Blocks[xInChunk, zInChunk, y] = blockID
-        ch.dirty = True
+        ch.markSectionsDirty("blocks", (y >> 4,))
         ch.needsLighting = True
+        ch.updateSurfaceMaps(xInChunk, zInChunk, y)
+
+    def blockAndDataAt(self, x, y, z):
+        """returns (0, 0) for blocks outside the loadable chunks.  automatically loads chunks."""
+        if y < 0 or y >= self.Height:
+            return 0, 0
+
+        xInChunk = x & 0xf
+        zInChunk = z & 0xf
+
+        try:
+            ch = self._getChunkForReading(x >> 4, z >> 4)
+        except ChunkNotPresent:
+            return 0, 0
+
+        return ch.Blocks[xInChunk, zInChunk, y], ch.Data[xInChunk, zInChunk, y]
+
+    def setBlockAndDataAt(self, x, y, z, blockID, blockData):
+        """returns 0 for blocks outside the loadable chunks.  automatically loads chunks."""
+        if y < 0 or y >= self.Height:
+            return 0
+
+        xInChunk = x & 0xf
+        zInChunk = z & 0xf
+
+        try:
+            ch = self.getChunk(x >> 4, z >> 4)
+        except ChunkNotPresent:
+            return 0
+
+        ch.Blocks[xInChunk, zInChunk, y] = blockID
+        ch.Data[xInChunk, zInChunk, y] = blockData
+        ch.markSectionsDirty("blocks", (y >> 4,))
+        ch.needsLighting = True
+        ch.updateSurfaceMaps(xInChunk, zInChunk, y)
+
+    # --- Batched block accessors ---
+
+    def _chunkGroups(self, xs, ys, zs, readahead=False):
+        """ Sort the flat coordinate arrays by chunk. Yields (cx, cz, indices), where indices selects the coordinates
+        inside chunk (cx, cz). Coordinates above or below the level are left out. """
+        inside = flatnonzero((ys >= 0) & (ys < self.Height))
+        cxs = xs[inside] >> 4
+        czs = zs[inside] >> 4
+        order = lexsort((czs, cxs))
+        inside, cxs, czs = inside[order], cxs[order], czs[order]
+
+        starts = flatnonzero((cxs[1:] != cxs[:-1]) | (czs[1:] != czs[:-1])) + 1
+        bounds = zip([0] + list(starts), list(starts) + [len(inside)]) if len(inside) else []
+        groups = ((int(cxs[start]), int(czs[start]), inside[start:end]) for start, end in bounds)
+        return self.readaheadChunkPositions(groups, readahead, key=lambda group: group[:2])
+
+    def getBlocks(self, xs, ys, zs, readahead=False):
+        """ Returns the block IDs at the coordinates given by the arrays xs, ys and zs, in an array of their
+        broadcast shape. Each chunk is looked up once. Like blockAt, blocks in missing chunks or outside the level
+        are 0. See readaheadChunkPositions for the readahead argument. """
+        (xs, ys, zs), shape = self._coordinateArrays(xs, ys, zs)
+        blocks = zeros(xs.shape, 'uint16')
+        for cx, cz, i in self._chunkGroups(xs, ys, zs, readahead):
+            try:
+                ch = self._getChunkForReading(cx, cz)
+            except ChunkNotPresent:
+                continue
+            blocks[i] = ch.Blocks[xs[i] & 0xf, zs[i] & 0xf, ys[i]]
+        return blocks.reshape(shape)
+
+    def getBlockData(self, xs, ys, zs, readahead=False):
+        """ Returns the block data values at the given coordinates, like getBlocks. """
+        (xs, ys, zs), shape = self._coordinateArrays(xs, ys, zs)
+        data = zeros(xs.shape, 'uint8')
+        for cx, cz, i in self._chunkGroups(xs, ys, zs, readahead):
+            try:
+                ch = self._getChunkForReading(cx, cz)
+            except ChunkNotPresent:
+                continue
+            data[i] = ch.Data[xs[i] & 0xf, zs[i] & 0xf, ys[i]]
+        return data.reshape(shape)
+
+    def setBlocks(self, xs, ys, zs, blockIDs, blockData=None, readahead=False):
+        """ Store blockIDs, and blockData if given, at the coordinates given by the arrays xs, ys and zs. The IDs
+        and data may be arrays or single values; they are broadcast against the coordinates. Each chunk is looked up
+        and marked dirty once. Like setBlockAt, blocks in missing chunks or outside the level are ignored. If the same
+        position appears more than once, which value is stored is undefined. """
+        if blockData is None:
+            (xs, ys, zs, blockIDs), shape = self._coordinateArrays(xs, ys, zs, blockIDs)
+        else:
+            (xs, ys, zs, blockIDs, blockData), shape = self._coordinateArrays(xs, ys, zs, blockIDs, blockData)
+
+        for cx, cz, i in self._chunkGroups(xs, ys, zs, readahead):
+            try:
+                ch = self.getChunk(cx, cz)
+            except ChunkNotPresent:
+                continue
+            x, z, y = xs[i] & 0xf, zs[i] & 0xf, ys[i]
+            ch.Blocks[x, z, y] = blockIDs[i]
+            if blockData is not None:
+                ch.Data[x, z, y] = blockData[i]
+            ch.markSectionsDirty("blocks", set((y >> 4).tolist()))
+            ch.needsLighting = True
+            ch.surfaceMaps.clear()
 
     def skylightAt(self, x, y, z):
 
@@ -511,7 +971,7 @@ class ChunkedLevelMixin(MCLevel):
         xInChunk = x & 0xf
         zInChunk = z & 0xf
 
-        ch = self.getChunk(xc, zc)
+        ch = self._getChunkForReading(xc, zc)
 
         return ch.SkyLight[xInChunk, zInChunk, y]
 
@@ -536,13 +996,61 @@ class ChunkedLevelMixin(MCLevel):
 
     createChunk = NotImplemented
 
-    def generateLights(self, dirtyChunkPositions=None):
-        return exhaust(self.generateLightsIter(dirtyChunkPositions))
+    lightingEngine = "sweep"  # used by generateLights when no engine is given
+    lightProcesses = None  # processes used by the "parallel" lighting engine. None uses one per CPU.
+
+    def generateLights(self, dirtyChunkPositions=None, engine=None):
+        return exhaust(self.generateLightsIter(dirtyChunkPositions, engine))
+
+    @contextmanager
+    def deferredLighting(self, relight=True, engine=None):
+        """ Put off lighting the chunks changed in the with block until its end, for code that changes the same
+        chunks many times over.
+
+        Inside the block, chunkChanged only records the chunk and its changed sections instead of filling its sky
+        light from its HeightMap. At the end, the recorded chunks and any others needing lighting are relit with
+        the given engine. If relight is False, the recorded chunks only get their sky light filled from their
+        HeightMap again, and are left needing lighting until generateLights is called.
+
+        Nested blocks are lit at the end of the outermost one.
+        """
+        if self.deferredLightChunks is not None:
+            yield self
+            return
+
+        self.deferredLightChunks = deferredChunks = set()
+        try:
+            yield self
+        finally:
+            self.deferredLightChunks = None
+            if not relight:
+                for cPos in deferredChunks:
+                    try:
+                        chunk = self.getChunk(*cPos)
+                    except (ChunkNotPresent, ChunkMalformed):
+                        continue
+                    chunk.genFastLights()
+                    chunk.markSectionsDirty("light")
 
-    def generateLightsIter(self, dirtyChunkPositions=None):
+        if relight:
+            self.generateLights(engine=engine)
+
+    def generateLightsIter(self, dirtyChunkPositions=None, engine=None):
         """ dirtyChunks may be an iterable yielding (xPos,zPos) tuples
         if none, generate lights for all chunks that need lighting
+
+        engine is "sweep", which relights the chunks and their neighbours by sweeping light across them, "bfs",
+        which only spreads light from the changed sections with light_queue, or "parallel", which sweeps batches of
+        chunks in lightProcesses worker processes with parallel_light. All give the same light. The default is the
+        level's lightingEngine.
         """
+        engine = engine or self.lightingEngine
+        if engine == "sweep":
+            lightBatch = self._generateLightsIter
+        elif engine == "bfs":
+            lightBatch = lambda chunkPositions: light_queue.relightIter(self, chunkPositions)
+        elif engine != "parallel":
+            raise ValueError("Unknown lighting engine {0!r}, expected 'sweep', 'bfs' or 'parallel'".format(engine))
 
         startTime = datetime.now()
 
@@ -553,10 +1061,45 @@ class ChunkedLevelMixin(MCLevel):
 
         dirtyChunkPositions = sorted(dirtyChunkPositions)
 
-        maxLightingChunks = getattr(self, 'loadedChunkLimit', 400)
-
         log.info(u"Asked to light {0} chunks".format(len(dirtyChunkPositions)))
-        chunkLists = [dirtyChunkPositions]
+        if engine == "parallel":
+            for progress in parallel_light.relightIter(self, dirtyChunkPositions, self.lightProcesses):
+                yield progress
+            chunkLists = ()
+        else:
+            chunkLists = self._lightingBatches(dirtyChunkPositions)
+
+        if len(chunkLists) > 1:
+            log.info(u"Using {0} batches to conserve memory.".format(len(chunkLists)))
+        # batchSize = min(len(a) for a in chunkLists)
+        estimatedTotals = [len(a) * 32 for a in chunkLists]
+        workDone = 0
+
+        for i, dc in enumerate(chunkLists):
+            log.info(u"Batch {0}/{1}".format(i, len(chunkLists)))
+
+            dc = sorted(dc)
+            workTotal = sum(estimatedTotals)
+            t = 0
+            for c, t, p in lightBatch(dc):
+                yield c + workDone, t + workTotal - estimatedTotals[i], p
+
+            estimatedTotals[i] = t
+            workDone += t
+
+        timeDelta = datetime.now() - startTime
+
+        if len(dirtyChunkPositions):
+            log.info(u"Completed in {0}, {1} per chunk".format(timeDelta, dirtyChunkPositions and timeDelta / len(
+                dirtyChunkPositions) or 0))
+
+        return
+
+    def _lightingBatches(self, chunkPositions, minimumBatches=1):
+        """ Split the sorted chunkPositions into spatial batches of at most loadedChunkLimit chunks, and into at least
+        minimumBatches batches as long as the batches still have more than MIN_LIGHTING_BATCH chunks. """
+        maxLightingChunks = getattr(self, 'loadedChunkLimit', 400)
+        chunkLists = [chunkPositions]
 
         def reverseChunkPosition((cx, cz)):
             return cz, cx
@@ -583,40 +1126,64 @@ class ChunkedLevelMixin(MCLevel):
 
             return newChunkLists
 
-        while len(chunkLists[0]) > maxLightingChunks:
+        while (len(chunkLists[0]) > maxLightingChunks
+               or len(chunkLists) < minimumBatches and len(chunkLists[0]) > MIN_LIGHTING_BATCH * 4):
             chunkLists = splitChunkLists(chunkLists)
 
-        if len(chunkLists) > 1:
-            log.info(u"Using {0} batches to conserve memory.".format(len(chunkLists)))
-        # batchSize = min(len(a) for a in chunkLists)
-        estimatedTotals = [len(a) * 32 for a in chunkLists]
-        workDone = 0
+        return chunkLists
 
-        for i, dc in enumerate(chunkLists):
-            log.info(u"Batch {0}/{1}".format(i, len(chunkLists)))
+    def _lightingRanges(self, chunks):
+        """ Returns the level Y ranges to relight for the given chunks, as a dict mapping each light array to the
+        range where it is recalculated and the wider range where it is spread.
 
-            dc = sorted(dc)
-            workTotal = sum(estimatedTotals)
-            t = 0
-            for c, t, p in self._generateLightsIter(dc):
-                yield c + workDone, t + workTotal - estimatedTotals[i], p
+        Only the blocks in the chunks' unlitSections have changed, and light travels at most 15 blocks, so block
+        light only changes in the sections next to them. Sky light also changes all the way down the columns below
+        them. Chunks that do not say which sections changed are relit from top to bottom.
+        """
+        changed = set()
+        for chunk in chunks:
+            changed.update(chunk.unlitSections or xrange((self.Height + 15) >> 4))
 
-            estimatedTotals[i] = t
-            workDone += t
+        low, high = min(changed), max(changed) + 1
 
-        timeDelta = datetime.now() - startTime
+        def levelYs(lowSection, highSection):
+            return max(0, lowSection * 16), min(self.Height, highSection * 16)
 
-        if len(dirtyChunkPositions):
-            log.info(u"Completed in {0}, {1} per chunk".format(timeDelta, dirtyChunkPositions and timeDelta / len(
-                dirtyChunkPositions) or 0))
+        return {
+            "BlockLight": (levelYs(low - 1, high + 1), levelYs(low - 2, high + 2)),
+            "SkyLight": (levelYs(0, high + 1), levelYs(0, high + 2)),
+        }
 
-        return
+    def _lightsToSpread(self, ranges):
+        """ Returns the names of the light arrays to relight, and the sections of the chunks where they change, for the
+        ranges returned by _lightingRanges. """
+        (blockLightMin, blockLightMax), _ = ranges["BlockLight"]
+        (_, skyLightMax), _ = ranges["SkyLight"]
 
-    def _generateLightsIter(self, dirtyChunkPositions):
-        la = array(self.materials.lightAbsorption)
-        clip(la, 1, 15, la)
+        # the light arrays change below skyLightMax, or between the block light bounds in the nether and the end
+        if self.dimNo in (-1, 1):
+            return ("BlockLight",), xrange(blockLightMin >> 4, (blockLightMax + 15) >> 4)
+        return ("BlockLight", "SkyLight"), xrange(0, (skyLightMax + 15) >> 4)
 
+    def _generateLightsIter(self, dirtyChunkPositions):
         dirtyChunks = set(self.getChunk(*cPos) for cPos in dirtyChunkPositions)
+        if not dirtyChunks:
+            return
+
+        # relight all blocks in neighboring chunks in case their light source disappeared.
+        neighboringChunks = set()
+        for ch in dirtyChunks:
+            cx, cz = ch.chunkPosition
+            for dx, dz in itertools.product((-1, 0, 1), (-1, 0, 1)):
+                try:
+                    neighboringChunks.add(self.getChunk(cx + dx, cz + dz))
+                except (ChunkNotPresent, ChunkMalformed):
+                    continue
+
+        ranges = self._lightingRanges(dirtyChunks.union(ch for ch in neighboringChunks if ch.needsLighting))
+        lights, changedSections = self._lightsToSpread(ranges)
+        (blockLightMin, blockLightMax), _ = ranges["BlockLight"]
+        (_, skyLightMax), _ = ranges["SkyLight"]
 
         workDone = 0
         workTotal = len(dirtyChunks) * 29
@@ -625,44 +1192,44 @@ class ChunkedLevelMixin(MCLevel):
         log.info(progressInfo)
 
         for i, chunk in enumerate(dirtyChunks):
-            chunk.chunkChanged()
+            chunk.generateHeightMap()
+            chunk.genFastLights(skyLightMax)
             yield i, workTotal, progressInfo
-            assert chunk.dirty and chunk.needsLighting
 
         workDone += len(dirtyChunks)
         workTotal = len(dirtyChunks)
 
-        for ch in list(dirtyChunks):
-            # relight all blocks in neighboring chunks in case their light source disappeared.
-            cx, cz = ch.chunkPosition
-            for dx, dz in itertools.product((-1, 0, 1), (-1, 0, 1)):
-                try:
-                    ch = self.getChunk(cx + dx, cz + dz)
-                except (ChunkNotPresent, ChunkMalformed):
-                    continue
-                dirtyChunks.add(ch)
-                ch.dirty = True
-
-        dirtyChunks = sorted(dirtyChunks, key=lambda x: x.chunkPosition)
+        dirtyChunks = sorted(dirtyChunks | neighboringChunks, key=lambda x: x.chunkPosition)
         workTotal += len(dirtyChunks) * 28
 
         for i, chunk in enumerate(dirtyChunks):
-            chunk.BlockLight[:] = self.materials.lightEmission[chunk.Blocks]
-            chunk.dirty = True
+            chunk.BlockLight[..., blockLightMin:blockLightMax] = \
+                self.materials.lightEmission[chunk.Blocks[..., blockLightMin:blockLightMax]]
+            chunk.markSectionsDirty("light", changedSections)
+
+        startingDirtyChunks = dirtyChunks
+        for progress in self._disperseLightsIter(startingDirtyChunks, lights, ranges, changedSections,
+                                                 workDone, workTotal):
+            yield progress
+
+        for ch in startingDirtyChunks:
+            ch.needsLighting = False
+            if ch.unlitSections:
+                ch.unlitSections.clear()
+
+    def _disperseLightsIter(self, startingDirtyChunks, lights, ranges, changedSections, workDone, workTotal):
+        """ Spread the light of startingDirtyChunks into each other and their neighbours, pass after pass, until it
+        stops changing. Light only ever grows. Chunks it spreads into are marked dirty in changedSections.
+
+        Yields progress tuples continuing from workDone and workTotal.
+        """
+        la = array(self.materials.lightAbsorption)
+        clip(la, 1, 15, la)
 
         zeroChunk = ZeroChunk(self.Height)
         zeroChunk.BlockLight[:] = 0
         zeroChunk.SkyLight[:] = 0
 
-        startingDirtyChunks = dirtyChunks
-
-        oldLeftEdge = zeros((1, 16, self.Height), 'uint8')
-        oldBottomEdge = zeros((16, 1, self.Height), 'uint8')
-        oldChunk = zeros((16, 16, self.Height), 'uint8')
-        if self.dimNo in (-1, 1):
-            lights = ("BlockLight",)
-        else:
-            lights = ("BlockLight", "SkyLight")
         log.info(u"Dispersing light...")
 
         def clipLight(light):
@@ -675,6 +1242,15 @@ class ChunkedLevelMixin(MCLevel):
             zerochunkLight = getattr(zeroChunk, light)
             newDirtyChunks = list(startingDirtyChunks)
 
+            # light is only spread between miny and maxy; height and the arrays below are relative to miny
+            _, (miny, maxy) = ranges[light]
+            height = maxy - miny
+            oldLeftEdge = zeros((1, 16, height), 'uint8')
+            oldRightEdge = zeros((1, 16, height), 'uint8')
+            oldBottomEdge = zeros((16, 1, height), 'uint8')
+            oldTopEdge = zeros((16, 1, height), 'uint8')
+            oldChunk = zeros((16, 16, height), 'uint8')
+
             work = 0
 
             for i in range(14):
@@ -717,70 +1293,75 @@ class ChunkedLevelMixin(MCLevel):
                             neighboringChunks[dir] = self.getChunk(cx + dx, cz + dz)
                         except (ChunkNotPresent, ChunkMalformed):
                             neighboringChunks[dir] = zeroChunk
-                        neighboringChunks[dir].dirty = True
+                        else:
+                            neighboringChunks[dir].markSectionsDirty("light", changedSections)
 
-                    chunkLa = la[chunk.Blocks]
-                    chunkLight = getattr(chunk, light)
+                    chunkLa = la[chunk.Blocks[..., miny:maxy]]
+                    chunkLight = getattr(chunk, light)[..., miny:maxy]
                     oldChunk[:] = chunkLight[:]
 
                     ### Spread light toward -X
 
                     nc = neighboringChunks[FaceXDecreasing]
-                    ncLight = getattr(nc, light)
-                    oldLeftEdge[:] = ncLight[15:16, :, 0:self.Height]  # save the old left edge
+                    ncLight = getattr(nc, light)[..., miny:maxy]
+                    oldLeftEdge[:] = ncLight[15:16, :, 0:height]  # save the old left edge
 
                     # left edge
-                    newlight = (chunkLight[0:1, :, :self.Height] - la[nc.Blocks[15:16, :, 0:self.Height]])
+                    newlight = (chunkLight[0:1, :, :height] - la[nc.Blocks[15:16, :, miny:maxy]])
                     clipLight(newlight)
 
-                    maximum(ncLight[15:16, :, 0:self.Height], newlight, ncLight[15:16, :, 0:self.Height])
+                    maximum(ncLight[15:16, :, 0:height], newlight, ncLight[15:16, :, 0:height])
 
                     # chunk body
-                    newlight = (chunkLight[1:16, :, 0:self.Height] - chunkLa[0:15, :, 0:self.Height])
+                    newlight = (chunkLight[1:16, :, 0:height] - chunkLa[0:15, :, 0:height])
                     clipLight(newlight)
 
-                    maximum(chunkLight[0:15, :, 0:self.Height], newlight, chunkLight[0:15, :, 0:self.Height])
+                    maximum(chunkLight[0:15, :, 0:height], newlight, chunkLight[0:15, :, 0:height])
 
                     # right edge
                     nc = neighboringChunks[FaceXIncreasing]
-                    ncLight = getattr(nc, light)
+                    ncLight = getattr(nc, light)[..., miny:maxy]
 
-                    newlight = ncLight[0:1, :, :self.Height] - chunkLa[15:16, :, 0:self.Height]
+                    newlight = ncLight[0:1, :, :height] - chunkLa[15:16, :, 0:height]
                     clipLight(newlight)
 
-                    maximum(chunkLight[15:16, :, 0:self.Height], newlight, chunkLight[15:16, :, 0:self.Height])
+                    maximum(chunkLight[15:16, :, 0:height], newlight, chunkLight[15:16, :, 0:height])
 
                     ### Spread light toward +X
 
                     # right edge
                     nc = neighboringChunks[FaceXIncreasing]
-                    ncLight = getattr(nc, light)
+                    ncLight = getattr(nc, light)[..., miny:maxy]
+                    oldRightEdge[:] = ncLight[0:1, :, 0:height]  # save the old right edge
 
-                    newlight = (chunkLight[15:16, :, 0:self.Height] - la[nc.Blocks[0:1, :, 0:self.Height]])
+                    newlight = (chunkLight[15:16, :, 0:height] - la[nc.Blocks[0:1, :, miny:maxy]])
                     clipLight(newlight)
 
-                    maximum(ncLight[0:1, :, 0:self.Height], newlight, ncLight[0:1, :, 0:self.Height])
+                    maximum(ncLight[0:1, :, 0:height], newlight, ncLight[0:1, :, 0:height])
+
+                    if (oldRightEdge != ncLight[0:1, :, :height]).any():
+                        newDirtyChunks.append(nc)
 
                     # chunk body
-                    newlight = (chunkLight[0:15, :, 0:self.Height] - chunkLa[1:16, :, 0:self.Height])
+                    newlight = (chunkLight[0:15, :, 0:height] - chunkLa[1:16, :, 0:height])
                     clipLight(newlight)
 
-                    maximum(chunkLight[1:16, :, 0:self.Height], newlight, chunkLight[1:16, :, 0:self.Height])
+                    maximum(chunkLight[1:16, :, 0:height], newlight, chunkLight[1:16, :, 0:height])
 
                     # left edge
                     nc = neighboringChunks[FaceXDecreasing]
-                    ncLight = getattr(nc, light)
+                    ncLight = getattr(nc, light)[..., miny:maxy]
 
-                    newlight = ncLight[15:16, :, :self.Height] - chunkLa[0:1, :, 0:self.Height]
+                    newlight = ncLight[15:16, :, :height] - chunkLa[0:1, :, 0:height]
                     clipLight(newlight)
 
-                    maximum(chunkLight[0:1, :, 0:self.Height], newlight, chunkLight[0:1, :, 0:self.Height])
+                    maximum(chunkLight[0:1, :, 0:height], newlight, chunkLight[0:1, :, 0:height])
 
                     zerochunkLight[:] = 0  # zero the zero chunk after each direction
                     # so the lights it absorbed don't affect the next pass
 
                     # check if the left edge changed and dirty or compress the chunk appropriately
-                    if (oldLeftEdge != ncLight[15:16, :, :self.Height]).any():
+                    if (oldLeftEdge != ncLight[15:16, :, :height]).any():
                         # chunk is dirty
                         newDirtyChunks.append(nc)
 
@@ -788,68 +1369,72 @@ class ChunkedLevelMixin(MCLevel):
 
                     # bottom edge
                     nc = neighboringChunks[FaceZDecreasing]
-                    ncLight = getattr(nc, light)
-                    oldBottomEdge[:] = ncLight[:, 15:16, :self.Height]  # save the old bottom edge
+                    ncLight = getattr(nc, light)[..., miny:maxy]
+                    oldBottomEdge[:] = ncLight[:, 15:16, :height]  # save the old bottom edge
 
-                    newlight = (chunkLight[:, 0:1, :self.Height] - la[nc.Blocks[:, 15:16, :self.Height]])
+                    newlight = (chunkLight[:, 0:1, :height] - la[nc.Blocks[:, 15:16, miny:maxy]])
                     clipLight(newlight)
 
-                    maximum(ncLight[:, 15:16, :self.Height], newlight, ncLight[:, 15:16, :self.Height])
+                    maximum(ncLight[:, 15:16, :height], newlight, ncLight[:, 15:16, :height])
 
                     # chunk body
-                    newlight = (chunkLight[:, 1:16, :self.Height] - chunkLa[:, 0:15, :self.Height])
+                    newlight = (chunkLight[:, 1:16, :height] - chunkLa[:, 0:15, :height])
                     clipLight(newlight)
 
-                    maximum(chunkLight[:, 0:15, :self.Height], newlight, chunkLight[:, 0:15, :self.Height])
+                    maximum(chunkLight[:, 0:15, :height], newlight, chunkLight[:, 0:15, :height])
 
                     # top edge
                     nc = neighboringChunks[FaceZIncreasing]
-                    ncLight = getattr(nc, light)
+                    ncLight = getattr(nc, light)[..., miny:maxy]
 
-                    newlight = ncLight[:, 0:1, :self.Height] - chunkLa[:, 15:16, 0:self.Height]
+                    newlight = ncLight[:, 0:1, :height] - chunkLa[:, 15:16, 0:height]
                     clipLight(newlight)
 
-                    maximum(chunkLight[:, 15:16, 0:self.Height], newlight, chunkLight[:, 15:16, 0:self.Height])
+                    maximum(chunkLight[:, 15:16, 0:height], newlight, chunkLight[:, 15:16, 0:height])
 
                     ### Spread light toward +Z
 
                     # top edge
                     nc = neighboringChunks[FaceZIncreasing]
 
-                    ncLight = getattr(nc, light)
+                    ncLight = getattr(nc, light)[..., miny:maxy]
+                    oldTopEdge[:] = ncLight[:, 0:1, :height]  # save the old top edge
 
-                    newlight = (chunkLight[:, 15:16, :self.Height] - la[nc.Blocks[:, 0:1, :self.Height]])
+                    newlight = (chunkLight[:, 15:16, :height] - la[nc.Blocks[:, 0:1, miny:maxy]])
                     clipLight(newlight)
 
-                    maximum(ncLight[:, 0:1, :self.Height], newlight, ncLight[:, 0:1, :self.Height])
+                    maximum(ncLight[:, 0:1, :height], newlight, ncLight[:, 0:1, :height])
+
+                    if (oldTopEdge != ncLight[:, 0:1, :height]).any():
+                        newDirtyChunks.append(nc)
 
                     # chunk body
-                    newlight = (chunkLight[:, 0:15, :self.Height] - chunkLa[:, 1:16, :self.Height])
+                    newlight = (chunkLight[:, 0:15, :height] - chunkLa[:, 1:16, :height])
                     clipLight(newlight)
 
-                    maximum(chunkLight[:, 1:16, :self.Height], newlight, chunkLight[:, 1:16, :self.Height])
+                    maximum(chunkLight[:, 1:16, :height], newlight, chunkLight[:, 1:16, :height])
 
                     # bottom edge
                     nc = neighboringChunks[FaceZDecreasing]
-                    ncLight = getattr(nc, light)
+                    ncLight = getattr(nc, light)[..., miny:maxy]
 
-                    newlight = ncLight[:, 15:16, :self.Height] - chunkLa[:, 0:1, 0:self.Height]
+                    newlight = ncLight[:, 15:16, :height] - chunkLa[:, 0:1, 0:height]
                     clipLight(newlight)
 
-                    maximum(chunkLight[:, 0:1, 0:self.Height], newlight, chunkLight[:, 0:1, 0:self.Height])
+                    maximum(chunkLight[:, 0:1, 0:height], newlight, chunkLight[:, 0:1, 0:height])
 
                     zerochunkLight[:] = 0
 
-                    if (oldBottomEdge != ncLight[:, 15:16, :self.Height]).any():
+                    if (oldBottomEdge != ncLight[:, 15:16, :height]).any():
                         newDirtyChunks.append(nc)
 
-                    newlight = (chunkLight[:, :, 0:self.Height - 1] - chunkLa[:, :, 1:self.Height])
+                    newlight = (chunkLight[:, :, 0:height - 1] - chunkLa[:, :, 1:height])
                     clipLight(newlight)
-                    maximum(chunkLight[:, :, 1:self.Height], newlight, chunkLight[:, :, 1:self.Height])
+                    maximum(chunkLight[:, :, 1:height], newlight, chunkLight[:, :, 1:height])
 
-                    newlight = (chunkLight[:, :, 1:self.Height] - chunkLa[:, :, 0:self.Height - 1])
+                    newlight = (chunkLight[:, :, 1:height] - chunkLa[:, :, 0:height - 1])
                     clipLight(newlight)
-                    maximum(chunkLight[:, :, 0:self.Height - 1], newlight, chunkLight[:, :, 0:self.Height - 1])
+                    maximum(chunkLight[:, :, 0:height - 1], newlight, chunkLight[:, :, 0:height - 1])
 
                     if (oldChunk != chunkLight).any():
                         newDirtyChunks.append(chunk)
@@ -863,9 +1448,6 @@ class ChunkedLevelMixin(MCLevel):
 
                 work = 0
 
-        for ch in startingDirtyChunks:
-            ch.needsLighting = False
-
 
 def TagProperty(tagName, tagType, default_or_func=None):
     def getter(self):
@@ -885,7 +1467,17 @@ def TagProperty(tagName, tagType, default_or_func=None):
 
 
 class AnvilWorldFolder(object):
-    def __init__(self, filename):
+    """
+    The region files of a world or dimension folder.
+
+    Which chunks each region file holds is cached in a chunk index, saved in the folder as CHUNK_INDEX_NAME. An entry
+    is trusted if the region file's modification time and size still match, so listing chunks and testing for them
+    does not open region files. Region files that are open are asked directly.
+    """
+    CHUNK_INDEX_NAME = "##MCEDIT.CHUNKS##.dat"
+    CHUNK_INDEX_VERSION = 1
+
+    def __init__(self, filename, saveIndex=True):
         if not os.path.exists(filename):
             os.mkdir(filename)
 
@@ -894,6 +1486,13 @@ class AnvilWorldFolder(object):
 
         self.filename = filename
         self.regionFiles = {}
+        self.deferHeaders = False
+        self.saveIndex = saveIndex
+
+        self._regionFolder = None
+        self._chunkIndex = None  # (rx, rz) -> (mtime, size, array of 1024 bools); loaded on first use
+        self._checkedRegions = set()  # index entries known to match their region files
+        self._chunkIndexDirty = False
 
     # --- File paths ---
 
@@ -913,13 +1512,16 @@ class AnvilWorldFolder(object):
     # --- Region files ---
 
     def getRegionFilename(self, rx, rz):
-        return os.path.join(self.getFolderPath("region", False), "r.%s.%s.%s" % (rx, rz, "mca"))
+        if self._regionFolder is None:
+            self._regionFolder = self.getFolderPath("region", False)
+        return os.path.join(self._regionFolder, "r.%s.%s.%s" % (rx, rz, "mca"))
 
     def getRegionFile(self, rx, rz):
         regionFile = self.regionFiles.get((rx, rz))
         if regionFile:
             return regionFile
         regionFile = MCRegionFile(self.getRegionFilename(rx, rz), (rx, rz))
+        regionFile.deferHeader = self.deferHeaders
         self.regionFiles[rx, rz] = regionFile
         return regionFile
 
@@ -929,15 +1531,38 @@ class AnvilWorldFolder(object):
         return self.getRegionFile(rx, rz)
 
     def closeRegions(self):
-        for rf in self.regionFiles.values():
+        for (rx, rz), rf in self.regionFiles.items():
             rf.close()
+            if os.path.exists(rf.path):
+                self._updateChunkIndex(rx, rz, rf.offsets != 0)
 
         self.regionFiles = {}
+        self.saveChunkIndex()
+
+    def flushHeaders(self):
+        for rf in self.regionFiles.values():
+            rf.flushHeader()
+
+    @contextmanager
+    def batch(self):
+        """ Defer the header writes of every region file until the end of the with block. """
+        deferHeaders = self.deferHeaders
+        self.deferHeaders = True
+        for rf in self.regionFiles.values():
+            rf.deferHeader = True
+        try:
+            yield self
+        finally:
+            self.deferHeaders = deferHeaders
+            if not deferHeaders:
+                for rf in self.regionFiles.values():
+                    rf.deferHeader = False
+                self.flushHeaders()
 
     # --- Chunks and chunk listing ---
 
     @staticmethod
-    def tryLoadRegionFile(filepath):
+    def regionCoordsFromFilename(filepath):
         filename = os.path.basename(filepath)
         bits = filename.split('.')
         if len(bits) < 4 or bits[0] != 'r' or bits[3] != "mca":
@@ -948,7 +1573,15 @@ class AnvilWorldFolder(object):
         except ValueError:
             return None
 
-        return MCRegionFile(filepath, (rx, rz))
+        return rx, rz
+
+    @classmethod
+    def tryLoadRegionFile(cls, filepath):
+        regionCoords = cls.regionCoordsFromFilename(filepath)
+        if regionCoords is None:
+            return None
+
+        return MCRegionFile(filepath, regionCoords)
 
     def findRegionFiles(self):
         regionDir = self.getFolderPath("region", generation=True)
@@ -959,39 +1592,125 @@ class AnvilWorldFolder(object):
 
     def listChunks(self):
         chunks = set()
+        self.flushHeaders()
 
         for filepath in self.findRegionFiles():
-            regionFile = self.tryLoadRegionFile(filepath)
-            if regionFile is None:
+            regionCoords = self.regionCoordsFromFilename(filepath)
+            if regionCoords is None:
                 continue
 
-            if regionFile.offsets.any():
-                rx, rz = regionFile.regionCoords
-                self.regionFiles[rx, rz] = regionFile
+            rx, rz = regionCoords
+            present = self._regionChunks(rx, rz)
+            if present is None:
+                continue
 
-                for index, offset in enumerate(regionFile.offsets):
-                    if offset:
-                        cx = index & 0x1f
-                        cz = index >> 5
+            if present.any():
+                for index in flatnonzero(present):
+                    cx = index & 0x1f
+                    cz = index >> 5
 
-                        cx += rx << 5
-                        cz += rz << 5
+                    cx += rx << 5
+                    cz += rz << 5
 
-                        chunks.add((cx, cz))
-            else:
+                    chunks.add((cx, cz))
+            elif regionCoords not in self.regionFiles:
                 log.info(u"Removing empty region file {0}".format(filepath))
-                regionFile.close()
-                os.unlink(regionFile.path)
+                os.unlink(filepath)
+                self._forgetRegion(rx, rz)
 
+        self.saveChunkIndex()
         return chunks
 
     def containsChunk(self, cx, cz):
-        rx = cx >> 5
-        rz = cz >> 5
-        if not os.path.exists(self.getRegionFilename(rx, rz)):
-            return False
+        present = self._regionChunks(cx >> 5, cz >> 5)
+        return present is not None and bool(present[(cx & 0x1f) + (cz & 0x1f) * 32])
 
-        return self.getRegionForChunk(cx, cz).containsChunk(cx, cz)
+    # --- Chunk index ---
+
+    def _loadChunkIndex(self):
+        if self._chunkIndex is not None:
+            return self._chunkIndex
+
+        self._chunkIndex = {}
+        path = self.getFilePath(self.CHUNK_INDEX_NAME)
+        if os.path.exists(path):
+            try:
+                root_tag = nbt.load(path)
+                if root_tag["Version"].value == self.CHUNK_INDEX_VERSION:
+                    for regionTag in root_tag["Regions"]:
+                        present = unpackbits(regionTag["Chunks"].value).astype(bool)
+                        self._chunkIndex[regionTag["x"].value, regionTag["z"].value] = (
+                            regionTag["MTime"].value, regionTag["Size"].value, present)
+            except Exception, e:
+                log.info(u"Ignoring unreadable chunk index {0}: {1!r}".format(path, e))
+                self._chunkIndex = {}
+
+        return self._chunkIndex
+
+    def saveChunkIndex(self):
+        if not (self.saveIndex and self._chunkIndexDirty):
+            return
+
+        regions = nbt.TAG_List()
+        for (rx, rz), (mtime, size, present) in sorted(self._chunkIndex.iteritems()):
+            regionTag = nbt.TAG_Compound()
+            regionTag["x"] = nbt.TAG_Int(rx)
+            regionTag["z"] = nbt.TAG_Int(rz)
+            regionTag["MTime"] = nbt.TAG_Double(mtime)
+            regionTag["Size"] = nbt.TAG_Long(size)
+            regionTag["Chunks"] = nbt.TAG_Byte_Array(packbits(present))
+            regions.append(regionTag)
+
+        root_tag = nbt.TAG_Compound()
+        root_tag["Version"] = nbt.TAG_Int(self.CHUNK_INDEX_VERSION)
+        root_tag["Regions"] = regions
+        try:
+            root_tag.save(self.getFilePath(self.CHUNK_INDEX_NAME))
+            self._chunkIndexDirty = False
+        except IOError, e:
+            log.info(u"Could not save chunk index: {0!r}".format(e))
+
+    def _regionChunks(self, rx, rz):
+        """ Returns an array of 1024 bools telling which chunks the region file holds, indexed by
+        (cx & 0x1f) + (cz & 0x1f) * 32, or None if there is no region file. """
+        regionFile = self.regionFiles.get((rx, rz))
+        if regionFile is not None:
+            return regionFile.offsets != 0
+
+        index = self._loadChunkIndex()
+        entry = index.get((rx, rz))
+        if (rx, rz) in self._checkedRegions:
+            return entry and entry[2]
+
+        self._checkedRegions.add((rx, rz))
+        try:
+            stat = os.stat(self.getRegionFilename(rx, rz))
+        except OSError:
+            self._forgetRegion(rx, rz)
+            return None
+
+        if entry is not None and entry[:2] == (stat.st_mtime, stat.st_size):
+            return entry[2]
+
+        with file(self.getRegionFilename(rx, rz), "rb") as f:
+            header = f.read(MCRegionFile.SECTOR_BYTES)
+        present = zeros(1024, bool)
+        offsets = fromstring(header[:len(header) & ~3], '>u4')
+        present[:len(offsets)] = offsets != 0
+        self._updateChunkIndex(rx, rz, present, stat)
+        return present
+
+    def _updateChunkIndex(self, rx, rz, present, stat=None):
+        if stat is None:
+            stat = os.stat(self.getRegionFilename(rx, rz))
+        self._loadChunkIndex()[rx, rz] = (stat.st_mtime, stat.st_size, present)
+        self._checkedRegions.add((rx, rz))
+        self._chunkIndexDirty = True
+
+    def _forgetRegion(self, rx, rz):
+        if self._loadChunkIndex().pop((rx, rz), None) is not None:
+            self._chunkIndexDirty = True
+        self._checkedRegions.add((rx, rz))
 
     def deleteChunk(self, cx, cz):
         r = cx >> 5, cz >> 5
@@ -1002,6 +1721,7 @@ class AnvilWorldFolder(object):
                 rf.close()
                 os.unlink(rf.path)
                 del self.regionFiles[r]
+                self._forgetRegion(*r)
 
     def readChunk(self, cx, cz):
         if not self.containsChunk(cx, cz):
@@ -1057,7 +1777,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         if not os.path.isdir(filename):
             raise IOError('File is not a Minecraft Alpha world')
 
-        self.worldFolder = AnvilWorldFolder(filename)
+        self.worldFolder = AnvilWorldFolder(filename, saveIndex=not readonly)
         self.filename = self.worldFolder.getFilePath("level.dat")
         self.readonly = readonly
         if not readonly:
@@ -1072,8 +1792,8 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
             if os.path.exists(workFolderPath2):
                 shutil.rmtree(workFolderPath2, True)
 
-            self.unsavedWorkFolder = AnvilWorldFolder(workFolderPath)
-            self.fileEditsFolder = AnvilWorldFolder(workFolderPath2)
+            self.unsavedWorkFolder = ChunkJournal(workFolderPath)
+            self.fileEditsFolder = AnvilWorldFolder(workFolderPath2, saveIndex=False)
 
             self.editFileNumber = 1
 
@@ -1081,7 +1801,10 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         self._loadedChunks = weakref.WeakValueDictionary()
 
         # maps (cx, cz) pairs to AnvilChunkData
-        self._loadedChunkData = {}
+        self._loadedChunkData = ChunkDataCache()
+
+        # maps (cx, cz) pairs to AsyncResults for chunks being read by prefetchChunk
+        self._pendingChunkData = {}
         self.recentChunks = collections.deque(maxlen=20)
 
         self.chunksNeedingLighting = set()
@@ -1205,6 +1928,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
     def saveInPlaceGen(self):
         if self.readonly:
             raise IOError("World is opened read only. (%s)"%self.filename)
+        self._discardPrefetchedChunks()
         self.saving = True
         self.checkSessionLock()
 
@@ -1213,26 +1937,26 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
                 yield
 
         dirtyChunkCount = 0
-        for chunk in self._loadedChunkData.itervalues():
-            cx, cz = chunk.chunkPosition
-            if chunk.dirty:
-                data = chunk.savedTagData()
-                dirtyChunkCount += 1
-                self.worldFolder.saveChunk(cx, cz, data)
-                chunk.dirty = False
-            yield
-
-        for cx, cz in self.unsavedWorkFolder.listChunks():
-            if (cx, cz) not in self._loadedChunkData:
-                data = self.unsavedWorkFolder.readChunk(cx, cz)
-                self.worldFolder.saveChunk(cx, cz, data)
-                dirtyChunkCount += 1
-            yield
-
-        self.unsavedWorkFolder.closeRegions()
-        shutil.rmtree(self.unsavedWorkFolder.filename, True)
-        if not os.path.exists(self.unsavedWorkFolder.filename):
-            os.mkdir(self.unsavedWorkFolder.filename)
+        if self.saveProcesses:
+            for dirtyChunkCount in self._savePipelinedGen():
+                yield
+        else:
+            with self.worldFolder.batch():
+                for chunk in self._loadedChunkData.itervalues():
+                    cx, cz = chunk.chunkPosition
+                    if chunk.dirty:
+                        data = chunk.savedTagData()
+                        dirtyChunkCount += 1
+                        self.worldFolder.saveChunk(cx, cz, data)
+                        chunk.dirty = False
+                    yield
+
+            count = 0
+            for count in self._saveJournalGen():
+                yield
+            dirtyChunkCount += count
+
+        self.unsavedWorkFolder.clear()
 
         for path, tag in self.playerTagCache.iteritems():
             tag.save(path)
@@ -1248,12 +1972,76 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         self.saving = False
         log.info(u"Saved {0} chunks (dim {1})".format(dirtyChunkCount, self.dimNo))
 
+    def _savePipelinedGen(self):
+        """
+        Save the dirty chunks and the chunks in the unsaved work folder, one region file at a time. A pool of
+        saveProcesses processes packs and compresses the dirty chunks while this thread writes finished regions with
+        MCRegionFile.saveChunks. Chunks in the unsaved work folder are copied as compressed data.
+
+        Yields the number of chunks saved so far after each region.
+        """
+
+        def regionOf(cPos):
+            return cPos[0] >> 5, cPos[1] >> 5
+
+        saved = 0
+        pending = {}
+        pool = multiprocessing.Pool(self.saveProcesses)
+
+        def submit(cPos):
+            pending[cPos] = pool.apply_async(packChunk, (self._loadedChunkData[cPos].packJob(),))
+
+        try:
+            dirtyChunks = sorted((cPos for cPos, chunkData in self._loadedChunkData.iteritems() if chunkData.dirty),
+                                 key=regionOf)
+            packed = ((cPos, pending.pop(cPos).get())
+                      for cPos in readahead.lookahead(dirtyChunks, submit, self.saveProcesses * 4))
+
+            for (rx, rz), group in itertools.groupby(packed, lambda (cPos, result): regionOf(cPos)):
+                group = list(group)
+                batch = [(cx, cz, data, MCRegionFile.VERSION_DEFLATE) for (cx, cz), (data, _) in group]
+                self.worldFolder.getRegionFile(rx, rz).saveChunks(batch)
+                for cPos, (_, packedSections) in group:
+                    chunkData = self._loadedChunkData[cPos]
+                    chunkData.packedSectionsSaved(packedSections)
+                    chunkData.dirty = False
+
+                saved += len(batch)
+                yield saved
+        finally:
+            pool.terminate()
+
+        for count in self._saveJournalGen():
+            yield saved + count
+
+    def _saveJournalGen(self):
+        """
+        Copy the chunks in the unsaved work folder that are not loaded into the world's region files, one batch per
+        region. Their compressed payloads are copied as they are. Yields the number of chunks copied so far after
+        each region.
+        """
+
+        def regionOf(cPos):
+            return cPos[0] >> 5, cPos[1] >> 5
+
+        copied = 0
+        unsavedChunks = sorted((cPos for cPos in self.unsavedWorkFolder.listChunks()
+                                if cPos not in self._loadedChunkData), key=regionOf)
+
+        for (rx, rz), group in itertools.groupby(unsavedChunks, regionOf):
+            batch = [(cx, cz) + self.unsavedWorkFolder.readCompressedChunk(cx, cz) for cx, cz in group]
+            self.worldFolder.getRegionFile(rx, rz).saveChunks(batch)
+
+            copied += len(batch)
+            yield copied
+
     def unload(self):
         """
         Unload all chunks and close all open filehandles.
         """
         if self.saving:
             raise ChunkAccessDenied
+        self._discardPrefetchedChunks()
         self.worldFolder.closeRegions()
         if not self.readonly:
             self.unsavedWorkFolder.closeRegions()
@@ -1277,7 +2065,10 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
 
     # --- Resource limits ---
 
-    loadedChunkLimit = 400
+    loadedChunkLimit = 400  # chunks per lighting batch
+    loadedChunkMemoryLimit = 128  # megabytes of chunk data kept in memory before evicting
+    saveProcesses = 0  # processes that pack and compress chunks while saving. 0 saves on this thread only.
+    sectionOrderArrays = False  # keep unpacked chunk arrays in the sections' y,z,x order, behind x,z,y views
 
     # --- Constants ---
 
@@ -1550,6 +2341,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
 
                 # Only source chunk loaded. Discard destination chunk and save source chunk in its place.
                 self._loadedChunkData.pop((cx, cz), None)
+                self._takePrefetchedChunkData(cx, cz)
                 self.unsavedWorkFolder.saveChunk(cx, cz, sourceChunk.savedTagData())
                 return
         else:
@@ -1561,6 +2353,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
                 log.debug("No chunk loaded. Using world folder.copyChunkFrom")
                 # Neither chunk loaded. Copy via world folders.
                 self._loadedChunkData.pop((cx, cz), None)
+                self._takePrefetchedChunkData(cx, cz)
 
                 # If the source chunk is dirty, write it to the work folder.
                 chunkData = world._loadedChunkData.pop((cx, cz), None)
@@ -1576,51 +2369,117 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
                 self.unsavedWorkFolder.copyChunkFrom(sourceFolder, cx, cz)
 
     def _getChunkBytes(self, cx, cz):
+        return self._chunkFolder(cx, cz).readChunk(cx, cz)
+
+    def _chunkFolder(self, cx, cz):
+        """ Returns the folder holding the most recent copy of the chunk, which is the work folder if the chunk was
+        modified and unloaded since the last save. """
         if not self.readonly and self.unsavedWorkFolder.containsChunk(cx, cz):
-            return self.unsavedWorkFolder.readChunk(cx, cz)
+            return self.unsavedWorkFolder
         else:
-            return self.worldFolder.readChunk(cx, cz)
+            return self.worldFolder
+
+    def _readChunkData(self, source, cx, cz):
+        """ Read and decode a chunk from source, which may be a world folder or one of its region files. """
+        try:
+            data = source.readChunk(cx, cz)
+            root_tag = nbt.load(buf=data, lazy=True)
+            return AnvilChunkData(self, (cx, cz), root_tag)
+        except (MemoryError, ChunkNotPresent):
+            raise
+        except Exception, e:
+            raise ChunkMalformed("Chunk {0} had an error: {1!r}".format((cx, cz), e), sys.exc_info()[2])
 
     def _getChunkData(self, cx, cz):
-        chunkData = self._loadedChunkData.get((cx, cz))
+        chunkData = self._loadedChunkData.lookup((cx, cz))
         if chunkData is not None:
             return chunkData
 
         if self.saving:
             raise ChunkAccessDenied
 
-        try:
-            data = self._getChunkBytes(cx, cz)
-            root_tag = nbt.load(buf=data)
-            chunkData = AnvilChunkData(self, (cx, cz), root_tag)
-        except (MemoryError, ChunkNotPresent):
-            raise
-        except Exception, e:
-            raise ChunkMalformed("Chunk {0} had an error: {1!r}".format((cx, cz), e), sys.exc_info()[2])
-
-        if not self.readonly and self.unsavedWorkFolder.containsChunk(cx, cz):
-            chunkData.dirty = True
+        chunkData = self._takePrefetchedChunkData(cx, cz)
+        if chunkData is None:
+            folder = self._chunkFolder(cx, cz)
+            chunkData = self._readChunkData(folder, cx, cz)
+            chunkData.dirty = folder is not self.worldFolder
 
         self._storeLoadedChunkData(chunkData)
 
         return chunkData
 
-    def _storeLoadedChunkData(self, chunkData):
-        if len(self._loadedChunkData) > self.loadedChunkLimit:
-            # Try to find a chunk to unload. The chunk must not be in _loadedChunks, which contains only chunks that
-            # are in use by another object. If the chunk is dirty, save it to the temporary folder.
-            if not self.readonly:
-                self.checkSessionLock()
-            for (ocx, ocz), oldChunkData in self._loadedChunkData.items():
-                if (ocx, ocz) not in self._loadedChunks:
-                    if oldChunkData.dirty and not self.readonly:
-                        data = oldChunkData.savedTagData()
-                        self.unsavedWorkFolder.saveChunk(ocx, ocz, data)
-
-                    del self._loadedChunkData[ocx, ocz]
-                    break
+    # --- Chunk readahead ---
+
+    def prefetchChunk(self, cx, cz):
+        """ Read and decode the chunk on a worker thread. The region file is looked up here, because the folders are
+        not safe to use from several threads; the worker only reads from the region file it is given. """
+        cPos = (cx, cz)
+        if cPos in self._loadedChunkData or cPos in self._pendingChunkData:
+            return
+        if self.saving or not self.containsChunk(cx, cz):
+            return
 
+        folder = self._chunkFolder(cx, cz)
+        if not folder.containsChunk(cx, cz):
+            return  # created but never saved
+        regionFile = folder.getRegionForChunk(cx, cz)
+
+        def readChunk():
+            chunkData = self._readChunkData(regionFile, cx, cz)
+            chunkData.dirty = folder is not self.worldFolder
+            return chunkData
+
+        self._pendingChunkData[cPos] = readahead.workerPool().apply_async(readChunk)
+
+    def _takePrefetchedChunkData(self, cx, cz):
+        """ Wait for a prefetch of this chunk, if one was started. Errors are not raised here, the chunk is read again
+        on this thread instead so they surface with the usual exceptions. """
+        pending = self._pendingChunkData.pop((cx, cz), None)
+        if pending is None:
+            return None
+        try:
+            return pending.get()
+        except Exception, e:
+            log.debug(u"Prefetching chunk {0} failed: {1!r}".format((cx, cz), e))
+            return None
+
+    def _discardPrefetchedChunks(self):
+        """ Forget about background reads. Called before anything that rewrites the region files they read from. """
+        for pending in self._pendingChunkData.values():
+            pending.wait()
+        self._pendingChunkData.clear()
+
+    def _storeLoadedChunkData(self, chunkData):
         self._loadedChunkData[chunkData.chunkPosition] = chunkData
+        self._evictChunkData(keep=chunkData.chunkPosition)
+
+    def _evictChunkData(self, keep=None):
+        cache = self._loadedChunkData
+        memoryLimit = self.loadedChunkMemoryLimit * 1048576
+        if cache.memoryUsage <= memoryLimit:
+            return
+
+        # Unload the least recently used chunks until the cache fits its budget again. Chunks in _loadedChunks are in
+        # use by another object and pinned chunks are being worked on, so they are skipped. A chunk found in use is
+        # given a second chance by moving it to the recently used end. Dirty chunks are saved to the temporary folder.
+        if not self.readonly:
+            self.checkSessionLock()
+        for cPos in cache.evictionCandidates():
+            if cPos == keep:
+                continue
+            if cPos in self._loadedChunks:
+                cache.touch(cPos)
+                continue
+
+            oldChunkData = cache[cPos]
+            if oldChunkData.dirty and not self.readonly:
+                data = oldChunkData.savedTagData()
+                self.unsavedWorkFolder.saveChunk(cPos[0], cPos[1], data)
+
+            del cache[cPos]
+            cache.evictions += 1
+            if cache.memoryUsage <= memoryLimit:
+                break
 
     def getChunk(self, cx, cz):
         """ read the chunk from disk, load it, and return it."""
@@ -1643,6 +2502,54 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         for cx, cz in box.chunkPositions:
             self.markDirtyChunk(cx, cz)
 
+    # --- Chunk cache ---
+
+    def pinChunks(self, chunkPositions):
+        """ Keep the given chunks in memory until they are unpinned. Pins are counted, so every call must be matched by
+        a call to unpinChunks. """
+        for cPos in chunkPositions:
+            self._loadedChunkData.pin(tuple(cPos))
+
+    def unpinChunks(self, chunkPositions):
+        for cPos in chunkPositions:
+            self._loadedChunkData.unpin(tuple(cPos))
+
+    def pinChunksInBox(self, box):
+        self.pinChunks(box.chunkPositions)
+
+    def unpinChunksInBox(self, box):
+        self.unpinChunks(box.chunkPositions)
+
+    @contextmanager
+    def pinned(self, box):
+        """ Load the chunks of box, reading them ahead in parallel, and keep them and their AnvilChunks in memory until
+        the end of the with block, so a filter can visit them in any order without loading any of them twice. Chunks
+        outside the box are unloaded as usual. If the pinned chunks put the cache over its memory budget, chunks are
+        unloaded when the block ends. """
+        chunkPositions = [cPos for cPos in box.chunkPositions if self.containsChunk(*cPos)]
+        self.pinChunks(chunkPositions)
+        chunks = []
+        try:
+            chunks.extend(self.getChunk(*cPos) for cPos in self.readaheadChunkPositions(chunkPositions))
+            yield self
+        finally:
+            del chunks[:]
+            self.unpinChunks(chunkPositions)
+            self._evictChunkData()
+
+    @property
+    def chunkCacheStats(self):
+        """ Returns a dict of counters describing the chunk data cache. """
+        cache = self._loadedChunkData
+        return {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "evictions": cache.evictions,
+            "chunks": len(cache),
+            "pinned": cache.pinnedCount,
+            "memoryUsage": cache.memoryUsage,
+        }
+
     def listDirtyChunks(self):
         for cPos, chunkData in self._loadedChunkData.iteritems():
             if chunkData.dirty:
@@ -1656,7 +2563,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         xInChunk = x & 0xf
         zInChunk = z & 0xf
 
-        ch = self.getChunk(xc, zc)
+        ch = self._getChunkForReading(xc, zc)
 
         heightMap = ch.HeightMap
 
@@ -1665,16 +2572,37 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
     # --- Biome manipulation ---
 
     def biomeAt(self, x, z):
-        biomes = self.getChunk(int(x/16),int(z/16)).root_tag["Level"]["Biomes"].value
-        xChunk = int(x/16) * 16
-        zChunk = int(z/16) * 16
-        return biomes[(z - zChunk) * 16 + (x - xChunk)]
+        return self._getChunkForReading(x >> 4, z >> 4).Biomes[z & 0xf, x & 0xf]  # Biomes is indexed [z,x]
 
     def setBiomeAt(self, x, z, biomeID):
-        biomes = self.getChunk(int(x/16), int(z/16)).root_tag["Level"]["Biomes"].value
-        xChunk = int(x/16) * 16
-        zChunk = int(z/16) * 16
-        biomes[(z - zChunk) * 16 + (x - xChunk)] = biomeID
+        chunk = self.getChunk(x >> 4, z >> 4)
+        chunk.Biomes[z & 0xf, x & 0xf] = biomeID
+        chunk.dirty = True
+
+    def _biomeSlices(self, box):
+        """ Yields each existing chunk under box, the x,z slices of its Biomes.T and the matching slices of a box-sized
+        array. """
+        columns = BoundingBox((box.minx, 0, box.minz), (box.width, 1, box.length))
+        for chunk, slices, (x, y, z) in self.getChunkSlices(columns, readahead=True):
+            sx, sz = slices[:2]
+            yield chunk, (sx, sz), (slice(x, x + sx.stop - sx.start), slice(z, z + sz.stop - sz.start))
+
+    def biomes(self, box):
+        """ Returns the biome IDs of the columns of box in an array indexed [x,z] relative to the box origin. Columns in
+        missing chunks are 255, the same as an uncalculated biome. """
+        result = zeros((box.width, box.length), 'uint8')
+        result[:] = 255
+        for chunk, slices, dest in self._biomeSlices(box):
+            result[dest] = chunk.Biomes.T[slices]
+        return result
+
+    def setBiomes(self, box, biomes):
+        """ Set the biomes of the columns of box. biomes is a biome ID, or an array indexed [x,z] relative to the box
+        origin, like the one returned by biomes(box). Columns in missing chunks are skipped. """
+        biomes = array(biomes)
+        for chunk, slices, dest in self._biomeSlices(box):
+            chunk.Biomes.T[slices] = biomes if biomes.ndim == 0 else biomes[dest]
+            chunk.dirty = True
 
     # --- Entities and TileEntities ---
 
@@ -1688,7 +2616,6 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
             return None
             # raise Error, can't find a chunk?
         chunk.addEntity(entityTag)
-        chunk.dirty = True
 
     def tileEntityAt(self, x, y, z):
         chunk = self.getChunk(x >> 4, z >> 4)
@@ -1706,7 +2633,27 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
             return
             # raise Error, can't find a chunk?
         chunk.addTileEntity(tileEntityTag)
-        chunk.dirty = True
+
+    def _addToChunks(self, tags, pos, addName):
+        """ Sort tags by chunk and hand each chunk's share to its method addName in one call. """
+        byChunk = collections.defaultdict(list)
+        for tag in tags:
+            assert isinstance(tag, nbt.TAG_Compound)
+            if 'x' not in tag:
+                continue
+            x, y, z = pos(tag)
+            byChunk[x >> 4, z >> 4].append(tag)
+
+        for cPos, chunkTags in byChunk.iteritems():
+            try:
+                chunk = self.getChunk(*cPos)
+            except (ChunkNotPresent, ChunkMalformed):
+                continue
+            getattr(chunk, addName)(chunkTags)
+
+    def addTileEntities(self, tileEntities):
+        """ Add many tile entities, sorting them by chunk first so each chunk's list is merged once. """
+        self._addToChunks(tileEntities, TileEntity.pos, "addTileEntities")
 
     def addTileTick(self, tickTag):
         assert isinstance(tickTag, nbt.TAG_Compound)
@@ -1719,25 +2666,28 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         except(ChunkNotPresent, ChunkMalformed):
             return
         chunk.addTileTick(tickTag)
-        chunk.dirty = True
+
+    def addTileTicks(self, tileTicks):
+        """ Add many tile ticks, sorting them by chunk first so each chunk's list is merged once. """
+        self._addToChunks(tileTicks, TileTick.pos, "addTileTicks")
 
     def getEntitiesInBox(self, box):
         entities = []
-        for chunk, slices, point in self.getChunkSlices(box):
+        for chunk, slices, point in self._getChunkSlicesForReading(box):
             entities += chunk.getEntitiesInBox(box)
 
         return entities
 
     def getTileEntitiesInBox(self, box):
         tileEntites = []
-        for chunk, slices, point in self.getChunkSlices(box):
+        for chunk, slices, point in self._getChunkSlicesForReading(box):
             tileEntites += chunk.getTileEntitiesInBox(box)
 
         return tileEntites
 
     def getTileTicksInBox(self, box):
         tileticks = []
-        for chunk, slices, point in self.getChunkSlices(box):
+        for chunk, slices, point in self._getChunkSlicesForReading(box):
             tileticks += chunk.getTileTicksInBox(box)
 
         return tileticks
@@ -1813,6 +2763,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         return self.createChunks(box.chunkPositions)
 
     def deleteChunk(self, cx, cz):
+        self._takePrefetchedChunkData(cx, cz)
         self.worldFolder.deleteChunk(cx, cz)
         if self._allChunks is not None:
             self._allChunks.discard((cx, cz))
@@ -1837,6 +2788,14 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
 
         return ret
 
+    # --- Forks ---
+
+    def fork(self):
+        """ Returns a LevelFork of this level. See LevelFork. """
+        from fork import fork  # fork imports this module
+
+        return fork(self)
+
     # --- Player and spawn manipulation ---
 
     def playerSpawnPosition(self, player=None):
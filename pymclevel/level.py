@@ -6,6 +6,7 @@ Created on Jul 22, 2011
 
 from box import BoundingBox
 from collections import defaultdict
+from contextlib import contextmanager
 from entity import Entity, TileEntity, TileTick
 import itertools
 from logging import getLogger
@@ -13,8 +14,11 @@ import materials
 from math import floor
 from mclevelbase import ChunkMalformed, ChunkNotPresent
 import nbt
-from numpy import argmax, swapaxes, zeros, zeros_like
+from numpy import arange, argmax, asarray, broadcast_arrays, clip, cumsum, flatnonzero, swapaxes, zeros, zeros_like
+from operator import itemgetter
 import os.path
+from readahead import lookahead
+from surface import computeSurfaceMap, updateSurfaceMap
 
 log = getLogger(__name__)
 
@@ -114,6 +118,25 @@ def getSlices(box, height):
             yield (cx, cz), slices, point
 
 
+def mergeAtPositions(tags, newTags, pos):
+    """ Returns the tags of the list tags with newTags added, leaving out the old tags at the positions of the new ones,
+    and all but the last of the new tags sharing a position. This is what adding newTags one at a time with
+    addTileEntity or addTileTick gives, with the tags keyed by position instead of searched for each new tag. pos is
+    TileEntity.pos or TileTick.pos. """
+    newTags = list(newTags)
+    for tag in newTags:
+        assert isinstance(tag, nbt.TAG_Compound)
+    if not newTags:
+        return list(tags)
+
+    newPositions = [tuple(pos(t)) for t in newTags]
+    lastAt = dict(zip(newPositions, newTags))
+    newIDs = set(id(t) for t in newTags)
+
+    kept = [t for t in tags if id(t) not in newIDs and tuple(pos(t)) not in lastAt] if len(tags) else []
+    return kept + [t for p, t in zip(newPositions, newTags) if lastAt[p] is t]
+
+
 class MCLevel(object):
     """ MCLevel is an abstract class providing many routines to the different level types,
     including a common copyEntitiesFrom built on class-specific routines, and
@@ -219,6 +242,9 @@ class MCLevel(object):
     def addTileEntity(self, entityTag):
         pass
 
+    def addTileEntities(self, tileEntities):
+        pass
+
     def addTileTick(self, entityTag):
         pass
 
@@ -253,14 +279,45 @@ class MCLevel(object):
         being a chunked level format."""
         return itertools.product(xrange(0, self.Width + 15 >> 4), xrange(0, self.Length + 15 >> 4))
 
-    def getChunks(self, chunks=None):
+    def getChunks(self, chunks=None, readahead=False):
         """ pass a list of chunk coordinate tuples to get an iterator yielding
         AnvilChunks. pass nothing for an iterator of every chunk in the level.
-        the chunks are automatically loaded."""
+        the chunks are automatically loaded. see readaheadChunkPositions for
+        the readahead argument."""
         if chunks is None:
             chunks = self.allChunks
+        chunks = self.readaheadChunkPositions(chunks, readahead)
         return (self.getChunk(cx, cz) for (cx, cz) in chunks if self.containsChunk(cx, cz))
 
+    # --- Chunk readahead ---
+
+    readaheadDepth = 8  # chunks loaded ahead of the caller when readahead=True
+
+    def prefetchChunk(self, cx, cz):
+        """ Start loading the chunk in the background, if the level supports it. The next getChunk
+        call for this chunk picks up the result. """
+        pass
+
+    @contextmanager
+    def pinned(self, box):
+        """ Keep the chunks of box loaded until the end of the with block. Levels that keep all of their blocks in
+        memory have nothing to do. """
+        yield self
+
+    def readaheadChunkPositions(self, chunkPositions, readahead=True, key=None):
+        """ Pass an iterable of chunk positions, or of items whose chunk position is returned by key, to
+        get an iterator yielding the same items while the chunks of the next few items are prefetched.
+        readahead may be True to use readaheadDepth, a number of chunks, or False to do nothing. """
+        if not readahead:
+            return iter(chunkPositions)
+        depth = self.readaheadDepth if readahead is True else readahead
+        key = key or (lambda cPos: cPos)
+
+        def prefetch(item):
+            self.prefetchChunk(*key(item))
+
+        return lookahead(chunkPositions, prefetch, depth)
+
     def _getFakeChunkEntities(self, cx, cz):
         """Returns Entities, TileEntities"""
         return nbt.TAG_List(), nbt.TAG_List()
@@ -290,12 +347,17 @@ class MCLevel(object):
 
         return f
 
-    def getAllChunkSlices(self):
+    def _getChunkForReading(self, cx, cz):
+        """ Returns the chunk for methods that only read it. Level forks return their parent's chunk here instead of
+        copying it. """
+        return self.getChunk(cx, cz)
+
+    def getAllChunkSlices(self, readahead=False):
         slices = (slice(None), slice(None), slice(None),)
         box = self.bounds
         x, y, z = box.origin
 
-        for cpos in self.allChunks:
+        for cpos in self.readaheadChunkPositions(self.allChunks, readahead):
             xPos, zPos = cpos
             try:
                 chunk = self.getChunk(xPos, zPos)
@@ -323,8 +385,17 @@ class MCLevel(object):
         else:
             return getSlices(box, self.Height)
 
-    def getChunkSlices(self, box):
+    def getChunkSlices(self, box, readahead=False):
+        """ see getSlices. pass readahead=True to load the next chunks of the box in
+        the background while the caller works on the current one. """
+        chunkSlices = self.readaheadChunkPositions(self._getSlices(box), readahead, key=itemgetter(0))
         return ((self.getChunk(*cPos), slices, point)
+                for cPos, slices, point in chunkSlices
+                if self.containsChunk(*cPos))
+
+    def _getChunkSlicesForReading(self, box):
+        """ getChunkSlices for callers that only read the chunks, through _getChunkForReading. """
+        return ((self._getChunkForReading(*cPos), slices, point)
                 for cPos, slices, point in self._getSlices(box)
                 if self.containsChunk(*cPos))
 
@@ -386,10 +457,74 @@ class MCLevel(object):
             return 0
         self.Blocks[x, z, y] = blockID
 
+    def blockAndDataAt(self, x, y, z):
+        """ Returns the block ID and data value at x, y, z as a tuple. """
+        return self.blockAt(x, y, z), self.blockDataAt(x, y, z)
+
+    def setBlockAndDataAt(self, x, y, z, blockID, blockData):
+        """ Set the block ID and data value at x, y, z. Same as setBlockAt followed by setBlockDataAt, but levels
+        override it to find the block only once. """
+        self.setBlockAt(x, y, z, blockID)
+        self.setBlockDataAt(x, y, z, blockData)
+
+    # --- Batched block accessors ---
+
+    def _coordinateArrays(self, *arrays):
+        """ Broadcast the coordinate arrays (and any values to store) against each other and flatten them. Returns
+        the flat arrays and the shape they were broadcast to. """
+        arrays = broadcast_arrays(*[asarray(a) for a in arrays])
+        return [a.ravel() for a in arrays], arrays[0].shape
+
+    def _indicesInBounds(self, xs, ys, zs):
+        return flatnonzero((xs >= 0) & (xs < self.Width) &
+                           (ys >= 0) & (ys < self.Height) &
+                           (zs >= 0) & (zs < self.Length))
+
+    def getBlocks(self, xs, ys, zs, readahead=False):
+        """ Returns the block IDs at the coordinates given by the arrays xs, ys and zs, in an array of their
+        broadcast shape. Like blockAt, blocks outside the level are 0. """
+        (xs, ys, zs), shape = self._coordinateArrays(xs, ys, zs)
+        blocks = zeros(xs.shape, self.Blocks.dtype)
+        i = self._indicesInBounds(xs, ys, zs)
+        blocks[i] = self.Blocks[xs[i], zs[i], ys[i]]
+        return blocks.reshape(shape)
+
+    def getBlockData(self, xs, ys, zs, readahead=False):
+        """ Returns the block data values at the given coordinates, like getBlocks. """
+        (xs, ys, zs), shape = self._coordinateArrays(xs, ys, zs)
+        data = zeros(xs.shape, 'uint8')
+        if hasattr(self, "Data"):
+            i = self._indicesInBounds(xs, ys, zs)
+            data[i] = self.Data[xs[i], zs[i], ys[i]]
+        return data.reshape(shape)
+
+    def setBlocks(self, xs, ys, zs, blockIDs, blockData=None, readahead=False):
+        """ Store blockIDs, and blockData if given, at the coordinates given by the arrays xs, ys and zs. The IDs
+        and data may be arrays or single values; they are broadcast against the coordinates. Blocks outside the
+        level are ignored. If the same position appears more than once, which value is stored is undefined. """
+        if blockData is None:
+            (xs, ys, zs, blockIDs), shape = self._coordinateArrays(xs, ys, zs, blockIDs)
+        else:
+            (xs, ys, zs, blockIDs, blockData), shape = self._coordinateArrays(xs, ys, zs, blockIDs, blockData)
+
+        i = self._indicesInBounds(xs, ys, zs)
+        self.Blocks[xs[i], zs[i], ys[i]] = blockIDs[i]
+        if blockData is not None and hasattr(self, "Data"):
+            self.Data[xs[i], zs[i], ys[i]] = blockData[i]
+
     # --- Fill and Replace ---
 
     from block_fill import fillBlocks, fillBlocksIter
 
+    # --- Working copies and cursors ---
+
+    from block_view import view
+    from block_cursor import cursor
+
+    # --- Surface maps ---
+
+    from surface import surfaceMap
+
     # --- Transformations ---
     def rotateLeft(self):
         self.Blocks = swapaxes(self.Blocks, 1, 0)[:, ::-1, :]  # x=z; z=-x
@@ -450,12 +585,18 @@ class MCLevel(object):
         return -45., 0.
 
     # --- Dummy Lighting Methods ---
-    def generateLights(self, dirtyChunks=None):
+    deferredLightChunks = None  # positions of the chunks changed inside deferredLighting, see ChunkedLevelMixin
+
+    def generateLights(self, dirtyChunks=None, engine=None):
         pass
 
-    def generateLightsIter(self, dirtyChunks=None):
+    def generateLightsIter(self, dirtyChunks=None, engine=None):
         yield 0
 
+    @contextmanager
+    def deferredLighting(self, relight=True, engine=None):
+        yield self
+
 
 class EntityLevel(MCLevel):
     """Abstract subclass of MCLevel that adds default entity behavior"""
@@ -564,6 +705,12 @@ class EntityLevel(MCLevel):
         self.TileEntities.append(tileEntityTag)
         self._fakeEntities = None
 
+    def addTileEntities(self, tileEntities):
+        """ Add many tile entities at once, replacing the ones already at their positions in one pass over
+        TileEntities. """
+        self.TileEntities.value = mergeAtPositions(self.TileEntities, tileEntities, TileEntity.pos)
+        self._fakeEntities = None
+
     def addTileTick(self, tickTag):
         assert isinstance(tickTag, nbt.TAG_Compound)
         if hasattr(self, "TileTicks"):
@@ -576,8 +723,10 @@ class EntityLevel(MCLevel):
             self._fakeEntities = None
 
     def addTileTicks(self, tileTicks):
-        for e in tileTicks:
-            self.addTileTick(e)
+        """ Add many tile ticks at once, replacing the ones already at their positions in one pass over TileTicks. """
+        if hasattr(self, "TileTicks"):
+            self.TileTicks.value = mergeAtPositions(self.TileTicks, tileTicks, TileTick.pos)
+            self._fakeEntities = None
 
     _fakeEntities = None
 
@@ -596,6 +745,9 @@ class EntityLevel(MCLevel):
         return self._fakeEntities[cx, cz]
 
 
+SECTION_CATEGORIES = ("blocks", "light", "entities")
+
+
 class ChunkBase(EntityLevel):
     dirty = False
     needsLighting = False
@@ -614,14 +766,61 @@ class ChunkBase(EntityLevel):
         cx, cz = self.chunkPosition
         return BoundingBox((cx << 4, 0, cz << 4), self.size)
 
-    def chunkChanged(self, needsLighting=True):
-        self.dirty = True
+    def chunkChanged(self, needsLighting=True, sectionYs=None):
+        self._markChanged(sectionYs)
         self.needsLighting = needsLighting or self.needsLighting
+        self.surfaceMaps.clear()
+
+    def _markChanged(self, sectionYs):
+        if sectionYs is None:
+            self.dirty = True
+        else:
+            for category in SECTION_CATEGORIES:
+                self.markSectionsDirty(category, sectionYs)
 
     @property
     def materials(self):
         return self.world.materials
 
+    # --- Dirty sections ---
+
+    dirtySections = None  # chunks that track their changed sections replace this, see markSectionsDirty
+    unlitSections = None  # and this, with the set of section Ys whose blocks changed since they were last relit
+
+    def markSectionsDirty(self, category, sectionYs=None):
+        """ Mark the chunk dirty after changing some of its 16-block high sections. category is one of
+        SECTION_CATEGORIES: "blocks" for Blocks and Data, "light" for BlockLight and SkyLight, and "entities" for
+        Entities, TileEntities and TileTicks. sectionYs are the Y indexes of the changed sections, or None for all
+        of them.
+
+        Chunks that track their sections keep them in dirtySections, a dict mapping each category to the set of
+        section Ys changed since the chunk was saved, so saving and relighting can skip the others. This chunk does
+        not, so it is just marked dirty. """
+        self.dirty = True
+
+    # --- Surface maps ---
+
+    @property
+    def surfaceMaps(self):
+        """ The surface maps computed so far, by kind. """
+        maps = self.__dict__.get("_surfaceMaps")
+        if maps is None:
+            maps = self._surfaceMaps = {}
+        return maps
+
+    def surfaceHeights(self, kind="WORLD_SURFACE"):
+        """ Returns this chunk's surface map of the given kind, indexed [x,z]. See the surface module for the kinds.
+        The map is computed on first use, updated by the level's setBlockAt and recomputed after chunkChanged. """
+        heights = self.surfaceMaps.get(kind)
+        if heights is None:
+            heights = self.surfaceMaps[kind] = computeSurfaceMap(self.materials, self.Blocks, kind)
+        return heights
+
+    def updateSurfaceMaps(self, x, z, y):
+        """ Update the computed surface maps after the block at x,z,y (in chunk coordinates) was changed. """
+        for kind, heights in self.surfaceMaps.iteritems():
+            updateSurfaceMap(self.materials, self.Blocks, heights, kind, x, z, y)
+
     def getChunkSlicesForBox(self, box):
         """
          Given a BoundingBox enclosing part of the world, return a smaller box enclosing the part of this chunk
@@ -653,34 +852,44 @@ class LightedChunk(ChunkBase):
     def generateHeightMap(self):
         computeChunkHeightMap(self.materials, self.Blocks, self.HeightMap)
 
-    def chunkChanged(self, calcLighting=True):
+    def chunkChanged(self, calcLighting=True, sectionYs=None):
         """ You are required to call this function after you are done modifying
         the chunk. Pass False for calcLighting if you know your changes will
-        not change any lights."""
+        not change any lights. Pass the Y indexes of the changed sections as
+        sectionYs if you know them, so that saving and relighting can skip the
+        others.
 
-        self.dirty = True
+        Inside the level's deferredLighting, the sky light is not recomputed
+        here, and the chunk is remembered for later instead."""
+
+        self._markChanged(sectionYs)
         self.needsLighting = calcLighting or self.needsLighting
+        self.surfaceMaps.clear()
         self.generateHeightMap()
         if calcLighting:
-            self.genFastLights()
-
-    def genFastLights(self):
-        self.SkyLight[:] = 0
+            if self.world.deferredLightChunks is not None:
+                self.world.deferredLightChunks.add(self.chunkPosition)
+            elif sectionYs:
+                self.genFastLights((max(sectionYs) + 1) << 4)
+                self.markSectionsDirty("light", xrange(max(sectionYs) + 1))
+            else:
+                self.genFastLights()
+
+    def genFastLights(self, height=None):
+        """ Fill SkyLight from the HeightMap, without spreading it sideways. If height is given, only the sky light
+        below it is recomputed. """
+        if height is None:
+            height = self.Height
+        height = min(height, self.Height)
+        skylight = self.SkyLight
+        skylight[..., :height] = 0
         if self.world.dimNo in (-1, 1):
             return  # no light in nether or the end
 
-        blocks = self.Blocks
-        la = self.world.materials.lightAbsorption
-        skylight = self.SkyLight
-        heightmap = self.HeightMap
-
-        for x, z in itertools.product(xrange(16), xrange(16)):
-
-            skylight[x, z, heightmap[z, x]:] = 15
-            lv = 15
-            for y in reversed(range(heightmap[z, x])):
-                lv -= (la[blocks[x, z, y]] or 1)
-
-                if lv <= 0:
-                    break
-                skylight[x, z, y] = lv
+        # light falls from the top of each column, losing the absorption of each block below the HeightMap but at
+        # least 1 per block
+        heights = self.HeightMap.swapaxes(0, 1)[..., None]
+        la = clip(self.world.materials.lightAbsorption, 1, 15).astype('int16')[self.Blocks]
+        la[arange(la.shape[2]) >= heights] = 0
+        absorbed = cumsum(la[..., ::-1], axis=2)[..., ::-1]
+        skylight[..., :height] = clip(15 - absorbed[..., :height], 0, 15)
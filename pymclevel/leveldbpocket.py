@@ -826,6 +826,24 @@ class PocketLeveldbWorld(ChunkedLevelMixin, MCLevel):
         chunk.addTileEntity(tileEntityTag)
         chunk.dirty = True
 
+    def addEntities(self, entities):
+        """
+        Adds many entities to the level.
+        :param entities: list of nbt.TAG_Compound containing the entities' data.
+        :return:
+        """
+        for entityTag in entities:
+            self.addEntity(entityTag)
+
+    def addTileEntities(self, tileEntities):
+        """
+        Adds many tile entities to the level.
+        :param tileEntities: list of nbt.TAG_Compound containing the tile entities' data.
+        :return:
+        """
+        for tileEntityTag in tileEntities:
+            self.addTileEntity(tileEntityTag)
+
     def addTileTick(self, tickTag):
         """
         MCPE doesn't have Tile Ticks, so this can't be added.
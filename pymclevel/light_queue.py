@@ -0,0 +1,439 @@
+'''
+A lighting engine that spreads light with queues, starting from the blocks that changed.
+
+The light of a block is the brightest of its own light source and of each neighbour's light less the block's light
+absorption, counting at least 1. The sweep engine of ChunkedLevelMixin finds this by sweeping whole chunks and their
+neighbours until nothing changes. This engine keeps the light of unchanged blocks and only visits the blocks whose
+light may have changed:
+
+- The light of the changed sections is removed. Light that reached other blocks through them is removed too,
+  following it outward while it keeps getting dimmer. The lit blocks found at the edge of the removed light are
+  kept as sources for the next step.
+- Light is spread from those blocks and from the light sources among the removed blocks, brightest first, as far as it
+  raises the light of the blocks it reaches.
+
+Each step handles a whole queue of blocks at once with numpy. Neighbouring chunks are only loaded when light reaches
+them. Blocks at or above the HeightMap of their column are sky light sources, so sky light is also removed below and
+restored above the HeightMap of columns where it changed.
+'''
+from logging import getLogger
+
+import numpy
+from numpy import arange, clip, concatenate, flatnonzero, mgrid, tile, zeros
+
+from mclevelbase import ChunkMalformed, ChunkNotPresent
+
+log = getLogger(__name__)
+
+__all__ = ["LightQueue", "relightIter"]
+
+
+def _neighbours(x, y, z, height, values=None):
+    """ Returns the coordinates of the six neighbours of each block that lie between 0 and height, and the value of
+    the block each came from if values is given. """
+    nx = concatenate([x - 1, x + 1, x, x, x, x])
+    ny = concatenate([y, y, y - 1, y + 1, y, y])
+    nz = concatenate([z, z, z, z, z - 1, z + 1])
+    inside = (ny >= 0) & (ny < height)
+    if values is None:
+        return nx[inside], ny[inside], nz[inside]
+    return nx[inside], ny[inside], nz[inside], tile(values, 6)[inside]
+
+
+def _unique(lx, lz, y, height):
+    """ Returns the indices of the first occurrence of each block, given in chunk coordinates. """
+    _, first = numpy.unique((lx * 16 + lz) * height + y, return_index=True)
+    return first
+
+
+def _sectionRuns(sections):
+    """ Groups section numbers into runs of consecutive sections. Yields (first, last + 1). """
+    run = None
+    for s in sorted(sections):
+        if run and s == run[1]:
+            run[1] += 1
+        else:
+            if run:
+                yield tuple(run)
+            run = [s, s + 1]
+    if run:
+        yield tuple(run)
+
+
+class LightQueue(object):
+    """ Spreads one kind of light, "BlockLight" or "SkyLight", through the chunks of a level. Blocks are given as
+    arrays of level coordinates. """
+
+    def __init__(self, level, light):
+        self.level = level
+        self.light = light
+        self.height = level.Height
+        absorption = numpy.array(level.materials.lightAbsorption, 'int16')
+        clip(absorption, 1, 15, absorption)
+        self.absorption = absorption
+        self.emission = level.materials.lightEmission
+
+        self._chunks = {}  # (cx, cz) -> chunk, or None for missing chunks
+        self._changedSections = {}  # (cx, cz) -> boolean array of the sections whose light was written
+
+        self._removals = []  # (x, y, z, old light) of removed blocks to spread the removal from
+        self._removedSources = []  # (chunk, lx, lz, y, light) of light sources whose light was removed
+        self._removedSections = []  # (chunk, miny, maxy) of removed sections, to light again after the removal
+        self._lightBefore = []  # (chunk, miny, maxy, light) of removed sections, to find the ones that changed
+        self._buckets = [[] for _ in range(16)]  # (x, y, z) of blocks to spread light from, by their light
+
+    # --- Chunks ---
+
+    def chunk(self, cx, cz):
+        cPos = (int(cx), int(cz))
+        if cPos not in self._chunks:
+            try:
+                self._chunks[cPos] = self.level.getChunk(*cPos)
+            except (ChunkNotPresent, ChunkMalformed):
+                self._chunks[cPos] = None
+        return self._chunks[cPos]
+
+    def _chunkRuns(self, x, z):
+        """ Yields each present chunk holding some of the given blocks, with the indices of those blocks. """
+        if not len(x):
+            return
+        cx = x >> 4
+        cz = z >> 4
+        cxMin = cx.min()
+        czMin = cz.min()
+        keys = (cx - cxMin) * (cz.max() - czMin + 1) + (cz - czMin)
+        if not keys.any():
+            chunk = self.chunk(cxMin, czMin)
+            if chunk is not None:
+                yield chunk, slice(None)
+            return
+
+        order = keys.argsort()
+        keys = keys[order]
+        starts = flatnonzero(keys[1:] != keys[:-1]) + 1
+        bounds = [0] + starts.tolist() + [len(order)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            chunk = self.chunk(cx[order[start]], cz[order[start]])
+            if chunk is not None:
+                yield chunk, order[start:end]
+
+    def _sectionsWritten(self, chunk):
+        changed = self._changedSections.get(chunk.chunkPosition)
+        if changed is None:
+            changed = self._changedSections[chunk.chunkPosition] = zeros((self.height + 15) >> 4, bool)
+        return changed
+
+    def _write(self, chunk, lx, lz, y, values):
+        if not len(y):
+            return
+        getattr(chunk, self.light)[lx, lz, y] = values
+        self._sectionsWritten(chunk)[y >> 4] = True
+
+    @property
+    def changedSections(self):
+        """ Maps the position of each chunk whose light was written to the list of sections written. Removed sections
+        only count if their light ended up different. """
+        for chunk, miny, maxy, lightBefore in self._lightBefore:
+            changedYs = flatnonzero((getattr(chunk, self.light)[..., miny:maxy] != lightBefore).any(0).any(0))
+            written = self._sectionsWritten(chunk)
+            written[miny >> 4:(maxy + 15) >> 4] = False
+            written[(changedYs + miny) >> 4] = True
+        self._lightBefore = []
+
+        return dict((cPos, flatnonzero(changed).tolist()) for cPos, changed in self._changedSections.iteritems()
+                    if changed.any())
+
+    # --- Seeds ---
+
+    def remove(self, chunk, lx, lz, y):
+        """ Remove the light of the given blocks of a chunk and queue them for spreading the removal. """
+        lightArray = getattr(chunk, self.light)
+        old = lightArray[lx, lz, y]
+        cx, cz = chunk.chunkPosition
+        self._removals.append((lx + (cx << 4), y, lz + (cz << 4), old.astype('int16')))
+        self._write(chunk, lx, lz, y, 0)
+
+    def add(self, chunk, lx, lz, y, values):
+        """ Light the given blocks of a chunk and queue them for spreading. """
+        values = numpy.asarray(values)
+        self._write(chunk, lx, lz, y, values)
+        cx, cz = chunk.chunkPosition
+        x = lx + (cx << 4)
+        z = lz + (cz << 4)
+        if values.ndim == 0:
+            self._buckets[int(values)].append((x, y, z))
+            return
+        for value in numpy.unique(values):
+            if value > 0:
+                found = values == value
+                self._buckets[value].append((x[found], y[found], z[found]))
+
+    def sources(self, chunk, lx, lz, y):
+        """ Returns the light given off by the given blocks of a chunk. """
+        if self.light == "BlockLight":
+            return self.emission[chunk.Blocks[lx, lz, y]]
+        return numpy.where(y >= chunk.HeightMap[lz, lx], 15, 0)
+
+    # --- Spreading ---
+
+    def _removeFrom(self, chunk, lx, lz, ly, removedLight):
+        """ Remove the light of the given blocks of a chunk where it is dimmer than the removed light next to them,
+        and queue them for spreading the removal. The lit blocks that are left are queued for spreading light. """
+        current = getattr(chunk, self.light)[lx, lz, ly]
+        lit = current != 0
+        dimmer = lit & (current < removedLight)
+
+        # light that is at least as bright as the removed light came from elsewhere and is spread again later
+        spread = lit & ~dimmer
+        if spread.any():
+            keep = _unique(lx[spread], lz[spread], ly[spread], self.height)
+            self._queueLit(chunk, lx[spread][keep], lz[spread][keep], ly[spread][keep], current[spread][keep])
+
+        if dimmer.any():
+            lx, lz, ly, current = lx[dimmer], lz[dimmer], ly[dimmer], current[dimmer]
+            keep = _unique(lx, lz, ly, self.height)
+            lx, lz, ly, current = lx[keep], lz[keep], ly[keep], current[keep]
+            self._write(chunk, lx, lz, ly, 0)
+
+            cx, cz = chunk.chunkPosition
+            self._removals.append((lx + (cx << 4), ly, lz + (cz << 4), current.astype('int16')))
+
+            source = self.sources(chunk, lx, lz, ly)
+            found = source > 0
+            if found.any():
+                self._removedSources.append((chunk, lx[found], lz[found], ly[found], source[found]))
+
+    def _removeStep(self, x, y, z, values):
+        """ Spread the removal of the given blocks' light to their neighbours. """
+        nx, ny, nz, values = _neighbours(x, y, z, self.height, values)
+        for chunk, idx in self._chunkRuns(nx, nz):
+            self._removeFrom(chunk, nx[idx] & 0xf, nz[idx] & 0xf, ny[idx], values[idx])
+
+    def _queueLit(self, chunk, lx, lz, y, values):
+        cx, cz = chunk.chunkPosition
+        x = lx + (cx << 4)
+        z = lz + (cz << 4)
+        for value in numpy.unique(values):
+            found = values == value
+            self._buckets[value].append((x[found], y[found], z[found]))
+
+    def _dropRemoved(self):
+        """ Drop the queued blocks whose light was removed after they were queued. """
+        for value, bucket in enumerate(self._buckets):
+            if not bucket:
+                continue
+            x, y, z = [concatenate(a) for a in zip(*bucket)]
+            kept = []
+            for chunk, idx in self._chunkRuns(x, z):
+                bx, by, bz = x[idx], y[idx], z[idx]
+                lit = getattr(chunk, self.light)[bx & 0xf, bz & 0xf, by] >= value
+                kept.append((bx[lit], by[lit], bz[lit]))
+            self._buckets[value] = kept
+
+    def _addStep(self, value, x, y, z):
+        """ Spread light of the given value from the given blocks to the neighbours it makes brighter. """
+        nx, ny, nz = _neighbours(x, y, z, self.height)
+        for chunk, idx in self._chunkRuns(nx, nz):
+            lx, lz, ly = nx[idx] & 0xf, nz[idx] & 0xf, ny[idx]
+            current = getattr(chunk, self.light)[lx, lz, ly]
+            newLight = value - self.absorption[chunk.Blocks[lx, lz, ly]]
+            brighter = newLight > current
+            if not brighter.any():
+                continue
+
+            lx, lz, ly, newLight = lx[brighter], lz[brighter], ly[brighter], newLight[brighter]
+            keep = _unique(lx, lz, ly, self.height)
+            self.add(chunk, lx[keep], lz[keep], ly[keep], newLight[keep])
+
+    def spreadIter(self):
+        """ Remove the queued light, then spread light from the queued blocks. Yields once per step. """
+        while self._removals:
+            removals, self._removals = self._removals, []
+            x, y, z, values = [concatenate(a) for a in zip(*removals)]
+            self._removeStep(x, y, z, values)
+            yield
+
+        self._dropRemoved()
+        for chunk, lx, lz, ly, source in self._removedSources:
+            self.add(chunk, lx, lz, ly, source)
+        self._removedSources = []
+        for chunk, miny, maxy in self._removedSections:
+            if self.light == "BlockLight":
+                self._addEmitters(chunk, miny, maxy)
+            else:
+                self._addSky(chunk, miny, maxy)
+        self._removedSections = []
+
+        for value in range(15, 0, -1):
+            bucket, self._buckets[value] = self._buckets[value], []
+            if not bucket:
+                continue
+            x, y, z = [concatenate(a) for a in zip(*bucket)]
+            self._addStep(value, x, y, z)
+            yield
+
+    # --- Changed chunks ---
+
+    def removeSections(self, chunks):
+        """ Remove the light of the given sections. Their light sources are lit again once the removal has spread.
+        chunks maps each chunk to the sections whose blocks changed. """
+        runs = []
+        for chunk, sections in chunks.iteritems():
+            lightArray = getattr(chunk, self.light)
+            for first, last in _sectionRuns(sections):
+                miny, maxy = first << 4, min(self.height, last << 4)
+                lightBefore = lightArray[..., miny:maxy].copy()
+                if self.light == "SkyLight":
+                    # chunkChanged recomputes the sky light of a chunk from its HeightMap alone, so the sky light that
+                    # spread from these blocks may have been brighter than what is left; treat it as full sky light
+                    oldLight = numpy.full((16, 16, maxy - miny), 15, lightArray.dtype)
+                else:
+                    oldLight = lightBefore
+                runs.append((chunk, miny, maxy, oldLight))
+                self._lightBefore.append((chunk, miny, maxy, lightBefore))
+
+        for chunk, miny, maxy, oldLight in runs:
+            getattr(chunk, self.light)[..., miny:maxy] = 0
+            self._removedSections.append((chunk, miny, maxy))
+
+        for run in runs:
+            self._removeAround(*run)
+
+    def _removeAround(self, chunk, miny, maxy, oldLight):
+        """ The first step of the removal from a run of removed sections. Only the blocks on their outside have
+        neighbours that are not removed, and those lie in six flat slabs, so they are compared with numpy slices
+        instead of queued. """
+        cx, cz = chunk.chunkPosition
+        across, ys = mgrid[0:16, miny:maxy]  # the blocks of a side of the run, indexed [x or z, y]
+        first = numpy.full(across.shape, 0)
+        last = numpy.full(across.shape, 15)
+        faces = [
+            ((cx - 1, cz), (last, across, ys), oldLight[0]),
+            ((cx + 1, cz), (first, across, ys), oldLight[15]),
+            ((cx, cz - 1), (across, last, ys), oldLight[:, 0]),
+            ((cx, cz + 1), (across, first, ys), oldLight[:, 15]),
+        ]
+
+        xs, zs = mgrid[0:16, 0:16]
+        if miny > 0:
+            faces.append(((cx, cz), (xs, zs, numpy.full(xs.shape, miny - 1)), oldLight[..., 0]))
+        if maxy < self.height:
+            faces.append(((cx, cz), (xs, zs, numpy.full(xs.shape, maxy)), oldLight[..., -1]))
+
+        for cPos, (lx, lz, ly), removedLight in faces:
+            neighbour = self.chunk(*cPos)
+            if neighbour is not None:
+                self._removeFrom(neighbour, lx.ravel(), lz.ravel(), ly.ravel(), removedLight.ravel().astype('int16'))
+
+    def _addEmitters(self, chunk, miny, maxy):
+        emission = self.emission[chunk.Blocks[..., miny:maxy]]
+        lx, lz, ly = emission.nonzero()
+        if len(lx):
+            self.add(chunk, lx, lz, ly + miny, emission[lx, lz, ly])
+
+    def _addSky(self, chunk, miny, maxy):
+        """ Light the blocks between miny and maxy that see the sky, and queue the ones that have neighbours that do
+        not. """
+        heights = chunk.HeightMap.swapaxes(0, 1).astype('int32')  # indexed [x,z]
+        ys = arange(miny, maxy).reshape(1, 1, maxy - miny)
+        lightArray = getattr(chunk, self.light)
+        sky = ys >= heights[..., None]
+        lightArray[..., miny:maxy][sky] = 15
+
+        # a sky block only lights the block below it, if that is not in the sky, and the blocks beside it whose
+        # columns are higher, which may be in the next chunk
+        highest = zeros((18, 18), 'int32')
+        highest[1:17, 1:17] = heights
+        cx, cz = chunk.chunkPosition
+        for (dx, dz), edge, neighbourEdge in (((-1, 0), (0, slice(1, 17)), (slice(None), 15)),
+                                              ((1, 0), (17, slice(1, 17)), (slice(None), 0)),
+                                              ((0, -1), (slice(1, 17), 0), (15, slice(None))),
+                                              ((0, 1), (slice(1, 17), 17), (0, slice(None)))):
+            neighbour = self.chunk(cx + dx, cz + dz)
+            if neighbour is not None:
+                highest[edge] = neighbour.HeightMap[neighbourEdge]
+        neighbourHeights = numpy.maximum.reduce([highest[:-2, 1:17], highest[2:, 1:17],
+                                                 highest[1:17, :-2], highest[1:17, 2:]])
+        spreads = sky & ((ys == heights[..., None]) | (ys < neighbourHeights[..., None]))
+        lx, lz, ly = spreads.nonzero()
+        if len(lx):
+            self._buckets[15].append((lx + (cx << 4), ly + miny, lz + (cz << 4)))
+
+    def updateSkySources(self, chunk, sections):
+        """ Sky light changes outside the changed sections where the HeightMap of the chunk changed. Remove the sky
+        light below the HeightMap and add it above. """
+        height = self.height
+        heights = chunk.HeightMap.swapaxes(0, 1)[..., None]
+        ys = arange(height).reshape(1, 1, height)
+        lightArray = getattr(chunk, self.light)
+        outside = numpy.ones(height, bool)
+        for first, last in _sectionRuns(sections):
+            outside[first << 4:last << 4] = False
+
+        # only sources have full sky light; light spread from the side is 14 at most
+        full = lightArray == 15
+        lost = full & (ys < heights) & outside
+        gained = ~full & (ys >= heights) & outside
+
+        lx, lz, ly = lost.nonzero()
+        if len(lx):
+            self.remove(chunk, lx, lz, ly)
+        lx, lz, ly = gained.nonzero()
+        if len(lx):
+            self.add(chunk, lx, lz, ly, 15)
+
+
+def relightIter(level, chunkPositions):
+    """ Relight the given chunks of a level with LightQueue. Only the light of their unlitSections is recomputed,
+    along with the light around it that depended on it. Sky light is recomputed from the bottom of the chunk up, as
+    chunkChanged refills it from the HeightMap below the changed sections. Chunks that do not say which sections
+    changed are relit from top to bottom. Yields progress tuples like generateLightsIter. """
+    allSections = range((level.Height + 15) >> 4)
+    chunks = {}
+    for cPos in chunkPositions:
+        chunk = level.getChunk(*cPos)
+        chunks[chunk] = set(chunk.unlitSections or allSections)
+        chunk.generateHeightMap()
+
+    if not chunks:
+        return
+
+    if level.dimNo in (-1, 1):
+        lights = ("BlockLight",)
+        for chunk, sections in chunks.iteritems():
+            for first, last in _sectionRuns(sections):
+                chunk.SkyLight[..., first << 4:last << 4] = 0  # no sky light in the nether or the end
+    else:
+        lights = ("BlockLight", "SkyLight")
+
+    progressInfo = u"Lighting {0} chunks".format(len(chunks))
+    log.info(progressInfo)
+    workTotal = len(lights) * 30
+    workDone = 0
+
+    for light in lights:
+        queue = LightQueue(level, light)
+        for chunk in chunks:
+            queue.chunk(*chunk.chunkPosition)
+        if light == "SkyLight":
+            relitSections = dict((chunk, set(range(max(sections) + 1))) for chunk, sections in chunks.iteritems())
+            for chunk, sections in relitSections.iteritems():
+                queue.updateSkySources(chunk, sections)
+        else:
+            relitSections = chunks
+        queue.removeSections(relitSections)
+
+        for _ in queue.spreadIter():
+            workDone += 1
+            workTotal = max(workTotal, workDone + 1)
+            yield workDone, workTotal, progressInfo
+
+        for cPos, sections in queue.changedSections.iteritems():
+            queue.chunk(*cPos).markSectionsDirty("light", sections)
+
+    for chunk in chunks:
+        chunk.needsLighting = False
+        if chunk.unlitSections:
+            chunk.unlitSections.clear()
+
+    yield workTotal, workTotal, progressInfo
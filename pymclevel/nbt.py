@@ -67,6 +67,10 @@ class TAG_Value(object):
         self.value = value
         self.name = name
 
+    def copy(self):
+        """ Returns a copy of this tag that shares nothing with it. Much quicker than deepcopy. """
+        return self.__class__(self.value, self.name)
+
     fmt = struct.Struct("b")
     tagID = NotImplemented
     data_type = NotImplemented
@@ -203,6 +207,9 @@ class TAG_Byte_Array(TAG_Value):
     def data_type(self, value):
         return array(value, self.dtype)
 
+    def copy(self):
+        return self.__class__(array(self.value), self.name)
+
     dtype = numpy.dtype('uint8')
 
     @classmethod
@@ -306,6 +313,9 @@ class TAG_Compound(TAG_Value, collections.MutableMapping):
     def __repr__(self):
         return "<%s name='%s' keys=%r>" % (str(self.__class__.__name__), self.name, self.keys())
 
+    def copy(self):
+        return TAG_Compound([tag.copy() for tag in self.value], self.name)
+
     def data_type(self, val):
         for i in val:
             self.check_value(i)
@@ -456,6 +466,9 @@ class TAG_List(TAG_Value, collections.MutableSequence):
         assert all([x.tagID == self.list_type for x in val])
         return list(val)
 
+    def copy(self):
+        return TAG_List([tag.copy() for tag in self.value], self.name, self.list_type)
+
     @classmethod
     def load_from(cls, ctx):
         self = cls()
@@ -525,6 +538,151 @@ TAG_Int_Array, TAG_Short_Array):
     tag_classes[c.tagID] = c
 
 
+_fixed_sizes = {TAG_BYTE: 1, TAG_SHORT: 2, TAG_INT: 4, TAG_LONG: 8, TAG_FLOAT: 4, TAG_DOUBLE: 8}
+_array_itemsizes = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_SHORT_ARRAY: 2}
+
+
+def skip_payload(data, offset, tag_type):
+    """ Returns the offset just past the payload of a tag of tag_type starting at offset, without decoding it. """
+    size = _fixed_sizes.get(tag_type)
+    if size is not None:
+        return offset + size
+
+    itemsize = _array_itemsizes.get(tag_type)
+    if itemsize is not None:
+        (length,) = TAG_Int.fmt.unpack_from(data, offset)
+        return offset + 4 + length * itemsize
+
+    if tag_type == TAG_STRING:
+        (length,) = string_len_fmt.unpack_from(data, offset)
+        return offset + 2 + length
+
+    if tag_type == TAG_LIST:
+        list_type = data[offset]
+        (length,) = TAG_Int.fmt.unpack_from(data, offset + 1)
+        offset += 5
+        size = _fixed_sizes.get(list_type)
+        if size is not None:
+            return offset + size * length
+        for i in xrange(length):
+            offset = skip_payload(data, offset, list_type)
+        return offset
+
+    if tag_type == TAG_COMPOUND:
+        while True:
+            child_type = data[offset]
+            offset += 1
+            if child_type == 0:
+                return offset
+            (name_length,) = string_len_fmt.unpack_from(data, offset)
+            offset = skip_payload(data, offset + 2 + name_length, child_type)
+
+    raise NBTFormatError("Unknown tag type %d" % tag_type)
+
+
+class LazyTAG_Compound(TAG_Compound):
+    """A TAG_Compound read by load(lazy=True). Its children are decoded from its payload the first time they are
+    used. Until then, the payload is kept as a byte array and written back as it is.
+
+    Children that are compounds or lists are lazy too, so a subtree that is never used is never decoded. The payload
+    is written with the endianness it was read with."""
+
+    __slots__ = ('_items', '_raw')
+
+    def __init__(self, raw, name=""):
+        self._raw = raw
+        self._items = None
+        self.name = name
+
+    @property
+    def _value(self):
+        if self._raw is not None:
+            self._items = self._decode()
+            self._raw = None
+        return self._items
+
+    @_value.setter
+    def _value(self, value):
+        self._items = value
+        self._raw = None
+
+    @classmethod
+    def load_from(cls, ctx):
+        start = ctx.offset
+        ctx.offset = skip_payload(ctx.data, start, TAG_COMPOUND)
+        return cls(ctx.data[start:ctx.offset].copy())
+
+    def _decode(self):
+        ctx = load_ctx()
+        ctx.data = self._raw
+        ctx.offset = 0
+        items = []
+        while True:
+            tag_type = ctx.data[ctx.offset]
+            ctx.offset += 1
+            if tag_type == 0:
+                return items
+
+            tag_name = load_string(ctx)
+            tag = lazy_tag_classes[tag_type].load_from(ctx)
+            tag.name = tag_name
+            items.append(tag)
+
+    def write_value(self, buf):
+        if self._raw is not None:
+            buf.write(self._raw.tostring())
+        else:
+            super(LazyTAG_Compound, self).write_value(buf)
+
+    def copy(self):
+        if self._raw is not None:
+            return self.__class__(self._raw.copy(), self.name)
+        return super(LazyTAG_Compound, self).copy()
+
+
+class LazyTAG_List(TAG_List):
+    """A TAG_List read by load(lazy=True). See LazyTAG_Compound."""
+
+    __slots__ = ('_items', '_raw')
+
+    def __init__(self, raw, name=""):
+        self._raw = raw
+        self._items = None
+        self.name = name
+        self.list_type = raw[0]
+
+    _value = LazyTAG_Compound._value
+
+    @classmethod
+    def load_from(cls, ctx):
+        start = ctx.offset
+        ctx.offset = skip_payload(ctx.data, start, TAG_LIST)
+        return cls(ctx.data[start:ctx.offset].copy())
+
+    def _decode(self):
+        ctx = load_ctx()
+        ctx.data = self._raw
+        ctx.offset = 5
+        (list_length,) = TAG_Int.fmt.unpack_from(ctx.data, 1)
+        return [lazy_tag_classes[self.list_type].load_from(ctx) for i in xrange(list_length)]
+
+    def write_value(self, buf):
+        if self._raw is not None:
+            buf.write(self._raw.tostring())
+        else:
+            super(LazyTAG_List, self).write_value(buf)
+
+    def copy(self):
+        if self._raw is not None:
+            return self.__class__(self._raw.copy(), self.name)
+        return super(LazyTAG_List, self).copy()
+
+
+lazy_tag_classes = dict(tag_classes)
+lazy_tag_classes[TAG_COMPOUND] = LazyTAG_Compound
+lazy_tag_classes[TAG_LIST] = LazyTAG_List
+
+
 def gunzip(data):
     return gzip.GzipFile(fileobj=StringIO(data)).read()
 
@@ -537,11 +695,14 @@ def try_gunzip(data):
     return data
 
 
-def load(filename="", buf=None):
+def load(filename="", buf=None, lazy=False):
     """
     Unserialize data from an NBT file and return the root TAG_Compound object. If filename is passed,
     reads from the file, otherwise uses data from buf. Buf can be a buffer object with a read() method or a string
     containing NBT data.
+
+    If lazy is True, compounds and lists are only decoded when they are used, and are saved without re-encoding them
+    if they never were. See LazyTAG_Compound.
     """
     if filename:
         buf = file(filename, "rb")
@@ -549,14 +710,14 @@ def load(filename="", buf=None):
     if hasattr(buf, "read"):
         buf = buf.read()
 
-    return _load_buffer(try_gunzip(buf))
+    return _load_buffer(try_gunzip(buf), lazy)
 
 
 class load_ctx(object):
     pass
 
 
-def _load_buffer(buf):
+def _load_buffer(buf, lazy=False):
     if isinstance(buf, str):
         buf = fromstring(buf, 'uint8')
     data = buf
@@ -575,7 +736,10 @@ def _load_buffer(buf):
     ctx.data = data
 
     tag_name = load_string(ctx)
-    tag = TAG_Compound.load_from(ctx)
+    if lazy:
+        tag = LazyTAG_Compound(data[ctx.offset:])
+    else:
+        tag = TAG_Compound.load_from(ctx)
     # For PE debug
     try:
         tag.name = tag_name
@@ -671,9 +835,16 @@ try:
     if DEBUG_PE or '--debug-pe' in sys.argv:
         log.warning("PE support debug mode is activated. Using full Python NBT support!")
     else:
-        from _nbt import (load, TAG_Byte, TAG_Short, TAG_Int, TAG_Long, TAG_Float, TAG_Double, TAG_String,
-                          TAG_Byte_Array, TAG_List, TAG_Compound, TAG_Int_Array, TAG_Short_Array, NBTFormatError,
-                          littleEndianNBT, nested_string, gunzip)
+        from _nbt import (load as _cython_load, TAG_Byte, TAG_Short, TAG_Int, TAG_Long, TAG_Float, TAG_Double,
+                          TAG_String, TAG_Byte_Array, TAG_List, TAG_Compound, TAG_Int_Array, TAG_Short_Array,
+                          NBTFormatError, littleEndianNBT, nested_string, gunzip)
+
+        def load(filename="", buf=None, lazy=False):
+            """
+            Unserialize data from an NBT file and return the root TAG_Compound object. The Cythonized loader
+            decodes everything quickly enough that lazy is ignored.
+            """
+            return _cython_load(filename, buf)
 except ImportError as err:
     log.error("Failed to import Cythonized nbt file. Running on (very slow) pure-python nbt fallback.")
     log.error("(Did you forget to run 'setup.py build_ext --inplace'?)")
@@ -0,0 +1,199 @@
+'''
+Relighting large jobs in worker processes.
+
+The chunks to relight and their neighbours have their light reset the way the sweep engine resets it, and are split
+into spatial batches with ChunkedLevelMixin._lightingBatches. Worker processes spread the light inside each batch, over
+copies of the batch's light absorption and light arrays held in shared memory, treating everything outside the batch as
+dark. Light spread that way can only be too dark, never too bright, so a last sweep from the chunks at the seams
+between batches, and next to chunks that were not relit, brings it to the light the sweep engine gives.
+'''
+import ctypes
+from logging import getLogger
+from multiprocessing import Pool, cpu_count
+from multiprocessing.sharedctypes import RawArray
+
+from numpy import array, clip, frombuffer, maximum, uint8
+
+log = getLogger(__name__)
+
+__all__ = ["relightIter", "spreadLight"]
+
+_slots = None  # the shared arrays of a worker process, one per batch being lit at once
+
+
+def _initWorker(slots):
+    global _slots
+    _slots = slots
+
+
+def spreadLight(light, la):
+    """ Spread light, an x,z,y uint8 array, into its neighbours along all three axes until it stops changing. la holds
+    the light absorption, at least 1, of the blocks in the same places. """
+
+    def spread(source, target, targetLa):
+        newlight = source - targetLa
+        # negative results wrap around to large values, so clip them as signed int8
+        newlight.view('int8').clip(0, 15, newlight)
+        maximum(target, newlight, target)
+
+    lower = [slice(None)] * 3
+    upper = [slice(None)] * 3
+    while True:
+        oldLight = light.copy()
+        for axis in range(3):
+            lower[axis] = slice(None, -1)
+            upper[axis] = slice(1, None)
+            lo, up = tuple(lower), tuple(upper)
+            spread(light[lo], light[up], la[up])
+            spread(light[up], light[lo], la[lo])
+            lower[axis] = upper[axis] = slice(None)
+
+        if (oldLight == light).all():
+            return
+
+
+def _slotArrays(slot, shape, count):
+    """ Returns count arrays of the given shape laid out one after another in the shared array slot. """
+    size = shape[0] * shape[1] * shape[2]
+    return [frombuffer(slot, uint8, size, size * i).reshape(shape) for i in range(count)]
+
+
+def _lightBatch((slot, shape, spans)):
+    """ Spread the light arrays of a batch, held after its light absorption in one of the worker's slots. Each light
+    array is spread between the y values in spans. """
+    arrays = _slotArrays(_slots[slot], shape, len(spans) + 1)
+    la = arrays[0]
+    for light, (miny, maxy) in zip(arrays[1:], spans):
+        spreadLight(light[..., miny:maxy], la[..., miny:maxy])
+
+
+class _Batch(object):
+    """ The chunks of one batch and where they sit in the batch's arrays. """
+
+    def __init__(self, chunkPositions):
+        self.chunkPositions = chunkPositions
+        cxs = [cx for cx, cz in chunkPositions]
+        czs = [cz for cx, cz in chunkPositions]
+        self.mincx, self.mincz = min(cxs), min(czs)
+        self.width, self.length = (max(cxs) - self.mincx + 1) * 16, (max(czs) - self.mincz + 1) * 16
+
+    def slices(self, cx, cz):
+        x, z = (cx - self.mincx) * 16, (cz - self.mincz) * 16
+        return slice(x, x + 16), slice(z, z + 16)
+
+
+def relightIter(level, chunkPositions, processes=None):
+    """ Relight the chunks at chunkPositions and their neighbours like the sweep engine, spreading the light of
+    separate batches in processes worker processes. processes defaults to one per CPU. Jobs too small to split into
+    several batches are lit by the sweep engine on this thread.
+
+    Yields progress tuples like generateLightsIter.
+    """
+    processes = processes or cpu_count()
+    dirtyChunkPositions = set(chunkPositions)
+    if not dirtyChunkPositions:
+        return
+
+    # relight all blocks in neighboring chunks in case their light source disappeared.
+    relitChunkPositions = set(dirtyChunkPositions)
+    for cx, cz in dirtyChunkPositions:
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                if level.containsChunk(cx + dx, cz + dz):
+                    relitChunkPositions.add((cx + dx, cz + dz))
+
+    batches = level._lightingBatches(sorted(relitChunkPositions), processes)
+    if processes < 2 or len(batches) < 2:
+        # the sweep engine lights the chunks in batches of at most loadedChunkLimit
+        for progress in level.generateLightsIter(dirtyChunkPositions, engine="sweep"):
+            yield progress
+        return
+
+    batches = [_Batch(b) for b in batches if b]
+    ranges = level._lightingRanges(level.getChunk(*cPos) for cPos in relitChunkPositions
+                                   if cPos in dirtyChunkPositions or cPos in level.chunksNeedingLighting)
+    lights, changedSections = level._lightsToSpread(ranges)
+    (blockLightMin, blockLightMax), _ = ranges["BlockLight"]
+    (_, skyLightMax), _ = ranges["SkyLight"]
+
+    # the batch arrays cover the y values where any of the lights is spread
+    miny = min(ranges[light][1][0] for light in lights)
+    maxy = max(ranges[light][1][1] for light in lights)
+    spans = [(ranges[light][1][0] - miny, ranges[light][1][1] - miny) for light in lights]
+
+    la = array(level.materials.lightAbsorption)
+    clip(la, 1, 15, la)
+    lightEmission = level.materials.lightEmission
+
+    slotSize = max(b.width * b.length for b in batches) * (maxy - miny)
+    slots = [RawArray(ctypes.c_uint8, slotSize * (len(lights) + 1)) for _ in range(min(processes, len(batches)))]
+
+    workDone = 0
+    workTotal = len(relitChunkPositions) * 2
+    progressInfo = u"Lighting {0} chunks in {1} batches".format(len(relitChunkPositions), len(batches))
+    log.info(progressInfo)
+
+    pool = Pool(len(slots), _initWorker, (slots,))
+    try:
+        for first in range(0, len(batches), len(slots)):
+            jobs = []
+            for slot, batch in enumerate(batches[first:first + len(slots)]):
+                shape = (batch.width, batch.length, maxy - miny)
+                arrays = _slotArrays(slots[slot], shape, len(lights) + 1)
+                arrays[0][:] = 15  # blocks outside the batch are dark and let no light through
+                for a in arrays[1:]:
+                    a[:] = 0
+
+                for cPos in batch.chunkPositions:
+                    chunk = level.getChunk(*cPos)
+                    if cPos in dirtyChunkPositions:
+                        chunk.generateHeightMap()
+                        chunk.genFastLights(skyLightMax)
+                    chunk.BlockLight[..., blockLightMin:blockLightMax] = \
+                        lightEmission[chunk.Blocks[..., blockLightMin:blockLightMax]]
+                    chunk.markSectionsDirty("light", changedSections)
+
+                    x, z = batch.slices(*cPos)
+                    arrays[0][x, z] = la[chunk.Blocks[..., miny:maxy]]
+                    for a, light in zip(arrays[1:], lights):
+                        a[x, z] = getattr(chunk, light)[..., miny:maxy]
+
+                    workDone += 1
+                    yield workDone, workTotal, progressInfo
+
+                jobs.append((batch, arrays, pool.apply_async(_lightBatch, ((slot, shape, spans),))))
+
+            for batch, arrays, result in jobs:
+                result.get()
+                for cPos in batch.chunkPositions:
+                    chunk = level.getChunk(*cPos)
+                    x, z = batch.slices(*cPos)
+                    for a, light in zip(arrays[1:], lights):
+                        getattr(chunk, light)[..., miny:maxy] = a[x, z]
+
+                workDone += len(batch.chunkPositions)
+                yield workDone, workTotal, progressInfo
+    finally:
+        pool.terminate()
+
+    # light crosses from one batch to the next, and between relit chunks and the others, only in this last sweep
+    batchOf = {}
+    for i, batch in enumerate(batches):
+        for cPos in batch.chunkPositions:
+            batchOf[cPos] = i
+
+    seamChunks = []
+    for (cx, cz), i in sorted(batchOf.iteritems()):
+        neighbours = ((cx - 1, cz), (cx + 1, cz), (cx, cz - 1), (cx, cz + 1))
+        if any(batchOf.get(n) != i and level.containsChunk(*n) for n in neighbours):
+            seamChunks.append(level.getChunk(cx, cz))
+
+    workTotal += len(seamChunks) * 14 * len(lights)
+    for progress in level._disperseLightsIter(seamChunks, lights, ranges, changedSections, workDone, workTotal):
+        yield progress
+
+    for cPos in relitChunkPositions:
+        chunk = level.getChunk(*cPos)
+        chunk.needsLighting = False
+        if chunk.unlitSections:
+            chunk.unlitSections.clear()
@@ -0,0 +1,37 @@
+'''
+Background loading of chunks for passes that visit every chunk of a box.
+
+Loading an Anvil chunk means reading it from its region file, inflating it, parsing the NBT and unpacking the
+sections. zlib and file reads release the GIL, so a few threads can do that work for the next chunks of a box while
+the caller is still busy with the current one.
+'''
+import collections
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+__all__ = ["lookahead", "workerPool"]
+
+_pool = None
+
+
+def workerPool():
+    """ Returns the thread pool shared by all levels for background chunk loading. """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool(max(2, min(cpu_count(), 8)))
+    return _pool
+
+
+def lookahead(items, prefetch, depth):
+    """ Yields items unchanged, calling prefetch(item) on each item depth items before it is yielded. prefetch is
+    expected to start loading the item's chunks in the background, for example by calling level.prefetchChunk.
+    """
+    window = collections.deque()
+    for item in items:
+        prefetch(item)
+        window.append(item)
+        if len(window) > depth:
+            yield window.popleft()
+
+    while window:
+        yield window.popleft()
@@ -1,9 +1,13 @@
+import bisect
+from contextlib import contextmanager
 import logging
+import mmap
 import os
 import struct
+import threading
 import zlib
 
-from numpy import fromstring
+from numpy import concatenate, diff, flatnonzero, fromstring, ones, zeros_like
 import time
 from mclevelbase import notclosing, RegionMalformed, ChunkNotPresent
 import nbt
@@ -21,8 +25,93 @@ def inflate(data):
     return zlib.decompress(data)
 
 
+class FreeExtents(object):
+    """
+    The free sectors of a region file, kept as a sorted list of runs. Adjacent runs are always merged, so finding
+    room for a chunk looks at each gap in the file once instead of at each sector.
+    """
+
+    def __init__(self, sectorCount, runs=()):
+        self.sectorCount = sectorCount
+        self._starts = [start for start, count in runs]
+        self._counts = [count for start, count in runs]
+
+    @classmethod
+    def fromUsedSectors(cls, used):
+        """ Build from an array of booleans that is True for each sector in use. """
+        edges = diff(concatenate(([1], used, [1])).astype('int8'))
+        starts = flatnonzero(edges == -1)
+        ends = flatnonzero(edges == 1)
+        return cls(len(used), zip(starts.tolist(), (ends - starts).tolist()))
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._counts))
+
+    def __len__(self):
+        return len(self._starts)
+
+    @property
+    def freeCount(self):
+        return sum(self._counts)
+
+    def isFree(self, sector):
+        i = bisect.bisect_right(self._starts, sector) - 1
+        return i >= 0 and sector < self._starts[i] + self._counts[i]
+
+    def release(self, start, count):
+        """ Mark count sectors starting at start as free. They must currently be in use. """
+        if count == 0:
+            return
+        i = bisect.bisect_left(self._starts, start)
+        if i > 0 and self._starts[i - 1] + self._counts[i - 1] == start:
+            i -= 1
+            self._counts[i] += count
+        else:
+            self._starts.insert(i, start)
+            self._counts.insert(i, count)
+
+        if i + 1 < len(self._starts) and self._starts[i] + self._counts[i] == self._starts[i + 1]:
+            self._counts[i] += self._counts.pop(i + 1)
+            del self._starts[i + 1]
+
+    def allocate(self, count):
+        """
+        Take the first run of count free sectors and return its start. If no run is large enough, the sectors are
+        taken from the end of the file, reusing a free run that reaches the end, and sectorCount grows.
+        """
+        for i, runCount in enumerate(self._counts):
+            if runCount >= count:
+                start = self._starts[i]
+                if runCount == count:
+                    del self._starts[i]
+                    del self._counts[i]
+                else:
+                    self._starts[i] += count
+                    self._counts[i] -= count
+                return start
+
+        if self._starts and self._starts[-1] + self._counts[-1] == self.sectorCount:
+            start = self._starts.pop()
+            self._counts.pop()
+        else:
+            start = self.sectorCount
+
+        self.sectorCount = start + count
+        return start
+
+
 class MCRegionFile(object):
+    """
+    A region file holding up to 32x32 chunks.
+
+    Chunk payloads are read through a read-only memory map of the file, which is dropped whenever the file is written
+    and mapped again on the next read. The offset and timestamp tables are kept in memory. If deferHeader is set (see
+    batch()), changes to them are only written by flushHeader() or close().
+
+    Reads and writes are serialized by a lock, so chunks may be read from other threads.
+    """
     holdFileOpen = False  # if False, reopens and recloses the file on each access
+    deferHeader = False  # if True, offset and timestamp changes stay in memory until flushHeader()
 
     @property
     def file(self):
@@ -35,9 +124,12 @@ class MCRegionFile(object):
             return openfile()
 
     def close(self):
-        if MCRegionFile.holdFileOpen:
-            self._file.close()
-            self._file = None
+        with self.lock:
+            self.flushHeader()
+            self._unmap()
+            if MCRegionFile.holdFileOpen and self._file is not None:
+                self._file.close()
+                self._file = None
 
     def __del__(self):
         self.close()
@@ -46,6 +138,9 @@ class MCRegionFile(object):
         self.path = path
         self.regionCoords = regionCoords
         self._file = None
+        self._map = None
+        self._headerDirty = False
+        self.lock = threading.RLock()
         if not os.path.exists(path):
             file(path, "w").close()
 
@@ -64,29 +159,10 @@ class MCRegionFile(object):
             offsetsData = f.read(self.SECTOR_BYTES)
             modTimesData = f.read(self.SECTOR_BYTES)
 
-            self.freeSectors = [True] * (filesize / self.SECTOR_BYTES)
-            self.freeSectors[0:2] = False, False
-
             self.offsets = fromstring(offsetsData, dtype='>u4')
             self.modTimes = fromstring(modTimesData, dtype='>u4')
 
-        needsRepair = False
-
-        for offset in self.offsets:
-            sector = offset >> 8
-            count = offset & 0xff
-
-            for i in xrange(sector, sector + count):
-                if i >= len(self.freeSectors):
-                    # raise RegionMalformed("Region file offset table points to sector {0} (past the end of the file)".format(i))
-                    print "Region file offset table points to sector {0} (past the end of the file)".format(i)
-                    needsRepair = True
-                    break
-                if self.freeSectors[i] is False:
-                    needsRepair = True
-                self.freeSectors[i] = False
-
-        if needsRepair:
+        if not self._findFreeExtents(filesize / self.SECTOR_BYTES):
             self.repair()
 
         log.info("Found region file {file} with {used}/{total} sectors used and {chunks} chunks present".format(
@@ -95,13 +171,39 @@ class MCRegionFile(object):
     def __repr__(self):
         return "%s(\"%s\")" % (self.__class__.__name__, self.path)
 
+    def _findFreeExtents(self, sectorCount):
+        """ Rebuild freeExtents from the offset table. Returns False if chunks overlap or lie past the end of the
+        file. """
+        used = ones(sectorCount, dtype=bool)
+        used[2:] = False
+        consistent = True
+
+        for offset in self.offsets:
+            sector = offset >> 8
+            count = offset & 0xff
+
+            if sector + count > sectorCount:
+                log.warning("Region file {file} offset table points to sector {sector} (past the end of the file)"
+                            .format(file=os.path.basename(self.path), sector=sector + count - 1))
+                consistent = False
+            if used[sector:sector + count].any():
+                consistent = False
+            used[sector:sector + count] = True
+
+        self.freeExtents = FreeExtents.fromUsedSectors(used)
+        return consistent
+
     @property
     def usedSectors(self):
-        return len(self.freeSectors) - sum(self.freeSectors)
+        return self.sectorCount - self.freeExtents.freeCount
 
     @property
     def sectorCount(self):
-        return len(self.freeSectors)
+        return self.freeExtents.sectorCount
+
+    def freeRuns(self):
+        """ Returns the free space in the file as a list of (start, count) sector runs. """
+        return list(self.freeExtents)
 
     @property
     def chunkCount(self):
@@ -109,7 +211,7 @@ class MCRegionFile(object):
 
     def repair(self):
         lostAndFound = {}
-        _freeSectors = [True] * len(self.freeSectors)
+        _freeSectors = [True] * self.sectorCount
         _freeSectors[0] = _freeSectors[1] = False
         deleted = 0
         recovered = 0
@@ -126,7 +228,7 @@ class MCRegionFile(object):
                 sectorCount = offset & 0xff
                 try:
 
-                    if sectorStart + sectorCount > len(self.freeSectors):
+                    if sectorStart + sectorCount > self.sectorCount:
                         raise RegionMalformed(
                             "Offset {start}:{end} ({offset}) at index {index} pointed outside of the file".format(
                                 start=sectorStart, end=sectorStart + sectorCount, index=index, offset=offset))
@@ -163,6 +265,8 @@ class MCRegionFile(object):
                     self.setOffset(cx, cz, 0)
                     deleted += 1
 
+        self._findFreeExtents(self.sectorCount)
+
         for cPos, foundData in lostAndFound.iteritems():
             cx, cz = cPos
             if self.getOffset(cx, cz) == 0:
@@ -185,22 +289,34 @@ class MCRegionFile(object):
         if numSectors == 0:
             raise ChunkNotPresent((cx, cz))
 
-        if sectorStart + numSectors > len(self.freeSectors):
+        if sectorStart + numSectors > self.sectorCount:
             raise ChunkNotPresent((cx, cz))
 
-        with self.file as f:
-            f.seek(sectorStart * self.SECTOR_BYTES)
-            data = f.read(numSectors * self.SECTOR_BYTES)
-        if len(data) < 5:
-            raise RegionMalformed("Chunk data is only %d bytes long (expected 5)" % len(data))
+        start = sectorStart * self.SECTOR_BYTES
+        with self.lock:
+            regionMap = self._getMap()
+            end = min(start + numSectors * self.SECTOR_BYTES, len(regionMap))
+            if end - start < 5:
+                raise RegionMalformed("Chunk data is only %d bytes long (expected 5)" % max(0, end - start))
 
-        # log.debug("REGION LOAD {0},{1} sector {2}".format(cx, cz, sectorStart))
+            # log.debug("REGION LOAD {0},{1} sector {2}".format(cx, cz, sectorStart))
 
-        length = struct.unpack_from(">I", data)[0]
-        format = struct.unpack_from("B", data, 4)[0]
-        data = data[5:length + 5]
+            length, format = struct.unpack_from(">IB", regionMap, start)
+            data = regionMap[start + 5:min(start + length + 4, end)]
         return data, format
 
+    def _getMap(self):
+        if self._map is None:
+            with self.file as f:
+                f.flush()
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
     def readChunk(self, cx, cz):
         data, format = self._readChunk(cx, cz)
         if format == self.VERSION_GZIP:
@@ -230,86 +346,162 @@ class MCRegionFile(object):
     def _saveChunk(self, cx, cz, data, format):
         cx &= 0x1f
         cz &= 0x1f
+        with self.lock:
+            offset = self.getOffset(cx, cz)
+            sectorNumber = self._allocateSectors(cx, cz, len(data))
+
+            if self.sectorCount > self._fileSectors():
+                self._growFile()
+
+            self.writeSector(sectorNumber, data, format)
+            if self.offsets[cx + cz * 32] != offset:
+                self._headerDirty = True
+
+            self.setTimestamp(cx, cz)
+
+    def saveChunks(self, chunks):
+        """
+        Save a batch of already compressed chunks. chunks is an iterable of (cx, cz, data, format) tuples.
+
+        Sectors for the whole batch are allocated before anything is written, the file is grown at most once, the
+        sectors are written in file order, and the offset and timestamp tables are written once at the end.
+        """
+        with self.lock:
+            writes = []
+            timestamp = time.time()
+            for cx, cz, data, format in chunks:
+                cx &= 0x1f
+                cz &= 0x1f
+                sectorNumber = self._allocateSectors(cx, cz, len(data))
+                self.modTimes[cx + cz * 32] = timestamp
+                writes.append((sectorNumber, data, format))
+
+            if not writes:
+                return
+
+            if self.sectorCount > self._fileSectors():
+                self._growFile()
+
+            writes.sort(key=lambda w: w[0])
+            self._unmap()
+            with self.file as f:
+                for sectorNumber, data, format in writes:
+                    self._writeSector(f, sectorNumber, data, format)
+
+            self._headerDirty = True
+            if not self.deferHeader:
+                self.flushHeader()
+
+        log.debug("REGION SAVE {0} chunks to {1}".format(len(writes), os.path.basename(self.path)))
+
+    def _allocateSectors(self, cx, cz, length):
+        """
+        Find room for length bytes of compressed data for the chunk at cx, cz (region-local coordinates) and return
+        the first sector. Only updates freeExtents and the offset table in memory; if the chunk does not fit in the
+        free sectors, sectorCount grows past the end of the file and the caller must grow the file.
+        """
         offset = self.getOffset(cx, cz)
 
         sectorNumber = offset >> 8
         sectorsAllocated = offset & 0xff
-        sectorsNeeded = (len(data) + self.CHUNK_HEADER_SIZE) / self.SECTOR_BYTES + 1
+        sectorsNeeded = (length + self.CHUNK_HEADER_SIZE) / self.SECTOR_BYTES + 1
 
         if sectorsNeeded >= 256:
-            raise ChunkTooBig("Chunk too big! %d bytes exceeds 1MB" % len(data))
+            raise ChunkTooBig("Chunk too big! %d bytes exceeds 1MB" % length)
 
         if sectorNumber != 0 and sectorsAllocated >= sectorsNeeded:
-            log.debug("REGION SAVE {0},{1} rewriting {2}b".format(cx, cz, len(data)))
-            self.writeSector(sectorNumber, data, format)
-        else:
-            # we need to allocate new sectors
-
-            # mark the sectors previously used for this chunk as free
-            for i in xrange(sectorNumber, sectorNumber + sectorsAllocated):
-                self.freeSectors[i] = True
+            log.debug("REGION SAVE {0},{1} rewriting {2}b".format(cx, cz, length))
+            return sectorNumber
 
-            runLength = 0
-            runStart = 0
-            try:
-                runStart = self.freeSectors.index(True)
-
-                for i in range(runStart, len(self.freeSectors)):
-                    if runLength:
-                        if self.freeSectors[i]:
-                            runLength += 1
-                        else:
-                            runLength = 0
-                    elif self.freeSectors[i]:
-                        runStart = i
-                        runLength = 1
+        # we need to allocate new sectors, and the sectors previously used for this chunk are free
+        if sectorNumber != 0:
+            self.freeExtents.release(sectorNumber, sectorsAllocated)
 
-                    if runLength >= sectorsNeeded:
-                        break
-            except ValueError:
-                pass
-
-            # we found a free space large enough
-            if runLength >= sectorsNeeded:
-                log.debug("REGION SAVE {0},{1}, reusing {2}b".format(cx, cz, len(data)))
-                sectorNumber = runStart
-                self.setOffset(cx, cz, sectorNumber << 8 | sectorsNeeded)
-                self.writeSector(sectorNumber, data, format)
-                self.freeSectors[sectorNumber:sectorNumber + sectorsNeeded] = [False] * sectorsNeeded
-
-            else:
-                # no free space large enough found -- we need to grow the
-                # file
+        sectorCount = self.sectorCount
+        sectorNumber = self.freeExtents.allocate(sectorsNeeded)
+        if self.sectorCount > sectorCount:
+            log.debug("REGION SAVE {0},{1}, growing by {2}b".format(cx, cz, length))
+        else:
+            log.debug("REGION SAVE {0},{1}, reusing {2}b".format(cx, cz, length))
 
-                log.debug("REGION SAVE {0},{1}, growing by {2}b".format(cx, cz, len(data)))
+        self.offsets[cx + cz * 32] = sectorNumber << 8 | sectorsNeeded
+        return sectorNumber
 
-                with self.file as f:
-                    f.seek(0, 2)
-                    filesize = f.tell()
+    def _fileSectors(self):
+        return os.path.getsize(self.path) / self.SECTOR_BYTES
 
-                    sectorNumber = len(self.freeSectors)
+    def _growFile(self):
+        """ Extend the file to cover sectorCount sectors. """
+        self._unmap()
+        with self.file as f:
+            f.truncate(self.sectorCount * self.SECTOR_BYTES)
 
-                    assert sectorNumber * self.SECTOR_BYTES == filesize
+    def compact(self):
+        """
+        Rewrite the file with its chunks stored back to back after the header, in their current order, and truncate
+        it. The new file is written next to the old one and then replaces it.
 
-                    filesize += sectorsNeeded * self.SECTOR_BYTES
-                    f.truncate(filesize)
+        Returns the number of bytes reclaimed.
+        """
+        with self.lock:
+            oldSize = self.sectorCount * self.SECTOR_BYTES
+            regionMap = self._getMap()
+            offsets = zeros_like(self.offsets)
+            sector = 2
+
+            tempPath = self.path + ".compact"
+            with file(tempPath, "wb") as f:
+                for index in sorted(flatnonzero(self.offsets), key=lambda i: self.offsets[i]):
+                    offset = self.offsets[index]
+                    start = (offset >> 8) * self.SECTOR_BYTES
+                    count = offset & 0xff
+
+                    length = struct.unpack_from(">I", regionMap, start)[0]
+                    count = min(count, (length - 1 + self.CHUNK_HEADER_SIZE) / self.SECTOR_BYTES + 1)
+
+                    f.seek(sector * self.SECTOR_BYTES)
+                    f.write(regionMap[start:start + count * self.SECTOR_BYTES])
+                    offsets[index] = sector << 8 | count
+                    sector += count
+
+                f.truncate(sector * self.SECTOR_BYTES)
+                f.seek(0)
+                f.write(offsets.tostring() + self.modTimes.tostring())
+
+            self._unmap()
+            if MCRegionFile.holdFileOpen and self._file is not None:
+                self._file.close()
+                self._file = None
 
-                self.freeSectors += [False] * sectorsNeeded
+            try:
+                os.rename(tempPath, self.path)
+            except OSError:
+                # Windows will not rename over an existing file
+                os.remove(self.path)
+                os.rename(tempPath, self.path)
 
-                self.setOffset(cx, cz, sectorNumber << 8 | sectorsNeeded)
-                self.writeSector(sectorNumber, data, format)
+            self.offsets = offsets
+            self.freeExtents = FreeExtents(sector)
+            self._headerDirty = False
 
-        self.setTimestamp(cx, cz)
+        reclaimed = oldSize - sector * self.SECTOR_BYTES
+        log.info("Compacted {file}, reclaimed {bytes} bytes".format(file=os.path.basename(self.path), bytes=reclaimed))
+        return reclaimed
 
     def writeSector(self, sectorNumber, data, format):
-        with self.file as f:
-            log.debug("REGION: Writing sector {0}".format(sectorNumber))
+        with self.lock:
+            self._unmap()
+            with self.file as f:
+                self._writeSector(f, sectorNumber, data, format)
+
+    def _writeSector(self, f, sectorNumber, data, format):
+        log.debug("REGION: Writing sector {0}".format(sectorNumber))
 
-            f.seek(sectorNumber * self.SECTOR_BYTES)
-            f.write(struct.pack(">I", len(data) + 1))  # // chunk length
-            f.write(struct.pack("B", format))  # // chunk version number
-            f.write(data)  # // chunk data
-            # f.flush()
+        f.seek(sectorNumber * self.SECTOR_BYTES)
+        f.write(struct.pack(">I", len(data) + 1))  # // chunk length
+        f.write(struct.pack("B", format))  # // chunk version number
+        f.write(data)  # // chunk data
+        # f.flush()
 
     def containsChunk(self, cx, cz):
         return self.getOffset(cx, cz) != 0
@@ -323,9 +515,9 @@ class MCRegionFile(object):
         cx &= 0x1f
         cz &= 0x1f
         self.offsets[cx + cz * 32] = offset
-        with self.file as f:
-            f.seek(0)
-            f.write(self.offsets.tostring())
+        self._headerDirty = True
+        if not self.deferHeader:
+            self.flushHeader()
 
     def getTimestamp(self, cx, cz):
         cx &= 0x1f
@@ -339,9 +531,31 @@ class MCRegionFile(object):
         cx &= 0x1f
         cz &= 0x1f
         self.modTimes[cx + cz * 32] = timestamp
-        with self.file as f:
-            f.seek(self.SECTOR_BYTES)
-            f.write(self.modTimes.tostring())
+        self._headerDirty = True
+        if not self.deferHeader:
+            self.flushHeader()
+
+    def flushHeader(self):
+        """ Write the offset and timestamp tables if they were changed since they were last written. """
+        with self.lock:
+            if not self._headerDirty:
+                return
+            with self.file as f:
+                f.seek(0)
+                f.write(self.offsets.tostring() + self.modTimes.tostring())
+            self._headerDirty = False
+
+    @contextmanager
+    def batch(self):
+        """ Defer header writes until the end of the with block. """
+        deferHeader = self.deferHeader
+        self.deferHeader = True
+        try:
+            yield self
+        finally:
+            self.deferHeader = deferHeader
+            if not deferHeader:
+                self.flushHeader()
 
     SECTOR_BYTES = 4096
     SECTOR_INTS = SECTOR_BYTES / 4
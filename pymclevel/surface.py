@@ -0,0 +1,102 @@
+'''
+Surface maps: the height of the highest block of some kind in each column.
+
+The HeightMap tag of a chunk follows the sky light, so it passes through glass and leaves. Generators usually want the
+top of the terrain instead, so these maps classify blocks by their material type:
+
+WORLD_SURFACE              every block but air
+MOTION_BLOCKING            blocks that stop movement, and fluids. Flowers, crops, torches, rails, signs, buttons and
+                           the like are left out.
+MOTION_BLOCKING_NO_LEAVES  MOTION_BLOCKING without leaves
+OCEAN_FLOOR                MOTION_BLOCKING without fluids
+GROUND                     OCEAN_FLOOR without leaves and logs: the terrain under trees and water
+
+Like HeightMap, a surface map holds the height just above the highest matching block of each column, or 0 for a
+column without one. Unlike HeightMap, it is indexed [x,z] like the block arrays.
+'''
+from numpy import argmax, flatnonzero, ones, zeros
+
+__all__ = ["SURFACE_KINDS", "surfaceBlockTable", "computeSurfaceMap", "updateSurfaceMap", "surfaceMap"]
+
+SURFACE_KINDS = ("WORLD_SURFACE", "MOTION_BLOCKING", "MOTION_BLOCKING_NO_LEAVES", "OCEAN_FLOOR", "GROUND")
+
+PASSABLE_TYPES = frozenset(["DECORATION_CROSS", "CROPS", "STEM", "NETHER_WART", "FLOOR", "TORCH", "SIMPLE_RAIL",
+                            "PRESSURE_PLATE", "BUTTON", "LEVER", "SIGNPOST", "WALLSIGN", "LADDER", "VINE", "PORTAL",
+                            "ENDER_PORTAL"])
+
+FLUIDS = frozenset(["flowing_water", "water", "flowing_lava", "lava"])
+TREE_TRUNKS = frozenset(["log", "log2", "brown_mushroom_block", "red_mushroom_block"])
+
+_tables = {}
+
+
+def _blockIDs(materials, idStrs):
+    return [blockID for blockID in range(materials.id_limit) if materials.idStr[blockID] in idStrs]
+
+
+def surfaceBlockTable(materials, kind):
+    """ Returns a boolean array indexed by block ID that is True for the blocks counted by the given kind of surface
+    map. Blocks unknown to the materials count as solid. """
+    table = _tables.get((materials, kind))
+    if table is not None:
+        return table
+
+    if kind not in SURFACE_KINDS:
+        raise ValueError("Unknown surface map kind {0!r}, expected one of {1}".format(kind, ", ".join(SURFACE_KINDS)))
+
+    table = ones(materials.id_limit, bool)
+    table[0] = False
+    if kind != "WORLD_SURFACE":
+        # materials.type is only reliable for blockData 0
+        for blockID in range(materials.id_limit):
+            if materials.type[blockID][0] in PASSABLE_TYPES:
+                table[blockID] = False
+
+    if kind in ("MOTION_BLOCKING_NO_LEAVES", "GROUND"):
+        for blockID in range(materials.id_limit):
+            if materials.type[blockID][0] == "LEAVES":
+                table[blockID] = False
+
+    if kind in ("OCEAN_FLOOR", "GROUND"):
+        table[_blockIDs(materials, FLUIDS)] = False
+
+    if kind == "GROUND":
+        table[_blockIDs(materials, TREE_TRUNKS)] = False
+
+    _tables[materials, kind] = table
+    return table
+
+
+def computeSurfaceMap(materials, blocks, kind):
+    """ Returns the surface map of the given kind for a block array indexed [x,z,y]. """
+    matches = surfaceBlockTable(materials, kind)[blocks]
+    # argmax finds the first match from the top; columns without one give 0 there too
+    fromTop = argmax(matches[..., ::-1], 2)
+    heights = (matches.shape[2] - fromTop).astype('uint16')
+    heights[~matches.any(2)] = 0
+    return heights
+
+
+def updateSurfaceMap(materials, blocks, heights, kind, x, z, y):
+    """ Update heights, the surface map of the given kind for blocks, after the block at x,z,y was changed. """
+    top = heights[x, z]
+    if surfaceBlockTable(materials, kind)[blocks[x, z, y]]:
+        if y >= top:
+            heights[x, z] = y + 1
+    elif y == top - 1:
+        below = flatnonzero(surfaceBlockTable(materials, kind)[blocks[x, z, :y]])
+        heights[x, z] = below[-1] + 1 if len(below) else 0
+
+
+def surfaceMap(level, box, kind="WORLD_SURFACE"):
+    """ Returns the surface map of the given kind for the columns of box, indexed [x,z] relative to the box origin.
+    The heights are level Y coordinates taken from the whole column, not just the part inside the box. Columns in
+    missing chunks are 0. See the surface module for the kinds. """
+    surfaceBlockTable(level.materials, kind)  # check the kind
+    result = zeros((box.width, box.length), 'uint16')
+    for chunk, slices, (x, y, z) in level.getChunkSlices(box):
+        chunkHeights = chunk.surfaceHeights(kind)[slices[:2]]
+        w, l = chunkHeights.shape
+        result[x:x + w, z:z + l] = chunkHeights
+
+    return result
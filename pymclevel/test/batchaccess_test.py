@@ -0,0 +1,96 @@
+import unittest
+
+import numpy
+
+from pymclevel.schematic import MCSchematic
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestBatchedBlockAccess(unittest.TestCase):
+    def setUp(self):
+        chunkPositions = [(cx, cz) for cx in range(-2, 2) for cz in range(-2, 2)]
+        self.temp = TempLevel("BatchAccess", createFunc=lambda path: makeAnvilLevel(path, chunkPositions))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testSetAndGet(self):
+        level = self.level
+        rand = numpy.random.RandomState(0)
+        xs, zs = rand.randint(-32, 32, (2, 1000))
+        ys = rand.randint(0, level.Height, 1000)
+        ids = rand.randint(1, 200, 1000)
+        data = rand.randint(0, 16, 1000)
+
+        # keep the last of any repeated positions, so the expected values are well defined
+        _, unique = numpy.unique(xs * 1000000 + zs * 1000 + ys, return_index=True)
+        xs, ys, zs, ids, data = xs[unique], ys[unique], zs[unique], ids[unique], data[unique]
+
+        level.setBlocks(xs, ys, zs, ids, data)
+        self.assertTrue((level.getBlocks(xs, ys, zs) == ids).all())
+        self.assertTrue((level.getBlockData(xs, ys, zs) == data).all())
+        for i in range(0, len(xs), 37):
+            self.assertEqual(ids[i], level.blockAt(xs[i], ys[i], zs[i]))
+            self.assertEqual(data[i], level.blockDataAt(xs[i], ys[i], zs[i]))
+
+        self.assertEqual(16, len(level.chunksNeedingLighting))
+        self.assertTrue(all(chunk.dirty for chunk in level.getChunks()))
+
+    def testBroadcastAndOutside(self):
+        level = self.level
+        xs = numpy.arange(-40, 40)
+        level.setBlocks(xs, 64, 5, 4, readahead=True)
+
+        blocks = level.getBlocks(xs, 64, 5)
+        self.assertEqual(xs.shape, blocks.shape)
+        self.assertTrue((blocks[8:72] == 4).all())
+        self.assertFalse(blocks[:8].any() or blocks[72:].any())
+
+        self.assertEqual([0, 0], list(level.getBlocks([0, 0], [-1, level.Height], [0, 0])))
+        self.assertEqual((2, 3), level.getBlocks(numpy.zeros((2, 3), int), 64, 5).shape)
+
+    def testSchematic(self):
+        sch = MCSchematic(shape=(4, 4, 4))
+        sch.setBlocks([0, 3, 4], [1, 2, 3], [3, 0, 0], [1, 2, 3], [5, 6, 7])
+        self.assertEqual([1, 2, 0], list(sch.getBlocks([0, 3, 4], [1, 2, 3], [3, 0, 0])))
+        self.assertEqual([5, 6, 0], list(sch.getBlockData([0, 3, 4], [1, 2, 3], [3, 0, 0])))
+
+
+class TestBlockAndData(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("BlockAndData", createFunc=lambda path: makeAnvilLevel(path, [(-1, 0), (0, 0)]))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testInfiniteLevel(self):
+        level = self.level
+        level.saveInPlace()
+        level.setBlockAndDataAt(-3, 70, 5, 35, 14)
+        self.assertEqual((35, 14), level.blockAndDataAt(-3, 70, 5))
+        self.assertEqual(35, level.blockAt(-3, 70, 5))
+        self.assertEqual(14, level.blockDataAt(-3, 70, 5))
+
+        chunk = level.getChunk(-1, 0)
+        self.assertEqual({4}, chunk.dirtySections["blocks"])
+        self.assertTrue(chunk.needsLighting)
+
+        self.assertEqual((0, 0), level.blockAndDataAt(40, 70, 5))
+        self.assertEqual((0, 0), level.blockAndDataAt(0, -1, 5))
+        level.setBlockAndDataAt(40, 70, 5, 35, 14)  # missing chunk, ignored
+
+    def testCursor(self):
+        level = self.level
+        with level.cursor() as cursor:
+            cursor.setBlockAndDataAt(2, 10, 2, 17, 2)
+            self.assertEqual((17, 2), cursor.blockAndDataAt(2, 10, 2))
+        self.assertEqual((17, 2), level.blockAndDataAt(2, 10, 2))
+
+    def testSchematic(self):
+        sch = MCSchematic(shape=(4, 4, 4))
+        sch.setBlockAndDataAt(1, 2, 3, 35, 0x1e)
+        self.assertEqual((35, 0xe), sch.blockAndDataAt(1, 2, 3))
+        self.assertEqual((0, 0), sch.blockAndDataAt(4, 2, 3))
+        sch.setBlockAndDataAt(-1, 2, 3, 35, 1)
@@ -0,0 +1,40 @@
+import unittest
+
+import numpy
+
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestBiomes(unittest.TestCase):
+    def setUp(self):
+        chunkPositions = [(cx, cz) for cx in (-1, 0) for cz in (-1, 0)]
+        self.temp = TempLevel("Biomes", createFunc=lambda path: makeAnvilLevel(path, chunkPositions))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testNegativeCoordinates(self):
+        level = self.level
+        level.setBiomeAt(-1, -16, 4)
+        self.assertEqual(4, level.biomeAt(-1, -16))
+        self.assertEqual(4, level.getChunk(-1, -1).Biomes[0, 15])
+        self.assertNotEqual(4, level.biomeAt(0, -16))
+        self.assertTrue(level.getChunk(-1, -1).dirty)
+
+    def testBulk(self):
+        level = self.level
+        box = BoundingBox((-20, 0, -4), (40, 1, 8))
+        biomes = numpy.arange(40 * 8).reshape(40, 8) % 100
+        level.setBiomes(box, biomes)
+
+        read = level.biomes(box)
+        self.assertEqual((40, 8), read.shape)
+        self.assertTrue((read[4:36] == biomes[4:36]).all())
+        self.assertTrue((read[:4] == 255).all() and (read[36:] == 255).all())  # missing chunks
+        self.assertEqual(biomes[5, 7], level.biomeAt(-15, 3))
+        self.assertEqual(biomes[30, 1], level.biomeAt(10, -3))
+
+        level.setBiomes(BoundingBox((-16, 0, -16), (32, 1, 32)), 7)
+        self.assertTrue((level.biomes(BoundingBox((-16, 0, -16), (32, 1, 32))) == 7).all())
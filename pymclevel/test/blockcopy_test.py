@@ -0,0 +1,77 @@
+import unittest
+
+from pymclevel import nbt
+from pymclevel.box import BoundingBox
+from pymclevel.entity import TileEntity, TileTick
+from pymclevel.level import mergeAtPositions
+from templevel import TempLevel, makeAnvilLevel
+
+CHUNKS = [(cx, cz) for cx in range(-1, 4) for cz in range(-1, 2)]
+CHESTS = BoundingBox((-3, 40, -3), (6, 4, 7))  # across four chunks
+
+
+def tileTick(x, y, z):
+    tag = nbt.TAG_Compound()
+    tag["i"] = nbt.TAG_Int(1)
+    tag["t"] = nbt.TAG_Int(10)
+    for a, p in zip('xyz', (x, y, z)):
+        tag[a] = nbt.TAG_Int(p)
+    return tag
+
+
+class TestCopyEntities(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            level.fillBlocks(BoundingBox((-16, 0, -16), (80, 40, 48)), level.materials.Stone)
+            level.fillBlocks(CHESTS, level.materials["minecraft:chest"])
+            level.addTileTicks([tileTick(0, 41, 0), tileTick(-2, 42, 2)])
+
+        self.temp = TempLevel("BlockCopy", createFunc=lambda path: makeAnvilLevel(path, CHUNKS, build))
+        self.level = self.temp.level
+        self.chest = self.level.materials["minecraft:chest"]
+
+    def tearDown(self):
+        self.temp.close()
+
+    def positions(self, tags, pos, box):
+        return sorted(tuple(pos(t)) for t in tags if pos(t) in box)
+
+    def testCopyOverTileEntities(self):
+        level = self.level
+        dest = BoundingBox((30, 40, -3), CHESTS.size)
+        level.fillBlocks(BoundingBox((31, 41, -2), (2, 2, 2)), self.chest)
+        level.addTileTicks([tileTick(31, 41, -2)])
+
+        level.copyBlocksFrom(level, CHESTS, dest.origin)
+
+        self.assertEqual(sorted(dest.positions), self.positions(level.getTileEntitiesInBox(dest), TileEntity.pos, dest))
+        self.assertEqual([(31, 42, 2), (33, 41, 0)], self.positions(level.getTileTicksInBox(dest), TileTick.pos, dest))
+        self.assertEqual(CHESTS.volume * 2, len(level.getTileEntitiesInBox(level.bounds)))
+
+    def testCopyMasked(self):
+        level = self.level
+        dest = BoundingBox((30, 40, -3), CHESTS.size)
+        level.fillBlocks(dest, self.chest)
+        level.fillBlocks(BoundingBox((-3, 40, -3), (6, 1, 7)), level.materials.Glass)
+
+        level.copyBlocksFrom(level, CHESTS, dest.origin, blocksToCopy=[level.materials.Glass.ID])
+
+        # only the chests under the copied glass are gone
+        destTileEntities = self.positions(level.getTileEntitiesInBox(dest), TileEntity.pos, dest)
+        self.assertEqual(sorted(p for p in dest.positions if p[1] > 40), destTileEntities)
+        self.assertEqual(level.materials.Glass.ID, level.blockAt(31, 40, 0))
+
+    def testExtractSchematic(self):
+        schematic = self.level.extractSchematic(CHESTS)
+        self.assertEqual(CHESTS.volume, len(schematic.TileEntities))
+        self.assertEqual(sorted(schematic.bounds.positions), sorted(tuple(TileEntity.pos(t)) for t in schematic.TileEntities))
+        self.assertEqual(2, len(schematic.TileTicks))
+
+
+class TestMergeAtPositions(unittest.TestCase):
+    def testLastTagWins(self):
+        old = [tileTick(0, 0, 0), tileTick(1, 0, 0)]
+        new = [tileTick(1, 0, 0), tileTick(2, 0, 0), tileTick(1, 0, 0)]
+        merged = mergeAtPositions(old, new, TileTick.pos)
+
+        self.assertEqual([old[0], new[1], new[2]], merged)
@@ -0,0 +1,54 @@
+import unittest
+
+from pymclevel.schematic import MCSchematic
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestBlockCursor(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("BlockCursor", createFunc=lambda path: makeAnvilLevel(path, [(0, 0), (-1, 0)]))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testReadWriteFlush(self):
+        level = self.level
+        with level.cursor() as cursor:
+            for x in range(-16, 16):
+                cursor.setBlockAt(x, 10, 3, 4)
+            cursor.setBlockDataAt(-1, 10, 3, 2)
+            cursor.setBlockAt(40, 10, 3, 4)  # missing chunk
+            cursor.setBlockAt(0, 300, 3, 4)
+
+            self.assertEqual(4, cursor.blockAt(-16, 10, 3))
+            self.assertEqual(2, cursor.blockDataAt(-1, 10, 3))
+            self.assertEqual(0, cursor.blockAt(40, 10, 3))
+            self.assertEqual(level.materials, cursor.materials)
+            self.assertFalse(level.getChunk(0, 0).dirty)
+            self.assertEqual(set([(0, 0), (-1, 0)]), set(cursor.changedChunks))
+
+        self.assertTrue(level.getChunk(0, 0).dirty)
+        self.assertEqual(set([(0, 0), (-1, 0)]), set(level.chunksNeedingLighting))
+        self.assertEqual(4, level.blockAt(-16, 10, 3))
+        self.assertEqual(2, level.blockDataAt(-1, 10, 3))
+
+    def testChangeMasks(self):
+        cursor = self.level.cursor()
+        cursor.setBlockAt(5, 6, 7, 1)
+        cursor.setBlockDataAt(5, 6, 8, 1)
+        masks = cursor.flush()
+        self.assertEqual([(0, 0)], masks.keys())
+        self.assertEqual(2, masks[0, 0].sum())
+        self.assertTrue(masks[0, 0][5, 7, 6] and masks[0, 0][5, 8, 6])
+        self.assertEqual({}, cursor.flush())
+
+    def testSchematic(self):
+        sch = MCSchematic(shape=(20, 4, 4))
+        cursor = sch.cursor()
+        cursor.setBlockAt(18, 1, 2, 3)
+        cursor.setBlockAt(20, 1, 2, 3)
+        cursor.flush()
+        self.assertEqual(3, sch.Blocks[18, 2, 1])
+        self.assertEqual(3, cursor.blockAt(18, 1, 2))
+        self.assertEqual(0, cursor.blockAt(20, 1, 2))
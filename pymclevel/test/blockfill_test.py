@@ -0,0 +1,58 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.entity import TileEntity
+from templevel import TempLevel, makeAnvilLevel
+
+CHUNKS = [(cx, cz) for cx in range(-1, 2) for cz in range(-1, 2)]
+
+
+class TestFillTileEntities(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            level.fillBlocks(BoundingBox((-16, 0, -16), (48, 64, 48)), level.materials.Stone)
+
+        self.temp = TempLevel("BlockFill", createFunc=lambda path: makeAnvilLevel(path, CHUNKS, build))
+        self.level = self.temp.level
+        self.chest = self.level.materials["minecraft:chest"]
+
+    def tearDown(self):
+        self.temp.close()
+
+    def tileEntityPositions(self, box):
+        return sorted(tuple(TileEntity.pos(t)) for t in self.level.getTileEntitiesInBox(box))
+
+    def testFillWithChests(self):
+        level = self.level
+        box = BoundingBox((-3, 60, -2), (8, 6, 20))  # across chunk seams and above the stone
+        level.fillBlocks(box, self.chest)
+
+        self.assertEqual(sorted(box.positions), self.tileEntityPositions(level.bounds))
+        for x, y, z in (-3, 60, -2), (4, 65, 17), (0, 62, 16):
+            self.assertEqual(self.chest.ID, level.blockAt(x, y, z))
+            self.assertEqual("Chest", level.tileEntityAt(x, y, z)["id"].value)
+        self.assertEqual({3, 4}, level.getChunk(0, 1).dirtySections["entities"])
+
+        # filling again replaces the chests instead of adding more
+        level.fillBlocks(box, self.chest)
+        self.assertEqual(box.volume, len(level.getTileEntitiesInBox(box)))
+
+    def testReplaceWithChests(self):
+        level = self.level
+        materials = level.materials
+        for x, y, z in (0, 40, 0), (15, 41, 16), (-5, 42, 3):
+            level.setBlockAt(x, y, z, materials.Glass.ID)
+
+        level.fillBlocks(BoundingBox((-8, 30, -8), (24, 20, 32)), self.chest, [materials.Glass])
+
+        self.assertEqual([(-5, 42, 3), (0, 40, 0), (15, 41, 16)], self.tileEntityPositions(level.bounds))
+        self.assertEqual(self.chest.ID, level.blockAt(15, 41, 16))
+        self.assertEqual(materials.Stone.ID, level.blockAt(15, 40, 16))
+
+    def testFillRemovesOtherTileEntities(self):
+        level = self.level
+        level.fillBlocks(BoundingBox((0, 10, 0), (4, 4, 4)), self.chest)
+        level.fillBlocks(BoundingBox((2, 10, 2), (4, 4, 4)), level.materials.Stone)
+
+        self.assertEqual(64 - 8 * 2, len(level.getTileEntitiesInBox(level.bounds)))
+        self.assertEqual(None, level.tileEntityAt(3, 12, 3))
@@ -0,0 +1,68 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.schematic import MCSchematic
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestBlockView(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            level.fillBlocks(BoundingBox((-16, 0, -16), (48, 4, 48)), level.materials.Stone)
+
+        chunkPositions = [(cx, cz) for cx in range(-1, 2) for cz in range(-1, 2)]
+        self.temp = TempLevel("BlockView", createFunc=lambda path: makeAnvilLevel(path, chunkPositions, build))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testReadAndCommit(self):
+        level = self.level
+        box = BoundingBox((-4, 2, -4), (24, 4, 8))
+        view = level.view(box)
+        self.assertEqual((24, 8, 4), view.Blocks.shape)
+        self.assertTrue((view.Blocks[:, :, :2] == 1).all())
+        self.assertFalse(view.Blocks[:, :, 2:].any())
+
+        for chunk in level.getChunks():
+            chunk.dirty = False
+        level.chunksNeedingLighting.clear()
+
+        view.setBlockAt(-4, 5, -4, 20)
+        view.setBlockDataAt(-4, 5, -4, 3)
+        view.Blocks[20, 2, 0] = 3  # x=16, y=2, z=-2
+        self.assertEqual(20, view.blockAt(-4, 5, -4))
+        self.assertEqual(0, view.blockAt(0, 50, 0))
+
+        self.assertEqual(2, view.commit())
+        self.assertEqual(20, level.blockAt(-4, 5, -4))
+        self.assertEqual(3, level.blockDataAt(-4, 5, -4))
+        self.assertEqual(3, level.blockAt(16, 2, -2))
+        self.assertEqual(1, level.blockAt(-3, 2, -4))
+        self.assertEqual(set([(-1, -1), (1, -1)]), set(level.chunksNeedingLighting))
+
+        self.assertEqual(0, view.commit())
+        self.assertFalse(view.changedMask.any())
+
+    def testCommitMarksChangedSections(self):
+        level = self.level
+        view = level.view(BoundingBox((-4, 10, -4), (8, 40, 8)))
+        view.setBlockAt(2, 20, 2, 20)
+        view.setBlockAt(-2, 45, -2, 20)
+        view.commit()
+
+        chunk = level.getChunk(0, 0)
+        self.assertEqual({1}, chunk.dirtySections["blocks"])
+        self.assertEqual({1}, chunk.unlitSections)
+        self.assertEqual({2}, level.getChunk(-1, -1).dirtySections["blocks"])
+        self.assertEqual(set(), level.getChunk(-1, 0).dirtySections["blocks"])
+
+    def testSchematic(self):
+        sch = MCSchematic(shape=(4, 4, 4))
+        view = sch.view(BoundingBox((1, 1, 1), (4, 2, 2)))
+        view.Blocks[:] = 5
+        view.commit()
+        self.assertEqual(5, sch.Blocks[1, 1, 1])
+        self.assertEqual(5, sch.Blocks[3, 2, 2])
+        self.assertEqual(0, sch.Blocks[0, 1, 1])
@@ -0,0 +1,81 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestChunkCache(unittest.TestCase):
+    def setUp(self):
+        chunkPositions = [(cx, 0) for cx in range(4)]
+        self.temp = TempLevel("ChunkCache", createFunc=lambda path: makeAnvilLevel(path, chunkPositions))
+        self.level = self.temp.level
+        # chunk arrays are unpacked on first use
+        for cPos in chunkPositions:
+            self.level._getChunkData(*cPos).Blocks
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testLRUOrder(self):
+        level = self.level
+        cache = level._loadedChunkData
+        chunkSize = cache[0, 0].memoryUsage
+
+        # (0, 0) becomes the most recently used, leaving (1, 0) as the oldest
+        cache.touch((0, 0))
+        level.loadedChunkMemoryLimit = 3.5 * chunkSize / 1048576
+        level._storeLoadedChunkData(cache[3, 0])
+
+        self.assertEqual([(2, 0), (0, 0), (3, 0)], cache.keys())
+        self.assertEqual(3 * chunkSize, cache.memoryUsage)
+        self.assertEqual(1, level.chunkCacheStats["evictions"])
+
+    def testPinnedChunksAreKept(self):
+        level = self.level
+        cache = level._loadedChunkData
+        level.pinChunks([(0, 0), (1, 0)])
+        level.loadedChunkMemoryLimit = 0
+        level._storeLoadedChunkData(cache[3, 0])
+
+        self.assertEqual([(0, 0), (1, 0), (3, 0)], sorted(cache.keys()))
+        self.assertEqual(2, level.chunkCacheStats["pinned"])
+
+        level.unpinChunks([(0, 0), (1, 0)])
+        level._storeLoadedChunkData(cache[3, 0])
+        self.assertEqual([(3, 0)], cache.keys())
+
+    def testEvictedChunksSurvive(self):
+        level = self.level
+        level.setBlockAt(5, 5, 5, 1)
+        level.recentChunks.clear()
+        level.loadedChunkMemoryLimit = 0
+        level.createChunk(4, 0)
+
+        stats = level.chunkCacheStats
+        self.assertTrue(stats["evictions"] > 0)
+        self.assertFalse((0, 0) in level._loadedChunkData)
+
+        self.assertEqual(1, level.blockAt(5, 5, 5))
+        self.assertEqual(stats["misses"] + 1, level.chunkCacheStats["misses"])
+
+    def testPinnedBox(self):
+        level = self.level
+        level.recentChunks.clear()
+        level.loadedChunkMemoryLimit = 0
+        box = BoundingBox((0, 0, 0), (32, 16, 16))
+
+        with level.pinned(box):
+            chunk = level.getChunk(0, 0)
+            level.createChunk(4, 0)
+            self.assertTrue(chunk is level.getChunk(0, 0))
+            self.assertEqual([(0, 0), (1, 0), (4, 0)], sorted(level._loadedChunkData.keys()))
+            self.assertEqual(2, level.chunkCacheStats["pinned"])
+
+        # the box's chunks are only kept now while in use, here as recently used chunks
+        self.assertEqual(0, level.chunkCacheStats["pinned"])
+        self.assertEqual([(0, 0), (1, 0)], sorted(level._loadedChunkData.keys()))
+
+        chunk = None
+        level.recentChunks.clear()
+        level.createChunk(5, 0)
+        self.assertEqual([(5, 0)], level._loadedChunkData.keys())
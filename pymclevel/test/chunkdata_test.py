@@ -0,0 +1,80 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestPackedChunkData(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            level.fillBlocks(BoundingBox((0, 0, 0), (16, 20, 16)), level.materials.Stone)
+            level.setBlockAt(1, 40, 1, 1000)
+            chunk = level.getChunk(0, 0)
+            chunk.BlockLight[2, 2, 2] = 7
+            chunk.SkyLight[:, :, :20] = 0
+
+        self.temp = TempLevel("ChunkData", createFunc=lambda path: makeAnvilLevel(path, [(0, 0)], build))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.level.close()
+        self.temp.close()
+
+    def reopen(self):
+        self.level.saveInPlace()
+        self.level.close()
+        self.level = MCInfdevOldLevel(filename=self.temp.tmpname)
+
+    def testArraysUnpackedOnUse(self):
+        chunkData = self.level.getChunk(0, 0).chunkData
+        packedSize = chunkData.memoryUsage
+        self.assertEqual({}, chunkData._arrays)
+
+        self.assertEqual(1, chunkData.Blocks[0, 0, 19])
+        self.assertEqual(1000, chunkData.Blocks[1, 1, 40])
+        self.assertEqual(0, chunkData.Blocks[0, 0, 100])
+        self.assertEqual(["Blocks"], chunkData._arrays.keys())
+        self.assertTrue(packedSize < chunkData.memoryUsage)
+        self.assertEqual(chunkData.memoryUsage, self.level.chunkCacheStats["memoryUsage"])
+
+        self.assertEqual(15, chunkData.SkyLight[5, 5, 100])
+        self.assertEqual(0, chunkData.SkyLight[5, 5, 10])
+
+    def testPackedArraysSaved(self):
+        chunk = self.level.getChunk(0, 0)
+        chunk.Blocks[3, 3, 3] = 2
+        chunk.dirty = True
+        self.reopen()
+
+        chunk = self.level.getChunk(0, 0)
+        self.assertEqual(2, chunk.Blocks[3, 3, 3])
+        self.assertEqual(1000, chunk.Blocks[1, 1, 40])
+        self.assertEqual(7, chunk.BlockLight[2, 2, 2])
+        self.assertEqual(0, chunk.SkyLight[5, 5, 10])
+        self.assertEqual(15, chunk.SkyLight[5, 5, 30])
+
+    def testUntouchedChunkSaved(self):
+        self.level.getChunk(0, 0).dirty = True
+        self.reopen()
+
+        chunk = self.level.getChunk(0, 0)
+        self.assertEqual(1000, chunk.Blocks[1, 1, 40])
+        self.assertEqual(7, chunk.BlockLight[2, 2, 2])
+        self.assertEqual(0, chunk.SkyLight[5, 5, 10])
+
+
+class TestSectionOrderChunkData(TestPackedChunkData):
+    def setUp(self):
+        MCInfdevOldLevel.sectionOrderArrays = True
+        super(TestSectionOrderChunkData, self).setUp()
+
+    def tearDown(self):
+        super(TestSectionOrderChunkData, self).tearDown()
+        MCInfdevOldLevel.sectionOrderArrays = False
+
+    def testSectionsAreContiguous(self):
+        chunk = self.level.getChunk(0, 0)
+        self.assertEqual((16, 16, 256), chunk.Blocks.shape)
+        self.assertTrue(chunk.Blocks[..., 32:48].swapaxes(0, 2).flags.c_contiguous)
+        self.assertEqual(1000, chunk.Blocks[..., 32:48].swapaxes(0, 2)[8, 1, 1])
@@ -0,0 +1,51 @@
+import os
+import shutil
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import AnvilWorldFolder, MCInfdevOldLevel
+from pymclevel.regionfile import MCRegionFile
+from templevel import makeAnvilLevel, mktemp
+
+
+class TestChunkIndex(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("ChunkIndex")
+        makeAnvilLevel(self.temppath, BoundingBox((-32, 0, -32), (64, 16, 64)).chunkPositions)
+        self.chunks = set((cx, cz) for cx in range(-2, 2) for cz in range(-2, 2))
+
+    def tearDown(self):
+        shutil.rmtree(self.temppath)
+
+    def testIndexSaved(self):
+        self.assertTrue(os.path.exists(os.path.join(self.temppath, AnvilWorldFolder.CHUNK_INDEX_NAME)))
+
+        folder = AnvilWorldFolder(self.temppath)
+        self.assertEqual(self.chunks, folder.listChunks())
+        self.assertTrue(folder.containsChunk(1, 1))
+        self.assertFalse(folder.containsChunk(2, 1))
+        self.assertFalse(folder.containsChunk(100, 100))
+        self.assertEqual({}, folder.regionFiles)
+
+    def testStaleEntryIgnored(self):
+        folder = AnvilWorldFolder(self.temppath)
+        folder.listChunks()
+
+        # change a region file behind the index's back
+        rf = MCRegionFile(folder.getRegionFilename(0, 0), (0, 0))
+        rf.saveChunk(5, 5, "x" * 10000)
+        rf.close()
+
+        folder = AnvilWorldFolder(self.temppath)
+        self.assertTrue(folder.containsChunk(5, 5))
+        self.assertEqual(self.chunks | set([(5, 5)]), folder.listChunks())
+
+    def testIndexFollowsEdits(self):
+        level = MCInfdevOldLevel(filename=self.temppath)
+        level.deleteChunk(-1, -1)
+        level.createChunk(40, 40)
+        level.saveInPlace()
+        level.close()
+
+        folder = AnvilWorldFolder(self.temppath)
+        self.assertEqual(self.chunks - set([(-1, -1)]) | set([(40, 40)]), folder.listChunks())
@@ -0,0 +1,79 @@
+import os
+import shutil
+import unittest
+
+from pymclevel.chunkjournal import ChunkJournal
+from pymclevel.mclevelbase import ChunkNotPresent
+from pymclevel.regionfile import MCRegionFile
+from templevel import mktemp
+
+
+class TestChunkJournal(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("ChunkJournal")
+        self.journal = ChunkJournal(self.temppath)
+
+    def tearDown(self):
+        self.journal.closeRegions()
+        shutil.rmtree(self.temppath)
+
+    def testSaveAndRead(self):
+        journal = self.journal
+        journal.saveChunk(1, -2, "a" * 1000)
+        journal.saveChunk(3, 4, "b" * 1000)
+        journal.saveChunk(1, -2, "c" * 1000)
+
+        self.assertEqual(set([(1, -2), (3, 4)]), journal.listChunks())
+        self.assertEqual("c" * 1000, journal.readChunk(1, -2))
+        self.assertEqual("b" * 1000, journal.readChunk(3, 4))
+        self.assertRaises(ChunkNotPresent, journal.readChunk, 0, 0)
+
+        journal.deleteChunk(3, 4)
+        self.assertFalse(journal.containsChunk(3, 4))
+
+    def testReopen(self):
+        self.journal.saveChunk(1, 2, "a" * 1000)
+        self.journal.saveChunk(1, 2, "b" * 1000)
+        self.journal.closeRegions()
+
+        with file(self.journal.path, "ab") as f:
+            f.write("truncated record")
+
+        journal = ChunkJournal(self.temppath)
+        self.assertEqual(set([(1, 2)]), journal.listChunks())
+        self.assertEqual("b" * 1000, journal.readChunk(1, 2))
+        journal.saveChunk(5, 5, "d")
+        self.assertEqual("b" * 1000, journal.readChunk(1, 2))
+        self.assertEqual("d", journal.readChunk(5, 5))
+        journal.closeRegions()
+
+    def testCompact(self):
+        journal = self.journal
+        for i in range(10):
+            journal.saveChunk(i % 3, 0, os.urandom(1000))
+        latest = dict((cx, journal.readChunk(cx, 0)) for cx in range(3))
+
+        size = os.path.getsize(journal.path)
+        journal.compact()
+        self.assertTrue(os.path.getsize(journal.path) < size / 2)
+        for cx in range(3):
+            self.assertEqual(latest[cx], journal.readChunk(cx, 0))
+
+        journal.clear()
+        self.assertEqual(set(), journal.listChunks())
+        self.assertEqual(0, os.path.getsize(journal.path))
+
+    def testCopyFromRegion(self):
+        os.mkdir(os.path.join(self.temppath, "region"))
+        rf = MCRegionFile(os.path.join(self.temppath, "region", "r.0.0.mca"), (0, 0))
+        rf.saveChunk(4, 4, "e" * 3000)
+
+        class Folder(object):
+            def getRegionForChunk(self, cx, cz):
+                return rf
+
+        self.journal.copyChunkFrom(Folder(), 4, 4)
+        self.journal.copyChunkFrom(Folder(), 5, 5)
+        self.assertEqual(set([(4, 4)]), self.journal.listChunks())
+        self.assertEqual("e" * 3000, self.journal.readChunk(4, 4))
+        rf.close()
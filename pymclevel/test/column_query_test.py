@@ -0,0 +1,51 @@
+import unittest
+
+from pymclevel import column_query
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestColumnQuery(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            level.fillBlocks(BoundingBox((-16, 0, 0), (32, 10, 16)), level.materials.Stone)
+            level.setBlockAt(-3, 20, 4, 17)
+            level.setBlockAt(-3, 21, 4, 18)
+            level.setBlockAt(5, 15, 6, 17)
+
+        self.temp = TempLevel("ColumnQuery", createFunc=lambda path: makeAnvilLevel(path, [(-1, 0), (0, 0)], build))
+        self.level = self.temp.level
+        self.box = BoundingBox((-8, 5, 0), (16, 20, 8))
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testTopBlocks(self):
+        heights, ids = column_query.topBlocks(self.level, self.box)
+        self.assertEqual((16, 8), heights.shape)
+        self.assertEqual((9, 1), (heights[0, 0], ids[0, 0]))
+        self.assertEqual((21, 18), (heights[5, 4], ids[5, 4]))
+
+        heights, ids = column_query.topBlocks(self.level, self.box, [17])
+        self.assertEqual((20, 17), (heights[5, 4], ids[5, 4]))
+        self.assertEqual((15, 17), (heights[13, 6], ids[13, 6]))
+        self.assertEqual((-1, 0), (heights[0, 0], ids[0, 0]))
+
+        # columns in missing chunks
+        heights, ids = column_query.topBlocks(self.level, BoundingBox((10, 0, 0), (10, 20, 1)))
+        self.assertEqual([9] * 6 + [-1] * 4, list(heights[:, 0]))
+
+    def testContainsAndCounts(self):
+        level = self.level
+        trunks = column_query.columnContains(level, self.box, level.materials.Wood)
+        self.assertEqual(2, trunks.sum())
+        self.assertTrue(trunks[5, 4] and trunks[13, 6])
+
+        counts = column_query.columnCounts(level, self.box, None)
+        self.assertEqual(5, counts[0, 0])
+        self.assertEqual(7, counts[5, 4])
+
+        histogram = column_query.columnHistogram(level, self.box, [1, 17, 18])
+        self.assertEqual((16, 8, 3), histogram.shape)
+        self.assertEqual([5, 1, 1], list(histogram[5, 4]))
+        self.assertEqual([5, 0, 0], list(histogram[0, 0]))
@@ -0,0 +1,66 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, assertSameLight, makeCaveLevel
+
+CHUNKS = [(cx, cz) for cx in range(-1, 2) for cz in range(-1, 2)]
+
+
+def makeLevel(path):
+    makeCaveLevel(path, CHUNKS, cave=BoundingBox((-4, 30, -4), (24, 8, 24)))  # a cave under the chunk seams
+
+
+def build(level):
+    level.fillBlocks(BoundingBox((2, 38, 2), (3, 26, 3)), level.materials.Air)  # a shaft into the cave
+    level.fillBlocks(BoundingBox((8, 64, 8), (4, 2, 4)), level.materials.Water)
+    level.setBlockAt(10, 30, 10, level.materials.Glowstone.ID)
+
+
+class TestDeferredLighting(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("DeferredLighting", createFunc=makeLevel)
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.level.close()
+        self.temp.close()
+
+    def testRelightAtEnd(self):
+        otherTemp = TempLevel(self.temp.tmpname)
+        other = otherTemp.level
+        try:
+            chunk = self.level.getChunk(0, 0)
+            skyLight = chunk.SkyLight.copy()
+            with self.level.deferredLighting():
+                build(self.level)
+                self.assertTrue((skyLight == chunk.SkyLight).all())
+                self.assertEqual({(0, 0)}, self.level.deferredLightChunks)
+
+            self.assertIsNone(self.level.deferredLightChunks)
+            self.assertFalse(self.level.chunksNeedingLighting)
+            self.assertEqual(15, self.level.skylightAt(3, 40, 3))
+
+            build(other)
+            other.generateLights()
+            assertSameLight(self, self.level, other, CHUNKS)
+        finally:
+            otherTemp.close()
+
+    def testFastLightsAtEnd(self):
+        with self.level.deferredLighting(relight=False):
+            with self.level.deferredLighting():
+                build(self.level)
+            self.assertEqual(0, self.level.skylightAt(3, 40, 3))  # the inner block leaves lighting to the outer one
+
+        self.assertEqual(15, self.level.skylightAt(3, 40, 3))
+        self.assertEqual(9, self.level.skylightAt(9, 64, 9))  # under two blocks of water, and not lit from the side
+        self.assertEqual({(0, 0)}, self.level.chunksNeedingLighting)
+
+    def testChangedSections(self):
+        with self.level.deferredLighting(relight=False):
+            build(self.level)
+
+        chunk = self.level.getChunk(0, 0)
+        self.assertEqual({1, 2, 3, 4}, chunk.unlitSections)
+        self.assertEqual({1, 2, 3, 4}, chunk.dirtySections["blocks"])
+        self.assertEqual(set(), self.level.getChunk(1, 1).dirtySections["blocks"])
@@ -0,0 +1,101 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.entity import TileEntity
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from templevel import TempLevel, assertSameLight, makeCaveLevel
+
+CHUNKS = [(cx, cz) for cx in range(-1, 2) for cz in range(-1, 2)]
+
+
+def makeLevel(path):
+    makeCaveLevel(path, CHUNKS, cave=BoundingBox((-4, 30, -4), (24, 8, 24)))  # a cave under the chunk seams
+
+
+class TestDirtySections(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("DirtySections", createFunc=makeLevel)
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.level.close()
+        self.temp.close()
+
+    def testSetBlockAt(self):
+        level = self.level
+        chunk = level.getChunk(0, 0)
+        self.assertFalse(chunk.dirty)
+        self.assertEqual(set(), chunk.dirtySections["blocks"])
+
+        level.setBlockAt(3, 40, 3, level.materials.Glass.ID)
+        level.setBlockDataAt(3, 70, 3, 2)
+        self.assertTrue(chunk.dirty)
+        self.assertEqual({2, 4}, chunk.dirtySections["blocks"])
+        self.assertEqual(set(), chunk.dirtySections["light"])
+        self.assertEqual({2, 4}, chunk.unlitSections)
+
+        level.setBlocks([20, 21], [5, 100], [3, 3], level.materials.Glass.ID)
+        self.assertEqual({0, 6}, level.getChunk(1, 0).dirtySections["blocks"])
+
+        level.saveInPlace()
+        self.assertFalse(chunk.dirty)
+        self.assertEqual(set(), chunk.dirtySections["blocks"])
+        self.assertEqual({2, 4}, chunk.unlitSections)
+
+    def testEntitiesAndChunkChanged(self):
+        level = self.level
+        chunk = level.getChunk(0, 0)
+        chest = TileEntity.Create("Chest")
+        TileEntity.setpos(chest, (1, 50, 1))
+        level.addTileEntity(chest)
+        self.assertEqual({3}, chunk.dirtySections["entities"])
+        self.assertEqual(set(), chunk.dirtySections["blocks"])
+
+        chunk.chunkChanged()
+        self.assertEqual(set(range(16)), chunk.dirtySections["blocks"])
+
+    def testSaveCopiesCleanSections(self):
+        level = self.level
+        chunk = level.getChunk(0, 0)
+        # a change that is not marked is left out, showing that section 0 is copied instead of packed again
+        chunk.Blocks[3, 3, 5] = level.materials.Glass.ID
+
+        level.setBlockAt(3, 40, 3, level.materials.Glass.ID)
+        level.saveInPlace()
+
+        packed = chunk.chunkData._packedSections
+        self.assertEqual(level.materials.Stone.ID, packed[0]["Blocks"].reshape(16, 16, 16)[5, 3, 3])
+        self.assertEqual(level.materials.Glass.ID, packed[2]["Blocks"].reshape(16, 16, 16)[8, 3, 3])
+
+        level.close()
+        self.level = MCInfdevOldLevel(filename=self.temp.tmpname)
+        self.assertEqual(level.materials.Glass.ID, self.level.blockAt(3, 40, 3))
+        self.assertEqual(level.materials.Stone.ID, self.level.blockAt(3, 5, 3))
+
+    def testRelightMatchesFullRelight(self):
+        otherTemp = TempLevel(self.temp.tmpname)
+        other = otherTemp.level
+        try:
+            for level in self.level, other:
+                level.setBlockAt(0, 34, 0, level.materials.Glowstone.ID)
+                level.setBlockAt(15, 63, 15, level.materials.Air.ID)  # open the cave roof to the sky
+                for y in range(38, 63):
+                    level.setBlockAt(15, y, 15, level.materials.Air.ID)
+
+            for cPos in other.chunksNeedingLighting:
+                other.getChunk(*cPos).chunkChanged()
+
+            self.assertEqual({2, 3}, self.level.getChunk(0, 0).unlitSections)
+            self.level.generateLights()
+            other.generateLights()
+
+            assertSameLight(self, self.level, other, CHUNKS)
+            for cPos in CHUNKS:
+                chunk = self.level.getChunk(*cPos)
+                self.assertEqual(set(range(5)), chunk.dirtySections["light"])
+                self.assertFalse(chunk.unlitSections)
+
+            self.assertEqual(14, self.level.getChunk(-1, 0).BlockLight[15, 0, 34])
+            self.assertEqual(15, self.level.getChunk(0, 0).SkyLight[15, 15, 40])
+        finally:
+            otherTemp.close()
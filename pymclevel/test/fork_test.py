@@ -0,0 +1,108 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestLevelFork(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            level.fillBlocks(BoundingBox((0, 0, 0), (64, 10, 16)), level.materials.Stone)
+
+        chunkPositions = [(cx, 0) for cx in range(4)]
+        self.temp = TempLevel("LevelFork", createFunc=lambda path: makeAnvilLevel(path, chunkPositions, build))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.level.close()
+        self.temp.close()
+
+    def testCopyOnWrite(self):
+        level = self.level
+        fork = level.fork()
+        self.assertEqual(1, fork.blockAt(5, 5, 5))
+        self.assertEqual({}, fork._chunkData)
+
+        fork.setBlockAt(5, 5, 5, 3)
+        fork.fillBlocks(BoundingBox((16, 0, 0), (4, 4, 4)), level.materials.Glass)
+        self.assertEqual([(0, 0), (1, 0)], sorted(fork._chunkData))
+        self.assertEqual(3, fork.blockAt(5, 5, 5))
+        self.assertEqual(20, fork.blockAt(16, 0, 0))
+        self.assertEqual(1, level.blockAt(5, 5, 5))
+        self.assertEqual(1, level.blockAt(16, 0, 0))
+
+        fork.discard()
+        self.assertEqual(1, fork.blockAt(5, 5, 5))
+        self.assertEqual(1, level.blockAt(5, 5, 5))
+
+    def testReadsDoNotCopy(self):
+        level = self.level
+        level.fillBlocks(BoundingBox((20, 20, 4), (2, 1, 1)), level.materials["minecraft:chest"])
+        level.saveInPlace()
+        fork = level.fork()
+
+        box = BoundingBox((0, 0, 0), (64, 30, 16))
+        self.assertEqual(0, len(fork.getEntitiesInBox(box)))
+        self.assertEqual(2, len(fork.getTileEntitiesInBox(box)))
+        self.assertEqual(0, len(fork.getTileTicksInBox(box)))
+        schematic = fork.extractSchematic(box)
+        self.assertEqual(2, len(schematic.TileEntities))
+        self.assertEqual({}, fork._chunkData)
+
+    def testCleanCopiesDropped(self):
+        level = self.level
+        level.loadedChunkLimit = 2
+        fork = level.fork()
+        fork.setBlockAt(5, 5, 5, 3)
+        for cx in range(4):
+            fork.getChunk(cx, 0).Blocks[0, 0, 0]
+
+        self.assertTrue(len(fork._chunkData) <= 2, sorted(fork._chunkData))
+        self.assertIn((0, 0), fork._chunkData)
+        self.assertEqual(3, fork.blockAt(5, 5, 5))
+        self.assertEqual(1, fork.commit())
+
+    def testCommit(self):
+        level = self.level
+        chunk = level.getChunk(0, 0)
+        fork = level.fork()
+        fork.setBlockAt(5, 5, 5, 3)
+        fork.getChunk(2, 0)  # copied but unchanged
+        fork.createChunk(10, 10)
+        fork.setBlockAt(160, 1, 160, 4)
+        fork.deleteChunk(3, 0)
+        self.assertFalse(fork.containsChunk(3, 0))
+        self.assertEqual(4, fork.chunkCount)
+
+        level.setBlockAt(32, 20, 0, 5)  # changed in the parent after forking
+        self.assertEqual(2, fork.commit())
+
+        self.assertEqual(3, level.blockAt(5, 5, 5))
+        self.assertEqual(3, chunk.Blocks[5, 5, 5])
+        self.assertEqual(5, level.blockAt(32, 20, 0))
+        self.assertEqual(4, level.blockAt(160, 1, 160))
+        self.assertFalse(level.containsChunk(3, 0))
+        self.assertTrue(chunk.dirty)
+
+        level.saveInPlace()
+        level.close()
+        self.level = MCInfdevOldLevel(filename=self.temp.tmpname)
+        self.assertEqual(3, self.level.blockAt(5, 5, 5))
+        self.assertEqual(4, self.level.blockAt(160, 1, 160))
+
+    def testNestedFork(self):
+        level = self.level
+        fork = level.fork()
+        fork.setBlockAt(1, 1, 1, 7)
+        inner = fork.fork()
+        inner.setBlockAt(2, 2, 2, 8)
+        self.assertEqual(7, inner.blockAt(1, 1, 1))
+        self.assertEqual(1, fork.blockAt(2, 2, 2))
+
+        inner.commit()
+        self.assertEqual(8, fork.blockAt(2, 2, 2))
+        self.assertEqual(1, level.blockAt(2, 2, 2))
+        fork.commit()
+        self.assertEqual(8, level.blockAt(2, 2, 2))
+        self.assertEqual(7, level.blockAt(1, 1, 1))
@@ -0,0 +1,76 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, assertSameLight, makeCaveLevel
+
+CHUNKS = [(cx, cz) for cx in range(-1, 3) for cz in range(-1, 3)]
+
+
+def makeLevel(path):
+    makeCaveLevel(path, CHUNKS,
+                  cave=BoundingBox((-4, 30, -4), (40, 8, 24)),  # a cave under the chunk seams
+                  shaft=BoundingBox((20, 38, 10), (3, 26, 3)),  # a shaft to the sky
+                  torches=[(0, 0), (12, 14), (30, 2)])
+
+
+class TestLightQueue(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("LightQueue", createFunc=makeLevel)
+        self.level = self.temp.level
+        self.otherTemp = TempLevel(self.temp.tmpname)
+        self.other = self.otherTemp.level
+
+    def tearDown(self):
+        self.temp.close()
+        self.otherTemp.close()
+
+    def relightAndCompare(self):
+        """ Relight self.level with the bfs engine and self.other from scratch with the sweep engine, and compare. """
+        self.level.generateLights(engine="bfs")
+        self.assertFalse(self.level.chunksNeedingLighting)
+
+        for cPos in self.other.allChunks:
+            self.other.getChunk(*cPos).chunkChanged()
+        self.other.generateLights(engine="sweep")
+
+        assertSameLight(self, self.level, self.other, CHUNKS)
+
+    def edit(self, func):
+        func(self.level)
+        func(self.other)
+
+    def testAddAndRemoveLights(self):
+        materials = self.level.materials
+
+        def edit(level):
+            level.setBlockAt(0, 30, 0, materials.Air.ID)
+            level.setBlockAt(16, 32, 4, materials.Glowstone.ID)
+            level.setBlockAt(12, 30, 15, materials.Stone.ID)  # beside a torch
+
+        self.edit(edit)
+        self.relightAndCompare()
+        self.assertEqual(15, self.level.blockLightAt(16, 32, 4))
+        self.assertEqual(0, self.level.blockLightAt(0, 31, 0))
+
+    def testRoofAndHole(self):
+        materials = self.level.materials
+
+        def edit(level):
+            level.fillBlocks(BoundingBox((16, 70, 0), (16, 1, 16)), materials.Stone)  # shades the shaft
+            level.fillBlocks(BoundingBox((-2, 38, -2), (4, 26, 4)), materials.Air)  # opens the cave to the sky
+
+        self.edit(edit)
+        self.relightAndCompare()
+        self.assertEqual(15, self.level.skylightAt(0, 35, 0))
+        self.assertEqual(0, self.level.skylightAt(21, 50, 11))
+
+    def testOnlyChangedSectionsWritten(self):
+        self.level.setBlockAt(5, 100, 5, self.level.materials.Torch.ID)
+        self.level.saveInPlace()
+        self.level.generateLights(engine="bfs")
+
+        self.assertEqual({5, 6, 7}, self.level.getChunk(0, 0).dirtySections["light"])
+        self.assertEqual(set(), self.level.getChunk(2, 2).dirtySections["light"])
+
+    def testUnknownEngine(self):
+        self.assertRaises(ValueError, self.level.generateLights, engine="magic")
@@ -0,0 +1,94 @@
+from cStringIO import StringIO
+import os
+import sys
+import unittest
+
+import mce
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from templevel import TempLevel, makeAnvilLevel
+
+CHUNKS = [(cx, cz) for cx in range(-2, 2) for cz in range(-2, 2)]  # four chunks in each of four regions
+REGIONS = [(-1, -1), (-1, 0), (0, -1), (0, 0)]
+
+
+def build(level):
+    level.fillBlocks(BoundingBox((-32, 0, -32), (64, 40, 64)), level.materials.Stone)
+
+
+def command(editor, command):
+    """ Run an mce command and return what it printed. """
+    stdout = sys.stdout
+    sys.stdout = output = StringIO()
+    try:
+        editor.processCommand(command)
+    finally:
+        sys.stdout = stdout
+    return output.getvalue()
+
+
+class TestRegionCommands(unittest.TestCase):
+    def setUp(self):
+        # TempLevel reopens the level, so no region file is open yet
+        self.temp = TempLevel("RegionCommands", createFunc=lambda path: makeAnvilLevel(path, CHUNKS, build))
+        self.editor = mce.mce()
+        self.editor.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testListRegions(self):
+        output = command(self.editor, "region")
+        for rx, rz in REGIONS:
+            self.assertIn("({0:6}, {1:6}): 4, ".format(rx, rz), output)
+
+        self.assertIn("Region      0,      0: ", command(self.editor, "region 0 0"))
+
+    def testCompactAndRepairFindRegions(self):
+        self.assertIn("Reclaimed 0 KiB in total.", command(self.editor, "region compact"))
+        command(self.editor, "repair")
+        self.assertEqual(sorted(REGIONS), sorted(self.editor.level.worldFolder.regionFiles))
+        for cPos in CHUNKS:
+            self.assertEqual(1, self.editor.level.getChunk(*cPos).Blocks[0, 0, 0])
+
+
+def makeFragmentedLevel(path):
+    """ Save the level, then delete every other chunk and save again, leaving free sectors between the others. """
+    makeAnvilLevel(path, CHUNKS, build)
+    level = MCInfdevOldLevel(filename=path)
+    for cPos in CHUNKS[::2]:
+        level.deleteChunk(*cPos)
+    level.saveInPlace()
+    level.close()
+
+
+class TestCompactAndRepair(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("FragmentedRegions", createFunc=makeFragmentedLevel)
+        self.editor = mce.mce()
+        self.editor.level = level = self.temp.level
+        self.paths = [level.worldFolder.getRegionFilename(rx, rz) for rx, rz in REGIONS]
+        self.sizes = [os.path.getsize(path) for path in self.paths]
+
+    def tearDown(self):
+        self.temp.close()
+
+    def checkShrunkAndChunksLoad(self):
+        for path, size in zip(self.paths, self.sizes):
+            self.assertTrue(os.path.getsize(path) < size, path)
+
+        level = MCInfdevOldLevel(filename=self.temp.tmpname, readonly=True)
+        try:
+            self.assertEqual(set(CHUNKS[1::2]), set(level.allChunks))
+            for cPos in CHUNKS[1::2]:
+                self.assertEqual(1, level.getChunk(*cPos).Blocks[0, 0, 0])
+        finally:
+            level.close()
+
+    def testCompact(self):
+        self.assertIn("KiB in total.", command(self.editor, "region compact"))
+        self.checkShrunkAndChunksLoad()
+
+    def testRepair(self):
+        command(self.editor, "repair")
+        self.checkShrunkAndChunksLoad()
@@ -144,6 +144,42 @@ class TestNBT():
         # Save the entire TAG structure to a different file.
         TempLevel("atlantis.mclevel", createFunc=level.save)  # xxx don't use templevel here
 
+    def testLazyLoad(self):
+        data = self.testCreate().save(compressed=False)
+        level = nbt.load(buf=data, lazy=True)
+
+        # untouched subtrees are written back as they were read
+        assert level.save(compressed=False) == data
+
+        assert level["Environment"]["SurroundingWaterHeight"].value == 32
+        assert level["Entities"][0]["Pos"][1].value == 64.0
+        assert (level["Map"]["Blocks"].value == nbt.load(buf=data)["Map"]["Blocks"].value).all()
+        assert level.save(compressed=False) == data
+
+        level["Environment"]["SurroundingWaterHeight"].value += 6
+        level["Entities"].append(nbt.TAG_Compound([nbt.TAG_String("Pig", "id")]))
+        del level["About"]
+
+        newlevel = nbt.load(buf=level.save())
+        assert newlevel["Environment"]["SurroundingWaterHeight"].value == 38
+        assert [e["id"].value for e in newlevel["Entities"]] == ["Creeper", "Pig"]
+        assert "About" not in newlevel
+        assert newlevel["Map"]["Spawn"][2].value == 55
+
+    def testCopy(self):
+        level = self.testCreate()
+        data = level.save(compressed=False)
+
+        for original in level, nbt.load(buf=data, lazy=True):
+            copy = original.copy()
+            assert copy.save(compressed=False) == data
+
+            # the copy shares nothing with the original
+            copy["Environment"]["SurroundingWaterHeight"].value += 6
+            copy["Entities"][0]["Pos"][0].value = 0.0
+            copy["Map"]["Blocks"].value[0] += 1
+            assert original.save(compressed=False) == data
+
     @staticmethod
     def testList():
         tag = nbt.TAG_List()
@@ -0,0 +1,66 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, assertSameLight, makeCaveLevel
+
+CHUNKS = [(cx, cz) for cx in range(-2, 3) for cz in range(-2, 3)]
+
+
+def makeLevel(path):
+    makeCaveLevel(path, CHUNKS,
+                  cave=BoundingBox((-20, 30, -4), (56, 8, 24)),  # a cave across the batches
+                  shaft=BoundingBox((20, 38, 10), (3, 26, 3)),  # a shaft to the sky
+                  torches=[(0, 0), (15, 14), (-17, 2)],
+                  light=False)
+
+
+class TestParallelLight(unittest.TestCase):
+    def setUp(self):
+        self.temp = TempLevel("ParallelLight", createFunc=makeLevel)
+        self.level = self.temp.level
+        self.level.loadedChunkLimit = 8  # light the level in several batches
+        self.level.lightProcesses = 2
+
+        self.otherTemp = TempLevel(self.temp.tmpname)
+        self.other = self.otherTemp.level
+
+    def tearDown(self):
+        self.temp.close()
+        self.otherTemp.close()
+
+    def relightAndCompare(self, chunkPositions=None):
+        self.level.generateLights(chunkPositions, engine="parallel")
+        self.other.generateLights(chunkPositions, engine="sweep")
+        self.assertFalse(self.level.chunksNeedingLighting)
+
+        assertSameLight(self, self.level, self.other, CHUNKS)
+
+    def testFullRelight(self):
+        self.relightAndCompare(CHUNKS)
+        self.assertEqual(14, self.level.blockLightAt(0, 30, 0))
+        self.assertEqual(11, self.level.blockLightAt(18, 30, 14))  # lit across a chunk seam
+        self.assertEqual(15, self.level.skylightAt(21, 40, 11))
+
+    def testRelightAfterEdit(self):
+        self.relightAndCompare(CHUNKS)
+        for level in self.level, self.other:
+            level.setBlockAt(15, 30, 14, level.materials.Air.ID)
+            level.setBlockAt(-17, 34, 2, level.materials.Glowstone.ID)
+            for cPos in CHUNKS:
+                level.getChunk(*cPos).chunkChanged()
+
+        self.relightAndCompare()
+        self.assertEqual(0, self.level.blockLightAt(15, 30, 14))
+
+    def testSingleProcessKeepsBatches(self):
+        batches = []
+        generateLightsIter = self.level._generateLightsIter
+
+        def recordBatch(chunkPositions):
+            batches.append(len(chunkPositions))
+            return generateLightsIter(chunkPositions)
+
+        self.level._generateLightsIter = recordBatch
+        self.level.lightProcesses = 1
+        self.relightAndCompare(CHUNKS)
+        self.assertTrue(len(batches) > 1 and max(batches) <= self.level.loadedChunkLimit, batches)
@@ -0,0 +1,90 @@
+import unittest
+
+from pymclevel import infiniteworld
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestParallelSave(unittest.TestCase):
+    def setUp(self):
+        self.temps = []
+
+    def tearDown(self):
+        for temp in self.temps:
+            temp.close()
+
+    def createWorld(self, saveProcesses):
+        def create(path):
+            level = MCInfdevOldLevel(filename=path, create=True)
+            level.saveProcesses = saveProcesses
+
+            # spans four region files
+            box = BoundingBox((-48, 0, -48), (96, 80, 96))
+            level.createChunksInBox(box)
+            level.saveInPlace()
+
+            level.fillBlocks(BoundingBox((-40, 0, -40), (80, 70, 80)), level.materials.Stone)
+            level.setBlockAt(3, 75, 3, 1000)
+            level.setBlockDataAt(3, 75, 3, 5)
+
+            # push some chunks out to the unsaved work folder
+            level.recentChunks.clear()
+            level.loadedChunkMemoryLimit = 1
+            level.createChunk(20, 20)
+            level.saveInPlace()
+            level.close()
+
+        temp = TempLevel("ParallelSave", createFunc=create)
+        self.temps.append(temp)
+        return temp.level
+
+    def testSameAsSerialSave(self):
+        serial = self.createWorld(0)
+        parallel = self.createWorld(2)
+        self.assertEqual(set(serial.allChunks), set(parallel.allChunks))
+        for cx, cz in serial.allChunks:
+            a = serial.getChunk(cx, cz)
+            b = parallel.getChunk(cx, cz)
+            for name in "Blocks", "Data", "BlockLight", "SkyLight":
+                self.assertTrue((getattr(a, name) == getattr(b, name)).all(), (name, cx, cz))
+
+        self.assertEqual(1000, parallel.blockAt(3, 75, 3))
+        self.assertEqual(5, parallel.blockDataAt(3, 75, 3))
+
+    def testPackedSectionsKept(self):
+        levels = []
+        for saveProcesses in 0, 2:
+            temp = TempLevel("ParallelSavePacked", createFunc=lambda path: makeAnvilLevel(path, [(0, 0), (1, 0)]))
+            self.temps.append(temp)
+            level = temp.level
+            level.saveProcesses = saveProcesses
+            level.fillBlocks(BoundingBox((0, 0, 0), (32, 40, 16)), level.materials.Stone)
+            level.saveInPlace()
+            levels.append(level)
+
+        serial, parallel = (level.getChunk(0, 0).chunkData for level in levels)
+        self.assertEqual(sorted(serial._packedSections), sorted(parallel._packedSections))
+        for sy, packed in serial._packedSections.iteritems():
+            for name, arr in packed.iteritems():
+                self.assertTrue((arr == parallel._packedSections[sy][name]).all(), (sy, name))
+
+        # the next save packs only the sections changed since the last one
+        level = levels[1]
+        level.setBlockAt(3, 20, 3, level.materials.Glass.ID)
+        self.assertEqual({1}, parallel._staleSections["blocks"])
+        self.assertEqual(set(), parallel._staleSections["light"])
+        packNibbleArray = infiniteworld.packNibbleArray
+        packed = []
+
+        def recordPack(arr):
+            packed.append(arr)
+            return packNibbleArray(arr)
+
+        infiniteworld.packNibbleArray = recordPack
+        try:
+            level.saveProcesses = 0
+            level.saveInPlace()
+        finally:
+            infiniteworld.packNibbleArray = packNibbleArray
+        self.assertEqual(3, len(packed))  # the Data of section 1 and of the sections next to it, which are sanitized
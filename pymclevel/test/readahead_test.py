@@ -0,0 +1,45 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestReadahead(unittest.TestCase):
+    def setUp(self):
+        self.box = box = BoundingBox((0, 0, 0), (64, 16, 64))
+
+        def build(level):
+            for cx, cz in box.chunkPositions:
+                level.setBlockAt(cx << 4, 1, cz << 4, cx * 4 + cz + 1)
+
+        self.temp = TempLevel("Readahead", createFunc=lambda path: makeAnvilLevel(path, box.chunkPositions, build))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testChunkSlices(self):
+        level = self.level
+        seen = []
+        for chunk, slices, point in level.getChunkSlices(self.box, readahead=2):
+            cx, cz = chunk.chunkPosition
+            self.assertEqual(cx * 4 + cz + 1, chunk.Blocks[0, 0, 1])
+            seen.append(chunk.chunkPosition)
+
+        self.assertEqual(sorted(self.box.chunkPositions), sorted(seen))
+        self.assertEqual({}, level._pendingChunkData)
+
+    def testFillWithReadahead(self):
+        level = self.level
+        level.fillBlocks(self.box, level.materials.Stone)
+        level.saveInPlace()
+        self.assertTrue(all((level.getChunk(*cPos).Blocks[..., :16] == 1).all() for cPos in self.box.chunkPositions))
+
+    def testAbandonedPrefetch(self):
+        level = self.level
+        level.prefetchChunk(1, 1)
+        level.setBlockAt(16, 1, 16, 7)
+        self.assertEqual(7, level.blockAt(16, 1, 16))
+        level.prefetchChunk(2, 2)
+        level.saveInPlace()
+        self.assertEqual({}, level._pendingChunkData)
@@ -0,0 +1,103 @@
+import os
+import shutil
+import unittest
+
+from pymclevel.regionfile import FreeExtents, MCRegionFile
+from templevel import mktemp
+
+
+class TestRegionFile(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = mktemp("RegionFile")
+        os.mkdir(self.tempdir)
+        self.path = os.path.join(self.tempdir, "r.0.0.mca")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testReadAfterWrite(self):
+        rf = MCRegionFile(self.path, (0, 0))
+        rf.saveChunk(0, 0, "a" * 100)
+        self.assertEqual("a" * 100, rf.readChunk(0, 0))
+
+        # grows the file while it is mapped
+        rf.saveChunk(1, 0, os.urandom(10000))
+        rf.saveChunk(0, 0, "b" * 200)
+        self.assertEqual("b" * 200, rf.readChunk(0, 0))
+        self.assertEqual(10000, len(rf.readChunk(1, 0)))
+        rf.close()
+
+    def testBatchDefersHeader(self):
+        rf = MCRegionFile(self.path, (0, 0))
+        with rf.batch():
+            rf.saveChunk(2, 3, "c" * 100)
+            self.assertFalse(MCRegionFile(self.path, (0, 0)).containsChunk(2, 3))
+            self.assertEqual("c" * 100, rf.readChunk(2, 3))
+
+        self.assertTrue(MCRegionFile(self.path, (0, 0)).containsChunk(2, 3))
+        rf.close()
+
+    def testSaveChunks(self):
+        rf = MCRegionFile(self.path, (0, 0))
+        rf.saveChunk(0, 0, "x" * 100)
+        other = MCRegionFile(self.path.replace("r.0.0", "r.1.0"), (1, 0))
+        other.saveChunk(5, 5, "d" * 5000)
+        data, format = other._readChunk(5, 5)
+
+        rf.saveChunks([(cx, 0, data, format) for cx in range(1, 8)])
+        rf.close()
+
+        rf = MCRegionFile(self.path, (0, 0))
+        self.assertEqual(8, rf.chunkCount)
+        self.assertEqual("x" * 100, rf.readChunk(0, 0))
+        for cx in range(1, 8):
+            self.assertEqual("d" * 5000, rf.readChunk(cx, 0))
+            self.assertNotEqual(0, rf.getTimestamp(cx, 0))
+        rf.close()
+        other.close()
+
+    def testFreeExtents(self):
+        extents = FreeExtents(8)
+        extents.release(4, 2)
+        extents.release(7, 1)
+        extents.release(6, 1)
+        self.assertEqual([(4, 4)], list(extents))
+
+        self.assertEqual(4, extents.allocate(3))
+        self.assertEqual([(7, 1)], list(extents))
+        # the run at the end is extended rather than left behind
+        self.assertEqual(7, extents.allocate(2))
+        self.assertEqual(9, extents.sectorCount)
+        self.assertEqual(9, extents.allocate(1))
+        self.assertEqual(10, extents.sectorCount)
+
+        used = [True, True, False, True, False, False]
+        self.assertEqual([(2, 1), (4, 2)], list(FreeExtents.fromUsedSectors(used)))
+
+    def testCompact(self):
+        rf = MCRegionFile(self.path, (0, 0))
+        chunks = dict(((cx, 0), os.urandom(6000)) for cx in range(10))
+        for (cx, cz), data in chunks.iteritems():
+            rf.saveChunk(cx, cz, data)
+        for cx in range(0, 10, 2):
+            rf.saveChunk(cx, 0, os.urandom(9000))
+            del chunks[cx, 0]
+            rf.setOffset(cx, 0, 0)
+
+        self.assertTrue(len(rf.freeRuns()))
+        size = os.path.getsize(self.path)
+        reclaimed = rf.compact()
+        self.assertTrue(reclaimed > 0)
+        self.assertEqual(size - reclaimed, os.path.getsize(self.path))
+        self.assertEqual([], rf.freeRuns())
+
+        for (cx, cz), data in chunks.iteritems():
+            self.assertEqual(data, rf.readChunk(cx, cz))
+        rf.close()
+
+        rf = MCRegionFile(self.path, (0, 0))
+        self.assertEqual(2 + 2 * len(chunks), rf.usedSectors)
+        self.assertEqual(rf.sectorCount, rf.usedSectors)
+        for (cx, cz), data in chunks.iteritems():
+            self.assertEqual(data, rf.readChunk(cx, cz))
+        rf.close()
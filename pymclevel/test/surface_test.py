@@ -0,0 +1,67 @@
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.schematic import MCSchematic
+from templevel import TempLevel, makeAnvilLevel
+
+
+class TestSurfaceMaps(unittest.TestCase):
+    def setUp(self):
+        def build(level):
+            mats = level.materials
+            level.fillBlocks(BoundingBox((0, 0, 0), (32, 60, 16)), mats.Stone)
+            level.fillBlocks(BoundingBox((0, 60, 0), (4, 3, 16)), mats.Water)
+            level.setBlockAt(10, 60, 10, mats.Wood.ID)
+            level.setBlockAt(10, 61, 10, mats.Leaves.ID)
+            level.setBlockAt(20, 60, 5, mats.Flower.ID)
+
+        self.temp = TempLevel("SurfaceMaps", createFunc=lambda path: makeAnvilLevel(path, [(0, 0), (1, 0)], build))
+        self.level = self.temp.level
+
+    def tearDown(self):
+        self.temp.close()
+
+    def testKinds(self):
+        level = self.level
+        box = BoundingBox((0, 0, 0), (32, 10, 16))
+
+        def heights(kind):
+            m = level.surfaceMap(box, kind)
+            return [m[0, 0], m[10, 10], m[20, 5], m[30, 3]]
+
+        self.assertEqual((32, 16), level.surfaceMap(box).shape)
+        self.assertEqual([63, 62, 61, 60], heights("WORLD_SURFACE"))
+        self.assertEqual([63, 62, 60, 60], heights("MOTION_BLOCKING"))
+        self.assertEqual([63, 61, 60, 60], heights("MOTION_BLOCKING_NO_LEAVES"))
+        self.assertEqual([60, 62, 60, 60], heights("OCEAN_FLOOR"))
+        self.assertEqual([60, 60, 60, 60], heights("GROUND"))
+        self.assertRaises(ValueError, level.surfaceMap, box, "TREES")
+
+    def testIncrementalUpdates(self):
+        level = self.level
+        box = BoundingBox((8, 0, 8), (4, 10, 4))
+        chunk = level.getChunk(0, 0)
+        heights = level.surfaceMap(box, "GROUND")
+        self.assertEqual(60, heights[2, 2])
+        self.assertTrue("GROUND" in chunk.surfaceMaps)
+
+        level.setBlockAt(10, 100, 10, level.materials.Stone.ID)
+        self.assertEqual(101, level.surfaceMap(box, "GROUND")[2, 2])
+        level.setBlockAt(10, 100, 10, 0)
+        level.setBlockAt(10, 59, 10, 0)
+        self.assertEqual(59, level.surfaceMap(box, "GROUND")[2, 2])
+        self.assertEqual(62, level.surfaceMap(box, "WORLD_SURFACE")[2, 2])
+
+        level.fillBlocks(BoundingBox((8, 0, 8), (1, 120, 1)), level.materials.Stone)
+        self.assertEqual(120, level.surfaceMap(box, "GROUND")[0, 0])
+
+        level.setBlocks([9, 9], [130, 131], [9, 9], level.materials.Stone.ID)
+        self.assertEqual(132, level.surfaceMap(box, "GROUND")[1, 1])
+
+    def testSchematic(self):
+        sch = MCSchematic(shape=(20, 4, 4))
+        sch.Blocks[18, 2, :3] = 1
+        heights = sch.surfaceMap(sch.bounds)
+        self.assertEqual((20, 4), heights.shape)
+        self.assertEqual(3, heights[18, 2])
+        self.assertEqual(0, heights[17, 2])
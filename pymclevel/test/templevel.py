@@ -4,6 +4,8 @@ from os.path import join
 import shutil
 import tempfile
 from pymclevel import mclevel
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
 
 __author__ = 'Rio'
 
@@ -38,6 +40,9 @@ class TempLevel(object):
         atexit.register(self.removeTemp)
 
     def __del__(self):
+        self.close()
+
+    def close(self):
         if hasattr(self, 'level'):
             self.level.close()
             del self.level
@@ -46,10 +51,45 @@ class TempLevel(object):
 
     def removeTemp(self):
 
-        if hasattr(self, 'tmpname'):
+        if hasattr(self, 'tmpname') and os.path.exists(self.tmpname):
             filename = self.tmpname
 
             if os.path.isdir(filename):
                 shutil.rmtree(filename)
             else:
                 os.unlink(filename)
+
+
+def makeAnvilLevel(path, chunkPositions, build=None):
+    """ Create an Anvil level at path holding chunkPositions, pass it to build if given, then save and close it. """
+    level = MCInfdevOldLevel(filename=path, create=True)
+    level.createChunks(chunkPositions)
+    if build:
+        build(level)
+    level.saveInPlace()
+    level.close()
+
+
+def makeCaveLevel(path, chunkPositions, cave, shaft=None, torches=(), light=True):
+    """ Create an Anvil level at path holding chunkPositions, filled with stone up to y=64 with the boxes cave and
+    shaft hollowed out of it and torches at y=30 at the (x, z) positions in torches. Lit unless light is False. """
+
+    def build(level):
+        bounds = level.bounds
+        level.fillBlocks(BoundingBox(bounds.origin, (bounds.width, 64, bounds.length)), level.materials.Stone)
+        for box in cave, shaft:
+            if box is not None:
+                level.fillBlocks(box, level.materials.Air)
+        for x, z in torches:
+            level.setBlockAt(x, 30, z, level.materials.Torch.ID)
+        if light:
+            level.generateLights()
+
+    makeAnvilLevel(path, chunkPositions, build)
+
+
+def assertSameLight(testCase, level, other, chunkPositions):
+    for cPos in chunkPositions:
+        chunk, otherChunk = level.getChunk(*cPos), other.getChunk(*cPos)
+        for light in "BlockLight", "SkyLight":
+            testCase.assertTrue((getattr(chunk, light) == getattr(otherChunk, light)).all(), (cPos, light))
@@ -0,0 +1,61 @@
+import shutil
+from timeit import timeit
+
+import numpy
+
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from templevel import makeAnvilLevel, mktemp
+
+# import logging
+#logging.basicConfig(level=logging.INFO)
+
+ARRAYS = ("Blocks", "Data", "BlockLight", "SkyLight")
+SIZE = 16  # chunks along each side
+
+
+def build(level):
+    """ Stone up to y=64 under hilly dirt, with scattered ores, so that every array has varied contents to pack. """
+    rand = numpy.random.RandomState(0)
+    y = numpy.arange(level.Height)
+    for chunk in level.getChunks():
+        heights = 64 + rand.randint(0, 32, (16, 16, 1))
+        chunk.Blocks[y < heights] = level.materials.Dirt.ID
+        chunk.Blocks[..., :64] = level.materials.Stone.ID
+        ores = rand.randint(0, 16, 200), rand.randint(0, 16, 200), rand.randint(0, 64, 200)
+        chunk.Blocks[ores] = level.materials.CoalOre.ID
+        chunk.Data[ores] = rand.randint(0, 16, 200)
+        chunk.chunkChanged()
+    level.generateLights()
+
+
+def load_and_save(path, sectionOrder):
+    MCInfdevOldLevel.sectionOrderArrays = sectionOrder
+    world = MCInfdevOldLevel(filename=path, readonly=True)
+    chunks = [world.getChunk(cx, cz) for cx, cz in world.allChunks]
+
+    def unpack():
+        for chunk in chunks:
+            for name in ARRAYS:
+                getattr(chunk, name)
+
+    def pack():
+        for chunk in chunks:
+            chunk.savedTagData()
+
+    mode = "section order" if sectionOrder else "x,z,y order"
+    t = timeit(unpack, number=1)
+    print "Unpack (%s): %d chunks in %.02f seconds (%.02fms per chunk)" % (
+        mode, len(chunks), t, t / len(chunks) * 1000)
+    t = timeit(pack, number=1)
+    print "Pack (%s): %d chunks in %.02f seconds (%.02fms per chunk)" % (
+        mode, len(chunks), t, t / len(chunks) * 1000)
+    world.close()
+    MCInfdevOldLevel.sectionOrderArrays = False
+
+
+if __name__ == '__main__':
+    path = mktemp("time_chunkload")
+    makeAnvilLevel(path, [(cx, cz) for cx in range(SIZE) for cz in range(SIZE)], build)
+    load_and_save(path, False)
+    load_and_save(path, True)
+    shutil.rmtree(path)
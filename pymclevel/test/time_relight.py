@@ -1,3 +1,4 @@
+from pymclevel.box import BoundingBox
 from pymclevel.infiniteworld import MCInfdevOldLevel
 from pymclevel import mclevel
 from timeit import timeit
@@ -32,6 +33,25 @@ def manmade_relight():
     world.chunkCount, t, t / world.chunkCount * 1000)
 
 
+def parallel_relight():
+    world = mclevel.fromFile("testfiles/AnvilWorld")
+    t = timeit(lambda: world.generateLights(world.allChunks, engine="parallel"), number=1)
+    print "Relight natural terrain in parallel: %d chunks in %.02f seconds (%.02fms per chunk)" % (
+    world.chunkCount, t, t / world.chunkCount * 1000)
+
+
+def local_relight():
+    for engine in "sweep", "bfs":
+        world = mclevel.fromFile("testfiles/AnvilWorld")
+        world.generateLights(world.allChunks)
+        (cx, cz) = next(iter(world.allChunks))
+        world.fillBlocks(BoundingBox((cx << 4, 60, cz << 4), (8, 8, 8)), world.materials.Glowstone)
+        t = timeit(lambda: world.generateLights(engine=engine), number=1)
+        print "Relight after a small edit with the %s engine: %.02f seconds" % (engine, t)
+
+
 if __name__ == '__main__':
     natural_relight()
     manmade_relight()
+    parallel_relight()
+    local_relight()
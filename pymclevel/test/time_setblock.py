@@ -0,0 +1,49 @@
+import shutil
+from timeit import timeit
+
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from pymclevel.schematic import MCSchematic
+from templevel import mktemp
+
+# import logging
+#logging.basicConfig(level=logging.INFO)
+
+SIZE = 32
+
+
+def positions():
+    for x in xrange(SIZE):
+        for z in xrange(SIZE):
+            for y in xrange(64, 64 + SIZE):
+                yield x, y, z
+
+
+def separate(level):
+    for x, y, z in positions():
+        level.setBlockAt(x, y, z, 35)
+        level.setBlockDataAt(x, y, z, 14)
+
+
+def combined(level):
+    for x, y, z in positions():
+        level.setBlockAndDataAt(x, y, z, 35, 14)
+
+
+def time_setblock(name, level):
+    count = SIZE ** 3
+    for func in separate, combined:
+        t = timeit(lambda: func(level), number=1)
+        print "%s, %s: %d blocks in %.02f seconds (%.02fus per block)" % (
+            name, func.__name__, count, t, t / count * 1000000)
+
+
+if __name__ == '__main__':
+    path = mktemp("time_setblock")
+    world = MCInfdevOldLevel(filename=path, create=True)
+    world.createChunks([(cx, cz) for cx in range(SIZE / 16) for cz in range(SIZE / 16)])
+    time_setblock("Anvil world", world)
+    time_setblock("Anvil world cursor", world.cursor())
+    world.close()
+    shutil.rmtree(path)
+
+    time_setblock("Schematic", MCSchematic(shape=(SIZE, 64 + SIZE, SIZE)))
@@ -82,6 +82,7 @@ def firstBlock(origin, direction, level, radius, viewMode=None):
     if viewMode == "Chunk":
         raise TooFarException("There are no valid blocks within range")
     startPos =  map(int,map(math.floor,origin))
+    level = level.cursor()  # consecutive blocks on the ray are mostly in the same chunk
     block = level.blockAt(*startPos)
     tooMuch = 0
     if block == 8 or block == 9:
@@ -3443,6 +3443,31 @@ class MCRenderer(object):
         self.discardMasterList()
         self.loadNearbyChunks()
 
+    # the layers showing each category of a chunk's dirtySections
+    sectionCategoryLayers = {
+        "blocks": (Layer.Blocks,),
+        "light": (Layer.Blocks,),  # the light is part of the block vertices
+        "entities": (Layer.Entities, Layer.Monsters, Layer.Items, Layer.TileEntities, Layer.TileTicks),
+    }
+
+    def invalidateChunkSections(self, chunkSections):
+        """ Invalidate only the layers showing what changed in each chunk. chunkSections yields ((cx, cz),
+        dirtySections) pairs, where dirtySections is a chunk's dirtySections, or None to invalidate every layer. Chunks
+        with no dirty sections are left alone. """
+        for (cx, cz), dirtySections in chunkSections:
+            if dirtySections is None:
+                layers = None
+            else:
+                layers = set(layer for category, sectionYs in dirtySections.iteritems() if sectionYs
+                             for layer in self.sectionCategoryLayers[category])
+                if not layers:
+                    continue
+            self.invalidateChunk(cx, cz, layers)
+
+        self.stopWork()
+        self.discardMasterList()
+        self.loadNearbyChunks()
+
     def invalidateAllChunks(self, layers=None):
         self.invalidateChunks(self.chunkRenderers.iterkeys(), layers)
 
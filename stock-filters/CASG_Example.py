@@ -23,11 +23,15 @@ inputs = (
 # Every agent must have a "perform" function, which has three parameters
 # 1: the level (aka the minecraft world). 2: the selected box from mcedit. 3: User defined inputs from mcedit
 def perform(level, box, options):
+	# edit a numpy copy of the selection's columns instead of the world, and write the changes back at the end.
+	# the fences sit one block past the far edges of each yard, so the copy is one block wider and longer
+	view = level.view(BoundingBox((box.minx, 0, box.minz), (box.width + 1, level.Height, box.length + 1)))
 	yards = binaryPartition(box)
 	# for each quadrant
 	for yard in yards:
-		buildFence(level, yard)
-		buildStructure(level, yard, options)
+		buildFence(view, yard)
+		buildStructure(view, yard, options)
+	view.commit()
 
 #splits the given box into 4 unequal areas
 def binaryPartition(box):
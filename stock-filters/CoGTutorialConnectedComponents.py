@@ -6,6 +6,7 @@ from math import sqrt, tan, sin, cos, pi, ceil, floor, acos, atan, asin, degrees
 from random import *
 from numpy import *
 from pymclevel import alphaMaterials, MCSchematic, MCLevel, BoundingBox
+from pymclevel import column_query
 from mcplatform import *
 
 import utilityFunctions as utilityFunctions
@@ -67,14 +68,12 @@ def getTileMap (level, box, maxHeight, minHeight):
 
 	tileMap = empty( (width,depth) ,dtype=object)
 
-	for x in range(xmin,xmax+1):
-		for z in range(zmin,zmax+1):
-			for y in range(maxHeight, minHeight-1,-1):
-				material = level.blockAt(x,y,z)
-				if (material != 0):
-					tileMap[x-xmin,z-zmin] = tile(x,y,z,material)
-					print "Found block of type {} at position({},{},{})".format(material,x,y,z)
-					break
+	# find the highest non-air block of every column between the heights, a chunk at a time
+	columns = BoundingBox((xmin, minHeight, zmin), (width, maxHeight - minHeight + 1, depth))
+	heights, blockIDs = column_query.topBlocks(level, columns)
+
+	for x, z in zip(*nonzero(heights >= 0)):
+		tileMap[x,z] = tile(x+xmin, int(heights[x,z]), z+zmin, int(blockIDs[x,z]))
 
 
 	return tileMap
@@ -429,8 +429,7 @@ class BusCreator:
         return self.level.blockDataAt(x, y, z)
 
     def setBlockAt(self, (x, y, z), id, dmg=0):
-        self.level.setBlockAt(x, y, z, id)
-        self.level.setBlockDataAt(x, y, z, dmg)
+        self.level.setBlockAndDataAt(x, y, z, id, dmg)
 
     def repeaterPointingTowards(self, (x1, y1, z1), (x2, y2, z2)):
         blockid = self.getBlockAt((x1, y1, z1))
@@ -252,12 +252,11 @@ def Factorise(number):
 def setBlock(level,material,point):
 	(x,y,z) = point
 	(bID,bDATA) = material
-	level.setBlockAt(x,y,z,bID)
-	level.setBlockDataAt(x,y,z,bDATA)
+	level.setBlockAndDataAt(x,y,z,bID,bDATA)
 
 def getBlock(level,point):
 	(x,y,z) = point
-	return (level.blockAt(x,y,z),level.blockDataAt(x,y,z))
+	return level.blockAndDataAt(x,y,z)
 	
 def shapeFill(shape,material,p1,p2):
 	#print p1,p2
@@ -115,9 +115,12 @@ def perform(level, box, options):
     Forester.MAXTRIES = 5000
     Forester.VERBOSE = True
 
-    # create the dummy map object
-    mcmap = mcInterface.MCLevelAdapter(level, box)
+    # create the dummy map object. the cursor keeps the current chunk between
+    # block calls and marks the changed chunks once at the end.
+    cursor = level.cursor()
+    mcmap = mcInterface.MCLevelAdapter(cursor, box)
     # call forester's main function on the map object.
     Forester.main(mcmap)
+    cursor.flush()
 
     level.markDirtyBox(box)
@@ -19,7 +19,7 @@ def perform(level, box, options):
         waterTable[waterIDs] = True
 
         coords = []
-        for chunk, slices, point in level.getChunkSlices(box):
+        for chunk, slices, point in level.getChunkSlices(box, readahead=True):
             water = waterTable[chunk.Blocks[slices]]
             chunk.Data[slices][water] = 0  # source block
 
@@ -152,21 +152,4 @@ biomes = {
 def perform(level, box, options):
     biome = dict([(trn._(a), b) for a, b in biomes.items()])[options["Biome"]]
 
-    minx = int(box.minx / 16) * 16
-    minz = int(box.minz / 16) * 16
-
-    for x in xrange(minx, box.maxx, 16):
-        for z in xrange(minz, box.maxz, 16):
-            chunk = level.getChunk(x / 16, z / 16)
-            chunk.dirty = True
-            array = chunk.root_tag["Level"]["Biomes"].value
-
-            chunkx = int(x / 16) * 16
-            chunkz = int(z / 16) * 16
-
-            for bx in xrange(max(box.minx, chunkx), min(box.maxx, chunkx + 16)):
-                for bz in xrange(max(box.minz, chunkz), min(box.maxz, chunkz + 16)):
-                    idx = 16 * (bz - chunkz) + (bx - chunkx)
-                    array[idx] = biome
-
-            chunk.root_tag["Level"]["Biomes"].value = array
+    level.setBiomes(box, biome)
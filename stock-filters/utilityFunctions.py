@@ -3,6 +3,7 @@ from math import sqrt, tan, sin, cos, pi, ceil, floor, acos, atan, asin, degrees
 from random import *
 from numpy import *
 from pymclevel import alphaMaterials, MCSchematic, MCLevel, BoundingBox
+from pymclevel import column_query
 from mcplatform import *
 
 # These are a few helpful functions we hope you find useful to use
@@ -15,8 +16,7 @@ from mcplatform import *
 # (block, data) : a tuple with block = the block id and data being a subtype
 # x,y,z : the coordinate to set
 def setBlock(level, (block, data), x, y, z):
-	level.setBlockAt((int)(x),(int)(y),(int)(z), block)
-    	level.setBlockDataAt((int)(x),(int)(y),(int)(z), data)
+	level.setBlockAndDataAt((int)(x),(int)(y),(int)(z), block, data)
 
 # sets the block to the given blocktype at the designated x y z coordinate IF the block is empty (air)
 # *params*
@@ -57,23 +57,12 @@ def treeMap(level, box):
 	h = abs(box.maxx - box.minx)
 	treeMap = zeros((w,h))
 
-	countx = box.minx
-	countz = box.minz
-	# iterate over the x dimenison of the mapping
-	for x in range(h):
-		# iterate over the z dimension of the mapping
-		countz = box.minz
-		for z in range(w):
-			# drillDown at this location and get all the blocks in the y-column
-			column = drillDown(level, countx, countz, box.miny, box.maxy)
-			for block in column:
-				# check if any block in this column is a wooden trunk block. If so, there is at this x-z coordinate
-				if block == 17:
-					treeMap[z][x] = 17
-			print treeMap[z][x] ,
-			countz += 1
-		print ''
-		countx += 1
+	# check every column for a wooden trunk block at once, a chunk at a time. like drillDown,
+	# this looks at the blocks above box.miny up to and including box.maxy
+	columns = BoundingBox((box.minx, box.miny + 1, box.minz), (h, box.maxy - box.miny, w))
+	trunks = column_query.columnContains(level, columns, 17)
+	# the column query is indexed [x][z], the tree map [z][x]
+	treeMap[trunks.T] = 17
 	return treeMap
 
 